@@ -0,0 +1,406 @@
+"""
+Query building for the JSON API, shared by the Flask routes (app.py) and the async
+app (asgi.py).
+
+Everything here is driver-independent: argument parsing works on a werkzeug
+MultiDict, and each query is returned as keyword arguments for ``Collection.find``,
+so the same spec runs on pymongo's MongoClient and AsyncMongoClient alike.
+"""
+
+import base64
+import hashlib
+import json
+import re
+from datetime import date, datetime, timedelta
+
+from bson import Decimal128, Timestamp, json_util
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+ITEM_TEXT_FIELDS = ['brand', 'manufacturer', 'size', 'quantity', 'units', 'servings_per',
+                    'nutritional_info', 'ingredients', 'other_info', 'upc']
+# Stored as BSON dates so range queries can use the (user_id, expiration_date) index
+ITEM_DATE_FIELDS = ['date_purchased', 'manufactured_date', 'expiration_date']
+
+EXPIRING_MAX_DAYS = 3650
+EXPIRING_MAX_LIMIT = 500
+EXPIRING_PROJECTION = {'name': 1, 'brand': 1, 'quantity': 1, 'location_id': 1, 'expiration_date': 1, 'box': 1}
+
+SEARCH_MAX_PER_PAGE = 100
+UPC_PATTERN = re.compile(r'^\d{6,14}$')
+SEARCH_PROJECTION = {'name': 1, 'brand': 1, 'manufacturer': 1, 'quantity': 1, 'location_id': 1,
+                     'expiration_date': 1, 'box': 1, 'upc': 1}
+
+API_MAX_LIMIT = 1000
+API_ITEM_FIELDS = ['name', 'location_id', 'box'] + ITEM_TEXT_FIELDS + ITEM_DATE_FIELDS + ['change_seq', 'updated_at']
+API_LOCATION_FIELDS = ['name', 'description', 'change_seq', 'updated_at']
+API_ITEM_SORTS = ['_id', 'name', 'expiration_date', 'box']
+API_LOCATION_SORTS = ['_id', 'name']
+
+# BSON $type aliases in MongoDB's cross-type sort order, after null. $gt/$lt only
+# compare values of the same bracket, so a mixed-type field (e.g. an expiration_date
+# left as unparseable text by migration 0002) needs $type clauses to page past it.
+TYPE_BRACKETS = [['int', 'long', 'double', 'decimal'], ['string', 'symbol'], ['object'], ['array'], ['binData'],
+                 ['objectId'], ['bool'], ['date'], ['timestamp'], ['regex']]
+
+
+class ApiArgumentError(ValueError):
+    pass
+
+
+def parse_date(value):
+    """Parse a 'YYYY-MM-DD' form value into a datetime (None when blank or invalid)."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def parse_box(value):
+    """Convert a submitted box number to an integer (None when blank)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return int(value) if value else None
+
+
+def format_date(value, default=''):
+    """Render a stored date as YYYY-MM-DD; legacy string values are shown as-is."""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return value or default
+
+
+def json_doc(doc):
+    """Make a MongoDB document JSON-serializable: ObjectIds become strings, dates ISO 8601."""
+    out = {}
+    for key, value in doc.items():
+        if key == '_id':
+            key = 'id'
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        out[key] = value
+    return out
+
+
+def list_etag(user_id, version, user_name, full_path):
+    """ETag of a per-user list response; it changes whenever the user's data does (see changes.current_version)."""
+    return hashlib.sha1(repr((user_id, version, user_name, full_path)).encode()).hexdigest()
+
+
+# Expiring items
+
+def expiring_args(args):
+    days = min(max(args.get('days', 30, type=int), 0), EXPIRING_MAX_DAYS)
+    limit = min(max(args.get('limit', 100, type=int), 1), EXPIRING_MAX_LIMIT)
+    include_expired = args.get('include_expired', '').lower() in ('1', 'true', 'yes', 'on')
+    return days, limit, include_expired
+
+
+def expiring_find(user_id, days=30, limit=100, include_expired=False):
+    """Items expiring within ``days`` (and optionally already expired), soonest first.
+
+    A single range query on the (user_id, expiration_date) index.
+    """
+    today = datetime.combine(date.today(), datetime.min.time())
+    date_range = {'$lt': today + timedelta(days=days + 1)}
+    if not include_expired:
+        date_range['$gte'] = today
+    return {
+        'filter': {'user_id': user_id, 'expiration_date': date_range},
+        'projection': EXPIRING_PROJECTION,
+        'sort': [('expiration_date', ASCENDING), ('_id', ASCENDING)],
+        'limit': limit,
+    }
+
+
+def expiring_item_json(item, locations):
+    return {
+        'id': str(item['_id']),
+        'name': item.get('name', ''),
+        'brand': item.get('brand', ''),
+        'quantity': item.get('quantity', ''),
+        'location_id': item.get('location_id'),
+        'location': locations.get(item.get('location_id', ''), 'Unknown'),
+        'expiration_date': format_date(item.get('expiration_date')),
+        'box': item.get('box'),
+    }
+
+
+# Search
+
+def search_args(args):
+    q = args.get('q', '').strip()
+    if not q:
+        raise ApiArgumentError('Missing search query (q).')
+    page = max(args.get('page', 1, type=int), 1)
+    per_page = min(max(args.get('per_page', 25, type=int), 1), SEARCH_MAX_PER_PAGE)
+    return q, page, per_page
+
+
+def search_find(user_id, q, page=1, per_page=25):
+    """
+    Search a user's items. Returns (mode, find kwargs).
+
+    A query that looks like a UPC is an exact match on the (user_id, upc) index;
+    anything else goes through the weighted text index, ranked by text score.
+    The ``filter`` entry doubles as the count_documents query for the total.
+    """
+    projection = dict(SEARCH_PROJECTION)
+    if UPC_PATTERN.match(q):
+        mode = 'upc'
+        query = {'user_id': user_id, 'upc': q}
+        sort = [('_id', ASCENDING)]
+    else:
+        mode = 'text'
+        query = {'user_id': user_id, '$text': {'$search': q}}
+        projection['score'] = {'$meta': 'textScore'}
+        sort = [('score', {'$meta': 'textScore'}), ('_id', ASCENDING)]
+    return mode, {'filter': query, 'projection': projection, 'sort': sort,
+                  'skip': (page - 1) * per_page, 'limit': per_page}
+
+
+def search_result_json(q, mode, page, per_page, total, items, locations):
+    return {
+        'query': q,
+        'mode': mode,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'items': [{
+            'id': str(item['_id']),
+            'name': item.get('name', ''),
+            'brand': item.get('brand', ''),
+            'manufacturer': item.get('manufacturer', ''),
+            'quantity': item.get('quantity', ''),
+            'location_id': item.get('location_id'),
+            'location': locations.get(item.get('location_id', ''), 'Unknown'),
+            'expiration_date': format_date(item.get('expiration_date')),
+            'box': item.get('box'),
+            'upc': item.get('upc', ''),
+            'score': item.get('score'),
+        } for item in items],
+    }
+
+
+# Items DataTable (/items/data)
+
+# Columns of the items DataTable, in display order. The index is what DataTables
+# sends back in order[i][column]; the value is the field we sort on in MongoDB
+# (None for columns that don't sort: the selection checkboxes, and the location,
+# which is stored as an id and would sort by id rather than by name).
+ITEM_TABLE_COLUMNS = [None, 'name', 'brand', 'quantity', None, 'expiration_date', 'box']
+ITEM_TABLE_PROJECTION = {'name': 1, 'brand': 1, 'manufacturer': 1, 'quantity': 1,
+                         'location_id': 1, 'expiration_date': 1, 'box': 1}
+ITEM_TABLE_SEARCH_FIELDS = ['name', 'brand', 'manufacturer', 'upc']
+ITEM_TABLE_MAX_LENGTH = 100
+BOX_SEARCH_PATTERN = re.compile(r'[0-9]{1,18}')
+
+
+def datatables_sort(args, columns):
+    """Translate DataTables order[i][column]/order[i][dir] params into a Mongo sort spec."""
+    sort = []
+    i = 0
+    while f'order[{i}][column]' in args:
+        column = args.get(f'order[{i}][column]', type=int)
+        if column is not None and 0 <= column < len(columns) and columns[column]:
+            direction = DESCENDING if args.get(f'order[{i}][dir]') == 'desc' else ASCENDING
+            sort.append((columns[column], direction))
+        i += 1
+    if not sort:
+        sort.append((next(column for column in columns if column), ASCENDING))
+    # _id as a tie-breaker keeps skip/limit pages stable when sort keys repeat
+    sort.append(('_id', ASCENDING))
+    return sort
+
+
+def items_table_args(args):
+    """Parse the DataTables request. Returns (draw, start, length, search)."""
+    draw = args.get('draw', 0, type=int)
+    start = max(args.get('start', 0, type=int), 0)
+    length = args.get('length', 25, type=int)
+    if length <= 0 or length > ITEM_TABLE_MAX_LENGTH:
+        length = ITEM_TABLE_MAX_LENGTH
+    return draw, start, length, args.get('search[value]', '').strip()
+
+
+def items_table_find(user_id, args, start, length, search, locations):
+    """
+    One page of the items table as find kwargs; ``locations`` is the user's {id: name} map.
+
+    With a search the ``filter`` entry is also the count_documents query for recordsFiltered.
+    """
+    query = {'user_id': user_id}
+    if search:
+        # Case-insensitive substring match, scoped to the user's items by the user_id index
+        pattern = {'$regex': re.escape(search), '$options': 'i'}
+        clauses = [{field: pattern} for field in ITEM_TABLE_SEARCH_FIELDS]
+        needle = search.lower()
+        location_ids = [loc_id for loc_id, name in locations.items() if needle in name.lower()]
+        if location_ids:
+            clauses.append({'location_id': {'$in': location_ids}})
+        # ASCII digits only ('²'.isdigit() is True but int() rejects it), and few enough for a BSON int64
+        if BOX_SEARCH_PATTERN.fullmatch(search):
+            clauses.append({'box': int(search)})
+        query = {'user_id': user_id, '$or': clauses}
+    return {'filter': query, 'projection': ITEM_TABLE_PROJECTION,
+            'sort': datatables_sort(args, ITEM_TABLE_COLUMNS), 'skip': start, 'limit': length}
+
+
+def items_table_row(item, locations, url_for):
+    """One table row; ``url_for(endpoint, **values)`` builds the row's links."""
+    item_id = str(item['_id'])
+    return {
+        'DT_RowId': item_id,
+        'name': item.get('name', ''),
+        'brand': item.get('brand', '') or item.get('manufacturer', ''),
+        'quantity': item.get('quantity', ''),
+        'location': locations.get(item.get('location_id', ''), 'Unknown'),
+        'expiration_date': format_date(item.get('expiration_date')),
+        'box': item.get('box') if item.get('box') is not None else '',
+        'view_url': url_for('view_item', item_id=item_id),
+        'edit_url': url_for('edit_item', item_id=item_id),
+        'delete_url': url_for('delete_item', item_id=item_id),
+    }
+
+
+# Keyset-paginated lists
+
+def encode_cursor(sort_value, doc_id):
+    return base64.urlsafe_b64encode(json_util.dumps([sort_value, doc_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        sort_value, doc_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ApiArgumentError('Invalid cursor.')
+    if not isinstance(doc_id, ObjectId):
+        raise ApiArgumentError('Invalid cursor.')
+    return sort_value, doc_id
+
+
+def type_bracket(value):
+    """Index of ``value``'s BSON type in TYPE_BRACKETS."""
+    if isinstance(value, bool):
+        return 6
+    if isinstance(value, (int, float, Decimal128)):
+        return 0
+    if isinstance(value, str):
+        return 1
+    if isinstance(value, dict):
+        return 2
+    if isinstance(value, list):
+        return 3
+    if isinstance(value, bytes):
+        return 4
+    if isinstance(value, ObjectId):
+        return 5
+    if isinstance(value, datetime):
+        return 7
+    if isinstance(value, Timestamp):
+        return 8
+    return 9
+
+
+def keyset_filter(sort_field, descending, sort_value, doc_id):
+    """Match the documents after (sort_value, doc_id) in (sort_field, _id) order, across BSON types; nulls sort first."""
+    op = '$lt' if descending else '$gt'
+    if sort_field == '_id':
+        return {'_id': {op: doc_id}}
+    if sort_value is None:
+        after_nulls = [] if descending else [{sort_field: {'$ne': None}}]
+        return {'$or': [{sort_field: None, '_id': {op: doc_id}}] + after_nulls}
+    # Same value, then same type, then the types on the far side of it
+    clauses = [{sort_field: {op: sort_value}}, {sort_field: sort_value, '_id': {op: doc_id}}]
+    bracket = type_bracket(sort_value)
+    beyond = TYPE_BRACKETS[:bracket] if descending else TYPE_BRACKETS[bracket + 1:]
+    if beyond:
+        clauses.append({sort_field: {'$type': [alias for aliases in beyond for alias in aliases]}})
+    if descending:
+        clauses.append({sort_field: None})
+    return {'$or': clauses}
+
+
+class Page:
+    """One keyset page: its find() arguments, and the pieces of its JSON body."""
+
+    def __init__(self, query, args, allowed_fields, allowed_sorts):
+        self.limit = min(max(args.get('limit', 100, type=int), 1), API_MAX_LIMIT)
+        sort = args.get('sort', '_id')
+        descending = sort.startswith('-')
+        self.sort_field = sort.lstrip('-')
+        if self.sort_field not in allowed_sorts:
+            raise ApiArgumentError(f'sort must be one of: {", ".join(allowed_sorts)} (prefix with - for descending).')
+        self.fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()] or allowed_fields
+        unknown = [f for f in self.fields if f not in allowed_fields]
+        if unknown:
+            raise ApiArgumentError(f'Unknown fields: {", ".join(unknown)}')
+        if args.get('after'):
+            query = {'$and': [query, keyset_filter(self.sort_field, descending, *decode_cursor(args['after']))]}
+        direction = DESCENDING if descending else ASCENDING
+        order = [(self.sort_field, direction)]
+        if self.sort_field != '_id':
+            order.append(('_id', direction))
+        # One extra document tells us whether there is another page
+        self.find = {
+            'filter': query,
+            'projection': dict.fromkeys(self.fields + [self.sort_field], 1),
+            'sort': order,
+            'limit': self.limit + 1,
+            'batch_size': min(self.limit + 1, 500),
+        }
+
+    head = '{"data": ['
+
+    def row(self, count, doc):
+        out = json_doc({key: value for key, value in doc.items() if key == '_id' or key in self.fields})
+        return (',' if count else '') + json.dumps(out)
+
+    def tail(self, last, has_more):
+        next_cursor = encode_cursor(last.get(self.sort_field), last['_id']) if has_more else None
+        return f'], "next": {json.dumps(next_cursor)}, "has_more": {json.dumps(has_more)}}}'
+
+
+def items_page(user_id, args):
+    """
+    Page of the user's items.
+
+    Query parameters: limit, sort (_id, name, expiration_date, box; - prefix for descending),
+    after (the previous page's next cursor), fields (comma-separated projection), and
+    the filters location_id, box, expires_after and expires_before (YYYY-MM-DD).
+    """
+    query = {'user_id': user_id}
+    if args.get('location_id'):
+        query['location_id'] = args['location_id']
+    if args.get('box'):
+        try:
+            query['box'] = parse_box(args['box'])
+        except ValueError:
+            raise ApiArgumentError('box must be an integer.')
+    expiration = {}
+    for param, op in (('expires_after', '$gte'), ('expires_before', '$lt')):
+        if args.get(param):
+            expiration[op] = parse_date(args[param])
+            if expiration[op] is None:
+                raise ApiArgumentError(f'{param} must be a YYYY-MM-DD date.')
+    if expiration:
+        query['expiration_date'] = expiration
+    return Page(query, args, API_ITEM_FIELDS, API_ITEM_SORTS)
+
+
+def locations_page(user_id, args):
+    """Page of the user's locations (limit, sort: _id or name, after, fields)."""
+    return Page({'user_id': user_id}, args, API_LOCATION_FIELDS, API_LOCATION_SORTS)
+
+
+def document_filter(user_id, doc_id):
+    """Filter for one of the user's documents by its id string, or None if the id is malformed."""
+    if not ObjectId.is_valid(doc_id):
+        return None
+    return {'_id': ObjectId(doc_id), 'user_id': user_id}
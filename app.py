@@ -1,18 +1,95 @@
-from flask import Flask, render_template, redirect, url_for, request, session, flash, g
+from flask import Flask, render_template, redirect, url_for, request, session, flash, g, jsonify, Response, stream_with_context, abort
 from flask_pymongo import PyMongo
+import pymongo
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import PyMongoError, BulkWriteError
 from authlib.integrations.flask_client import OAuth
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from functools import wraps
+import hashlib
 import os
-import pandas as pd
-from datetime import datetime
+import tempfile
+import time
+import click
+from datetime import date
 from werkzeug.utils import secure_filename
+from import_jobs import ImportJobRunner
+from csv_export import export_rows, csv_blocks, jsonl_blocks, gzip_blocks
+from location_cache import LocationCache
+from response_cache import ResponseCache
+import metrics
+from metrics import MongoCommandMetrics
+from debug_toolbar import DebugToolbar
+from sessions import init_sessions, rotate_session_id
+from indexes import ensure_indexes, check_query_plans
+from changes import stamped, current_version, record_deletes, changes_since, InvalidSyncToken
+from api_queries import (ITEM_TEXT_FIELDS, ITEM_DATE_FIELDS, ApiArgumentError, parse_date, parse_box, format_date,
+                         json_doc, list_etag, expiring_args, expiring_find, expiring_item_json, search_args,
+                         search_find, search_result_json, items_page, locations_page, document_filter,
+                         items_table_args, items_table_find, items_table_row)
+from inventory_summary import SUMMARY_FIELDS, apply_item_delta, rebuild_summary, get_summary, summary_rows
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'devkey')
 app.config['MONGO_URI'] = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/home_storage')
 app.config['USE_AUTH'] = os.environ.get('USE_AUTH', 'true').lower() == 'true'
-mongo = PyMongo(app)
+app.config['IMPORT_WORKERS'] = int(os.environ.get('IMPORT_WORKERS', '2'))
+app.config['IMPORT_SPOOL_DIR'] = os.environ.get('IMPORT_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'storage_imports'))
+app.config['IMPORT_ENGINE'] = os.environ.get('IMPORT_ENGINE', 'csv')
+app.config['LOCATION_CACHE_SIZE'] = int(os.environ.get('LOCATION_CACHE_SIZE', '1024'))
+app.config['LOCATION_CACHE_TTL'] = int(os.environ.get('LOCATION_CACHE_TTL', '300'))
+app.config['ENSURE_INDEXES'] = os.environ.get('ENSURE_INDEXES', 'true').lower() == 'true'
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['DEBUG_TOOLBAR'] = os.environ.get('DEBUG_TOOLBAR', 'false').lower() == 'true'
+app.config['HEALTH_CHECK_TIMEOUT'] = float(os.environ.get('HEALTH_CHECK_TIMEOUT', '2'))
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'cookie')
+app.config['SESSION_CACHE_SIZE'] = int(os.environ.get('SESSION_CACHE_SIZE', '1024'))
+app.config['SESSION_CACHE_TTL'] = int(os.environ.get('SESSION_CACHE_TTL', '60'))
+
+# MongoClient options -> environment variable; unset ones keep pymongo's defaults
+MONGO_CLIENT_ENV = {
+    'maxPoolSize': 'MONGO_MAX_POOL_SIZE',
+    'minPoolSize': 'MONGO_MIN_POOL_SIZE',
+    'maxIdleTimeMS': 'MONGO_MAX_IDLE_TIME_MS',
+    'connectTimeoutMS': 'MONGO_CONNECT_TIMEOUT_MS',
+    'socketTimeoutMS': 'MONGO_SOCKET_TIMEOUT_MS',
+    'serverSelectionTimeoutMS': 'MONGO_SERVER_SELECTION_TIMEOUT_MS',
+    'waitQueueTimeoutMS': 'MONGO_WAIT_QUEUE_TIMEOUT_MS',
+}
+app.config['MONGO_CLIENT_OPTIONS'] = {option: int(os.environ[var]) for option, var in MONGO_CLIENT_ENV.items()
+                                      if os.environ.get(var)}
+
+mongo_metrics = MongoCommandMetrics()
+debug_toolbar = DebugToolbar()
+mongo = PyMongo(app, event_listeners=[mongo_metrics, debug_toolbar.listener], **app.config['MONGO_CLIENT_OPTIONS'])
+debug_toolbar.init_app(app)
+init_sessions(app, lambda: mongo.db)
+
+def init_mongo():
+    """
+    Give this process its own MongoClient.
+
+    A client must not be shared across fork(), so gunicorn.conf.py calls this in
+    every worker after it is forked from the preloaded app. The parent's copy is
+    dropped rather than closed, since its sockets belong to the parent.
+    """
+    mongo.init_app(app, event_listeners=[mongo_metrics, debug_toolbar.listener], **app.config['MONGO_CLIENT_OPTIONS'])
+
+location_cache = LocationCache(app.config['LOCATION_CACHE_SIZE'], app.config['LOCATION_CACHE_TTL'])
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
+
+def on_import_progress(user_id, stats):
+    if stats['locations_created']:
+        location_cache.invalidate(user_id)
+
+def on_import_finish(user_id, status, rows, seconds):
+    metrics.observe_import(status, rows, seconds)
+
+import_runner = ImportJobRunner(lambda: mongo.db, app.config['IMPORT_SPOOL_DIR'], app.config['IMPORT_WORKERS'],
+                                on_progress=on_import_progress, on_finish=on_import_finish,
+                                engine=app.config['IMPORT_ENGINE'])
 
 oauth = OAuth(app)
 google = oauth.register(
@@ -23,16 +100,22 @@ google = oauth.register(
     client_kwargs={'scope': 'openid email profile'},
 )
 
+DEMO_USER = {'name': 'Demo User', 'email': 'demo@example.com'}
+# Userinfo claims kept in the session; the rest of Google's payload is dropped
+SESSION_USER_FIELDS = ('sub', 'email', 'name')
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not app.config.get('USE_AUTH', True):
             # If auth is disabled, simulate a logged-in user
             if 'user' not in session:
-                session['user'] = {'name': 'Demo User', 'email': 'demo@example.com'}
+                session['user'] = dict(DEMO_USER)
             return f(*args, **kwargs)
         # If auth is enabled, do NOT set demo user
         if 'user' not in session:
+            if request.path.startswith('/api/'):
+                return jsonify({'error': 'Authentication required.'}), 401
             flash('Please log in to access this page.', 'warning')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -45,38 +128,209 @@ def get_user_id():
     # Use sub (Google ID) if available, else email
     return user.get('sub') or user.get('email')
 
+def conditional_list(f):
+    """
+    ETag a per-user list view on the user's committed version and answer If-None-Match with 304.
+
+    The version moves after every finished write (changes.py), so the ETag changes
+    whenever the user's data does, and a body rendered mid-write is never served
+    once the write is done. Unchanged bodies are also served from response_cache without
+    running the view. Requests with pending flash messages always render, so the
+    messages are shown and consumed.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('_flashes'):
+            return f(*args, **kwargs)
+        version = g.data_version
+        key = (g.user_id, version, session.get('user', {}).get('name'), request.full_path)
+        etag = list_etag(*key)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            cached = response_cache.get(key)
+            if cached:
+                body, status, mimetype = cached
+                response = Response(body, status=status, mimetype=mimetype)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if not response.is_streamed:
+                    response_cache.put(key, response.get_data(), response.status_code, response.mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+    return decorated_function
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # For streamed responses this is the time to the first byte
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint; requires 'Authorization: Bearer <METRICS_TOKEN>' when METRICS_TOKEN is set."""
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+HEALTH_ENDPOINTS = {'healthz', 'readyz'}
+
+def ping_database():
+    """Ping MongoDB within HEALTH_CHECK_TIMEOUT seconds. Returns a dict for the health endpoints."""
+    started = time.perf_counter()
+    try:
+        with pymongo.timeout(app.config['HEALTH_CHECK_TIMEOUT']):
+            mongo.cx.admin.command('ping')
+    except PyMongoError as e:
+        app.logger.warning('Database ping failed: %s', e)
+        # The endpoints are unauthenticated, so no topology details in the response
+        return {'ok': False, 'error': type(e).__name__}
+    return {'ok': True, 'ms': round((time.perf_counter() - started) * 1000, 2)}
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: 200 while the worker answers, even if the database doesn't (restarting wouldn't help)."""
+    return jsonify({'status': 'ok', 'pid': os.getpid(), 'database': ping_database()})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 when the database answers a ping, 503 otherwise, so no traffic is routed here."""
+    database = ping_database()
+    return jsonify({'status': 'ready' if database['ok'] else 'unavailable', 'database': database}), \
+        200 if database['ok'] else 503
+
+_indexes_attempted = False
+
+def bootstrap_indexes():
+    """
+    Create the registered indexes at startup (gunicorn's when_ready, or python app.py).
+
+    Runs at most once per process and never on the request path. If MongoDB can't be
+    reached it logs and gives up; `flask ensure-indexes` creates them later.
+    """
+    global _indexes_attempted
+    if _indexes_attempted or not app.config.get('ENSURE_INDEXES', True):
+        return
+    _indexes_attempted = True
+    try:
+        ensure_indexes(mongo.db)
+    except PyMongoError as e:
+        app.logger.warning('Could not create indexes: %s', e)
+
+def bootstrap_import_jobs():
+    """Fail the import jobs a killed or restarted process left queued or running (see import_jobs)."""
+    try:
+        failed = import_runner.fail_stale()
+    except PyMongoError as e:
+        app.logger.warning('Could not check import jobs: %s', e)
+        return
+    if failed:
+        app.logger.warning('Marked %d interrupted import job(s) as failed', failed)
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Create every index in the index registry."""
+    for collection, names in ensure_indexes(mongo.db).items():
+        click.echo(f'{collection}: {", ".join(names)}')
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Explain each of the app's query shapes and fail on any COLLSCAN."""
+    failed = 0
+    for name, stages, ok in check_query_plans(mongo.db):
+        click.echo(f'{"ok  " if ok else "FAIL"}  {name}: {" > ".join(stages)}')
+        failed += not ok
+    if failed:
+        raise SystemExit(f'{failed} query shape(s) use a collection scan.')
+
+@app.cli.command('rebuild-summaries')
+def rebuild_summaries_command():
+    """Recompute every user's inventory summary (e.g. after a migration)."""
+    user_ids = mongo.db.storage_items.distinct('user_id')
+    for user_id in user_ids:
+        rebuild_summary(mongo.db, user_id)
+    click.echo(f'Rebuilt {len(user_ids)} summaries.')
+
+# Endpoints that never read or write per-user data
+USER_SYNC_EXEMPT_ENDPOINTS = {'static', 'login', 'authorized', 'logout', 'metrics'} | HEALTH_ENDPOINTS
+
+def user_fingerprint(user_id, email, name):
+    return hashlib.sha1(f'{user_id}\0{email}\0{name}'.encode()).hexdigest()
+
+def sync_user(user):
+    """Upsert the users document, but only when the session's email or name changed."""
+    user_id = get_user_id()
+    email = user.get('email')
+    name = user.get('name', email)
+    fingerprint = user_fingerprint(user_id, email, name)
+    if session.get('user_sync') == fingerprint:
+        return user_id
+    mongo.db.users.update_one(
+        {'_id': user_id},
+        {'$set': {'email': email, 'name': name}},
+        upsert=True
+    )
+    session['user_sync'] = fingerprint
+    return user_id
+
 @app.before_request
 def ensure_user_in_db():
+    if request.endpoint is None or request.endpoint in USER_SYNC_EXEMPT_ENDPOINTS:
+        return
     if app.config.get('USE_AUTH', True):
         user = session.get('user')
         if user:
-            user_id = get_user_id()
-            g.user_id = user_id
-            # Upsert user in users collection
-            mongo.db.users.update_one(
-                {'_id': user_id},
-                {'$set': {'email': user.get('email'), 'name': user.get('name', user.get('email'))}},
-                upsert=True
-            )
+            g.user_id = sync_user(user)
         else:
             g.user_id = None
     else:
         g.user_id = 'demo-user'
 
+@app.before_request
+def observe_data_version():
+    """
+    Read the user's committed data version once per request.
+
+    Passing it to location_cache drops a cached location list another worker's write
+    made stale, so every reader of the cache sees that worker's locations.
+    """
+    if g.get('user_id') is None:
+        return
+    g.data_version = current_version(mongo.db, g.user_id)
+    location_cache.observe(g.user_id, g.data_version)
+
 @app.route('/')
 def index():
     user = session.get('user')
     # Only set demo user if USE_AUTH is false
     if not user and not app.config.get('USE_AUTH', True):
-        user = {'name': 'Demo User', 'email': 'demo@example.com'}
-    return render_template('index.html', user=user)
+        user = DEMO_USER
+    if not user:
+        return render_template('index.html', user=user)
+    summary = get_summary(mongo.db, g.user_id)
+    return render_template('index.html', user=user, summary=summary,
+                           this_month=date.today().strftime('%Y-%m'),
+                           **summary_rows(summary, location_cache.names(mongo.db, g.user_id)))
 
 # Google SSO routes
 @app.route('/login')
 def login():
     if not app.config.get('USE_AUTH', True):
         # If auth is disabled, skip login and set demo user
-        session['user'] = {'name': 'Demo User', 'email': 'demo@example.com'}
+        session['user'] = dict(DEMO_USER)
         flash('Demo user logged in (authentication disabled).', 'info')
         return redirect(url_for('index'))
     if 'user' in session:
@@ -87,13 +341,14 @@ def login():
 @app.route('/login/authorized')
 def authorized():
     if not app.config.get('USE_AUTH', True):
-        session['user'] = {'name': 'Demo User', 'email': 'demo@example.com'}
+        session['user'] = dict(DEMO_USER)
         flash('Demo user logged in (authentication disabled).', 'info')
         return redirect(url_for('index'))
     token = google.authorize_access_token()
     resp = google.get('https://openidconnect.googleapis.com/v1/userinfo', token=token)
     user_info = resp.json()
-    session['user'] = user_info
+    rotate_session_id(session)
+    session['user'] = {field: user_info[field] for field in SESSION_USER_FIELDS if field in user_info}
     flash('You have been logged in.', 'success')
     return redirect(url_for('index'))
 
@@ -105,8 +360,9 @@ def logout():
 
 @app.route('/locations')
 @login_required
+@conditional_list
 def list_locations():
-    locations = mongo.db.locations.find({'user_id': g.user_id})
+    locations = location_cache.locations(mongo.db, g.user_id)
     return render_template('locations.html', locations=locations)
 
 @app.route('/locations/add', methods=['GET', 'POST'])
@@ -115,7 +371,9 @@ def add_location():
     if request.method == 'POST':
         name = request.form['name']
         description = request.form['description']
-        mongo.db.locations.insert_one({'name': name, 'description': description, 'user_id': g.user_id})
+        with stamped(mongo.db, g.user_id) as stamp:
+            mongo.db.locations.insert_one({'name': name, 'description': description, 'user_id': g.user_id, **stamp})
+        location_cache.invalidate(g.user_id)
         flash('Location added!')
         return redirect(url_for('list_locations'))
     return render_template('location_form.html', action='Add')
@@ -136,56 +394,164 @@ def edit_location(location_id):
     if request.method == 'POST':
         name = request.form['name']
         description = request.form['description']
-        mongo.db.locations.update_one({'_id': ObjectId(location_id), 'user_id': g.user_id}, {'$set': {'name': name, 'description': description}})
+        with stamped(mongo.db, g.user_id) as stamp:
+            mongo.db.locations.update_one({'_id': ObjectId(location_id), 'user_id': g.user_id},
+                                          {'$set': {'name': name, 'description': description, **stamp}})
+        location_cache.invalidate(g.user_id)
         flash('Location updated!')
         return redirect(url_for('list_locations'))
     return render_template('location_form.html', action='Edit', loc=loc)
 
-@app.route('/locations/<location_id>/delete')
+def find_location(location_id):
+    """
+    One of the user's locations, read from MongoDB, or None.
+
+    For checks a write depends on; the per-process location_cache can miss a location
+    another worker just created.
+    """
+    query = document_filter(g.user_id, location_id)
+    return mongo.db.locations.find_one(query) if query else None
+
+# Tombstones written per insert_many when a location's items are deleted with it
+TOMBSTONE_BATCH = 1000
+
+def move_location_items(location_id, target_id, stamp):
+    """Move every item in a location to another with one update_many. Returns the count."""
+    result = mongo.db.storage_items.update_many({'user_id': g.user_id, 'location_id': location_id},
+                                                {'$set': {'location_id': target_id, **stamp}})
+    return result.modified_count
+
+def delete_location_items(location_id, stamp):
+    """
+    Delete every item in a location with one delete_many, leaving tombstones. Returns the count.
+
+    The items are first tagged with the stamp's change_seq, so the tombstones (read
+    from a cursor) and the delete cover exactly the same documents.
+    """
+    items_query = {'user_id': g.user_id, 'location_id': location_id}
+    mongo.db.storage_items.update_many(items_query, {'$set': stamp})
+    tagged = {**items_query, 'change_seq': stamp['change_seq']}
+    ids = []
+    for doc in mongo.db.storage_items.find(tagged, {'_id': 1}):
+        ids.append(doc['_id'])
+        if len(ids) == TOMBSTONE_BATCH:
+            record_deletes(mongo.db, g.user_id, 'items', ids, stamp)
+            ids = []
+    record_deletes(mongo.db, g.user_id, 'items', ids, stamp)
+    return mongo.db.storage_items.delete_many(tagged).deleted_count
+
+@app.route('/locations/<location_id>/delete', methods=['GET', 'POST'])
 @login_required
 def delete_location(location_id):
-    mongo.db.locations.delete_one({'_id': ObjectId(location_id), 'user_id': g.user_id})
-    flash('Location deleted!')
+    """Confirm, then delete a location after moving its items elsewhere or deleting them."""
+    loc = find_location(location_id)
+    if not loc:
+        flash('Location not found.', 'danger')
+        return redirect(url_for('list_locations'))
+    items_query = {'user_id': g.user_id, 'location_id': location_id}
+    others = [other for other in location_cache.locations(mongo.db, g.user_id) if other['_id'] != loc['_id']]
+    if request.method == 'GET':
+        return render_template('location_delete.html', loc=loc, others=others,
+                               item_count=mongo.db.storage_items.count_documents(items_query))
+
+    choice = request.form.get('items')
+    target = None
+    if choice == 'move':
+        target = find_location(request.form.get('target_id', ''))
+        if not target or target['_id'] == loc['_id']:
+            flash('Choose another location to move the items to.', 'danger')
+            return redirect(url_for('delete_location', location_id=location_id))
+    elif choice != 'delete' and mongo.db.storage_items.count_documents(items_query, limit=1):
+        flash('Choose what happens to the items in this location.', 'danger')
+        return redirect(url_for('delete_location', location_id=location_id))
+
+    with stamped(mongo.db, g.user_id) as stamp:
+        # The location goes first, so items the form routes add meanwhile are caught below
+        result = mongo.db.locations.delete_one({'_id': loc['_id'], 'user_id': g.user_id})
+        if result.deleted_count:
+            record_deletes(mongo.db, g.user_id, 'locations', [location_id], stamp)
+        location_cache.invalidate(g.user_id)
+        if target:
+            moved = move_location_items(location_id, str(target['_id']), stamp)
+            message = f'Location deleted; {moved} item(s) moved to {target["name"]}.'
+        elif choice == 'delete':
+            deleted = delete_location_items(location_id, stamp)
+            message = f'Location deleted with its {deleted} item(s).'
+        else:
+            message = 'Location deleted!'
+    if target or choice == 'delete':
+        # Rare, and the moved or deleted items are no longer in hand for a delta
+        rebuild_summary(mongo.db, g.user_id)
+    flash(message)
     return redirect(url_for('list_locations'))
 
 @app.route('/items')
 @login_required
+@conditional_list
 def list_items():
-    items = list(mongo.db.storage_items.find({'user_id': g.user_id}))
-    locations = {str(loc['_id']): loc['name'] for loc in mongo.db.locations.find({'user_id': g.user_id})}
-    for item in items:
-        item['location_name'] = locations.get(item.get('location_id', ''), 'Unknown')
-    return render_template('items.html', items=items)
+    # Rows are fetched page by page from list_items_data
+    return render_template('items.html', locations=location_cache.locations(mongo.db, g.user_id),
+                           bulk_max=BULK_MAX_ITEMS)
+
+@app.route('/items/data')
+@login_required
+def list_items_data():
+    """
+    DataTables server-side processing endpoint for the items table.
+
+    Not a conditional_list: DataTables sends a new ``draw`` (and ``_``) with every
+    request, so no two URLs repeat and an ETag or cached body would never be reused.
+    """
+    draw, start, length, search = items_table_args(request.args)
+    locations = location_cache.names(mongo.db, g.user_id)
+    spec = items_table_find(g.user_id, request.args, start, length, search, locations)
+    rows = [items_table_row(item, locations, url_for) for item in mongo.db.storage_items.find(**spec)]
+
+    records_total = mongo.db.storage_items.count_documents({'user_id': g.user_id})
+    records_filtered = mongo.db.storage_items.count_documents(spec['filter']) if search else records_total
+    return jsonify({
+        'draw': draw,
+        'recordsTotal': records_total,
+        'recordsFiltered': records_filtered,
+        'data': rows,
+    })
+
+def item_data_from_form(form, partial=False):
+    """
+    Build storage_items fields from submitted form data.
+
+    add_item and edit_item take every field; with ``partial`` only the fields present
+    in ``form`` are returned, for updates through the batch API.
+    """
+    data = {}
+    if not partial or 'name' in form:
+        data['name'] = form['name']
+    for field in ITEM_TEXT_FIELDS:
+        if not partial or field in form:
+            data[field] = form.get(field, '')
+    for field in ITEM_DATE_FIELDS:
+        if not partial or field in form:
+            data[field] = parse_date(form.get(field, ''))
+    if not partial or 'box' in form:
+        # Convert box to integer if provided
+        data['box'] = parse_box(form.get('box', ''))
+    if not partial or 'location_id' in form:
+        data['location_id'] = form['location_id']
+    return data
+
+app.add_template_filter(format_date, 'datefmt')
 
 @app.route('/items/add', methods=['GET', 'POST'])
 @login_required
 def add_item():
-    locations = list(mongo.db.locations.find({'user_id': g.user_id}))
+    locations = location_cache.locations(mongo.db, g.user_id)
     if request.method == 'POST':
-        # Convert box to integer if provided
-        box_value = request.form.get('box', '')
-        box = int(box_value) if box_value and box_value.strip() else None
-        
-        data = {
-            'name': request.form['name'],
-            'brand': request.form.get('brand', ''),
-            'manufacturer': request.form.get('manufacturer', ''),
-            'size': request.form.get('size', ''),
-            'quantity': request.form.get('quantity', ''),
-            'units': request.form.get('units', ''),
-            'servings_per': request.form.get('servings_per', ''),
-            'nutritional_info': request.form.get('nutritional_info', ''),
-            'date_purchased': request.form.get('date_purchased', ''),
-            'manufactured_date': request.form.get('manufactured_date', ''),
-            'expiration_date': request.form.get('expiration_date', ''),
-            'ingredients': request.form.get('ingredients', ''),
-            'other_info': request.form.get('other_info', ''),
-            'upc': request.form.get('upc', ''),
-            'box': box,
-            'location_id': request.form['location_id'],
-            'user_id': g.user_id
-        }
-        mongo.db.storage_items.insert_one(data)
+        data = item_data_from_form(request.form)
+        data['user_id'] = g.user_id
+        with stamped(mongo.db, g.user_id) as stamp:
+            data.update(stamp)
+            mongo.db.storage_items.insert_one(data)
+        apply_item_delta(mongo.db, g.user_id, added=[data])
         flash('Item added!')
         return redirect(url_for('list_items'))
     return render_template('item_form.html', action='Add', locations=locations, item=None)
@@ -194,41 +560,23 @@ def add_item():
 @login_required
 def view_item(item_id):
     item = mongo.db.storage_items.find_one({'_id': ObjectId(item_id), 'user_id': g.user_id})
-    location = mongo.db.locations.find_one({'_id': ObjectId(item['location_id']), 'user_id': g.user_id}) if item and 'location_id' in item else None
+    location = location_cache.find(mongo.db, g.user_id, item['location_id']) if item and 'location_id' in item else None
     return render_template('item_view.html', item=item, location=location)
 
 @app.route('/items/<item_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_item(item_id):
     item = mongo.db.storage_items.find_one({'_id': ObjectId(item_id), 'user_id': g.user_id})
-    locations = list(mongo.db.locations.find({'user_id': g.user_id}))
+    locations = location_cache.locations(mongo.db, g.user_id)
     if not item:
         flash('Item not found.', 'danger')
         return redirect(url_for('list_items'))
     if request.method == 'POST':
-        # Convert box to integer if provided
-        box_value = request.form.get('box', '')
-        box = int(box_value) if box_value and box_value.strip() else None
-        
-        data = {
-            'name': request.form['name'],
-            'brand': request.form.get('brand', ''),
-            'manufacturer': request.form.get('manufacturer', ''),
-            'size': request.form.get('size', ''),
-            'quantity': request.form.get('quantity', ''),
-            'units': request.form.get('units', ''),
-            'servings_per': request.form.get('servings_per', ''),
-            'nutritional_info': request.form.get('nutritional_info', ''),
-            'date_purchased': request.form.get('date_purchased', ''),
-            'manufactured_date': request.form.get('manufactured_date', ''),
-            'expiration_date': request.form.get('expiration_date', ''),
-            'ingredients': request.form.get('ingredients', ''),
-            'other_info': request.form.get('other_info', ''),
-            'upc': request.form.get('upc', ''),
-            'box': box,
-            'location_id': request.form['location_id']
-        }
-        mongo.db.storage_items.update_one({'_id': ObjectId(item_id), 'user_id': g.user_id}, {'$set': data})
+        data = item_data_from_form(request.form)
+        with stamped(mongo.db, g.user_id) as stamp:
+            data.update(stamp)
+            mongo.db.storage_items.update_one({'_id': ObjectId(item_id), 'user_id': g.user_id}, {'$set': data})
+        apply_item_delta(mongo.db, g.user_id, removed=[item], added=[{**item, **data}])
         flash('Item updated!')
         return redirect(url_for('list_items'))
     return render_template('item_form.html', action='Edit', locations=locations, item=item)
@@ -236,10 +584,410 @@ def edit_item(item_id):
 @app.route('/items/<item_id>/delete')
 @login_required
 def delete_item(item_id):
-    mongo.db.storage_items.delete_one({'_id': ObjectId(item_id), 'user_id': g.user_id})
+    deleted = mongo.db.storage_items.find_one_and_delete({'_id': ObjectId(item_id), 'user_id': g.user_id},
+                                                         projection=SUMMARY_FIELDS)
+    if deleted:
+        record_deletes(mongo.db, g.user_id, 'items', [item_id])
+        apply_item_delta(mongo.db, g.user_id, removed=[deleted])
     flash('Item deleted!')
     return redirect(url_for('list_items'))
 
+# Most items one bulk action may select
+BULK_MAX_ITEMS = 1000
+
+def bulk_update_items(query, fields, stamp):
+    """
+    $set ``fields`` on the items matching ``query`` with one update_many. Returns the count.
+
+    The matching items are read first (summary fields only) so the summary can be
+    updated with a delta, and the update is limited to exactly those items.
+    """
+    items = list(mongo.db.storage_items.find(query, SUMMARY_FIELDS))
+    if not items:
+        return 0
+    mongo.db.storage_items.update_many({'_id': {'$in': [item['_id'] for item in items]}, 'user_id': g.user_id},
+                                       {'$set': {**fields, **stamp}})
+    apply_item_delta(mongo.db, g.user_id, removed=items, added=[{**item, **fields} for item in items])
+    return len(items)
+
+def bulk_delete_items(query, stamp):
+    """Delete the items matching ``query`` with one delete_many, leaving tombstones. Returns the count."""
+    items = list(mongo.db.storage_items.find(query, SUMMARY_FIELDS))
+    if not items:
+        return 0
+    ids = [item['_id'] for item in items]
+    result = mongo.db.storage_items.delete_many({'_id': {'$in': ids}, 'user_id': g.user_id})
+    record_deletes(mongo.db, g.user_id, 'items', ids, stamp)
+    apply_item_delta(mongo.db, g.user_id, removed=items)
+    return result.deleted_count
+
+@app.route('/items/bulk', methods=['POST'])
+@login_required
+def bulk_items():
+    """Move, re-box or delete the items selected in the items table (item_ids) in one write."""
+    try:
+        ids = [ObjectId(item_id) for item_id in request.form.getlist('item_ids')]
+    except InvalidId:
+        flash('Invalid item selection.', 'danger')
+        return redirect(url_for('list_items'))
+    if not ids:
+        flash('No items selected.', 'warning')
+        return redirect(url_for('list_items'))
+    if len(ids) > BULK_MAX_ITEMS:
+        flash(f'Select at most {BULK_MAX_ITEMS} items at a time.', 'danger')
+        return redirect(url_for('list_items'))
+
+    query = {'_id': {'$in': ids}, 'user_id': g.user_id}
+    action = request.form.get('action')
+    if action == 'move':
+        target = find_location(request.form.get('location_id', ''))
+        if not target:
+            flash('Choose a location to move the items to.', 'danger')
+            return redirect(url_for('list_items'))
+        with stamped(mongo.db, g.user_id) as stamp:
+            count = bulk_update_items(query, {'location_id': str(target['_id'])}, stamp)
+        flash(f'Moved {count} item(s) to {target["name"]}.')
+    elif action == 'rebox':
+        try:
+            box = parse_box(request.form.get('box'))
+        except ValueError:
+            flash('Box must be a whole number.', 'danger')
+            return redirect(url_for('list_items'))
+        with stamped(mongo.db, g.user_id) as stamp:
+            count = bulk_update_items(query, {'box': box}, stamp)
+        flash(f'Moved {count} item(s) to box {box}.' if box is not None else f'Cleared the box of {count} item(s).')
+    elif action == 'delete':
+        with stamped(mongo.db, g.user_id) as stamp:
+            count = bulk_delete_items(query, stamp)
+        flash(f'Deleted {count} item(s).')
+    else:
+        flash('Unknown bulk action.', 'danger')
+    return redirect(url_for('list_items'))
+
+def find_expiring_items(user_id, days=30, limit=100, include_expired=False):
+    return mongo.db.storage_items.find(**expiring_find(user_id, days, limit, include_expired))
+
+@app.route('/items/expiring')
+@login_required
+def expiring_items():
+    days, limit, include_expired = expiring_args(request.args)
+    items = list(find_expiring_items(g.user_id, days, limit, include_expired))
+    locations = location_cache.names(mongo.db, g.user_id)
+    today = date.today()
+    for item in items:
+        item['location_name'] = locations.get(item.get('location_id', ''), 'Unknown')
+        item['days_left'] = (item['expiration_date'].date() - today).days
+    return render_template('items_expiring.html', items=items, days=days, limit=limit,
+                           include_expired=include_expired)
+
+@app.route('/api/items/expiring')
+@login_required
+def api_expiring_items():
+    days, limit, include_expired = expiring_args(request.args)
+    locations = location_cache.names(mongo.db, g.user_id)
+    items = [expiring_item_json(item, locations)
+             for item in find_expiring_items(g.user_id, days, limit, include_expired)]
+    return jsonify({'days': days, 'include_expired': include_expired, 'items': items})
+
+def search_items(user_id, q, page=1, per_page=25):
+    """Search a user's items (see api_queries.search_find). Returns (mode, total, items)."""
+    mode, spec = search_find(user_id, q, page, per_page)
+    items = list(mongo.db.storage_items.find(**spec))
+    total = mongo.db.storage_items.count_documents(spec['filter'])
+    return mode, total, items
+
+@app.route('/api/items/search')
+@login_required
+def api_search_items():
+    try:
+        q, page, per_page = search_args(request.args)
+    except ApiArgumentError as e:
+        return jsonify({'error': str(e)}), 400
+    mode, total, items = search_items(g.user_id, q, page, per_page)
+    locations = location_cache.names(mongo.db, g.user_id)
+    return jsonify(search_result_json(q, mode, page, per_page, total, items, locations))
+
+CHANGES_MAX_LIMIT = 1000
+
+@app.route('/api/changes')
+@login_required
+def api_changes():
+    """Delta sync: locations, items and deletions changed since the ``since`` token."""
+    limit = min(max(request.args.get('limit', 500, type=int), 1), CHANGES_MAX_LIMIT)
+    try:
+        changes = changes_since(mongo.db, g.user_id, request.args.get('since', ''), limit)
+    except InvalidSyncToken as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'locations': [json_doc(doc) for doc in changes['locations']],
+        'items': [json_doc(doc) for doc in changes['items']],
+        'deleted': [{'kind': doc['kind'], 'id': doc['doc_id'], 'change_seq': doc['change_seq']}
+                    for doc in changes['deleted']],
+        'next': changes['next'],
+        'has_more': changes['has_more'],
+    })
+
+def stream_page(collection, page):
+    """Stream one keyset page as JSON straight from the cursor: {"data": [...], "next": ..., "has_more": ...}."""
+    cursor = collection.find(**page.find)
+
+    def generate():
+        yield page.head
+        last = None
+        has_more = False
+        for count, doc in enumerate(cursor):
+            if count == page.limit:
+                has_more = True
+                break
+            last = doc
+            yield page.row(count, doc)
+        yield page.tail(last, has_more)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/api/items')
+@login_required
+@conditional_list
+def api_items():
+    """List items with keyset pagination (see api_queries.items_page for the parameters)."""
+    try:
+        page = items_page(g.user_id, request.args)
+    except ApiArgumentError as e:
+        return jsonify({'error': str(e)}), 400
+    return stream_page(mongo.db.storage_items, page)
+
+@app.route('/api/locations')
+@login_required
+@conditional_list
+def api_locations():
+    """List locations with keyset pagination (limit, sort: _id or name, after, fields)."""
+    try:
+        page = locations_page(g.user_id, request.args)
+    except ApiArgumentError as e:
+        return jsonify({'error': str(e)}), 400
+    return stream_page(mongo.db.locations, page)
+
+@app.route('/api/items/<item_id>')
+@login_required
+def api_item(item_id):
+    query = document_filter(g.user_id, item_id)
+    item = mongo.db.storage_items.find_one(query) if query else None
+    if not item:
+        return jsonify({'error': 'Item not found.'}), 404
+    return jsonify(json_doc(item))
+
+@app.route('/api/locations/<location_id>')
+@login_required
+def api_location(location_id):
+    query = document_filter(g.user_id, location_id)
+    loc = mongo.db.locations.find_one(query) if query else None
+    if not loc:
+        return jsonify({'error': 'Location not found.'}), 404
+    return jsonify(json_doc(loc))
+
+BATCH_MAX_OPERATIONS = 1000
+BATCH_COLLECTIONS = {'items': 'storage_items', 'locations': 'locations'}
+
+class BatchValidationError(ValueError):
+    pass
+
+def batch_fields(collection, data, partial):
+    """Validate and convert the data of one batch operation with the form routes' field rules."""
+    if not isinstance(data, dict):
+        raise BatchValidationError('data must be an object')
+    form = {}
+    for key, value in data.items():
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise BatchValidationError(f'{key} must be a string or number')
+        form[key] = value if value is None or isinstance(value, str) else str(value)
+
+    required = ['name', 'location_id'] if collection == 'items' else ['name']
+    for field in required:
+        if (not partial or field in form) and not (form.get(field) or '').strip():
+            raise BatchValidationError(f'{field} is required')
+
+    if collection == 'locations':
+        fields = {key: form[key] for key in ('name', 'description') if key in form}
+        if not partial:
+            fields.setdefault('description', '')
+        return fields
+    try:
+        return item_data_from_form(form, partial=partial)
+    except ValueError:
+        raise BatchValidationError('box must be an integer')
+
+def batch_location_delete(data):
+    """Validate what a location delete does with its items: {"items": "move"|"delete", "target_id": "..."}."""
+    if data is None:
+        return {'items': None}
+    if not isinstance(data, dict):
+        raise BatchValidationError('data must be an object')
+    choice = data.get('items')
+    if choice == 'delete':
+        return {'items': 'delete'}
+    if choice != 'move':
+        raise BatchValidationError('data.items must be "move" or "delete"')
+    try:
+        return {'items': 'move', 'target_id': ObjectId(data.get('target_id'))}
+    except (InvalidId, TypeError):
+        raise BatchValidationError('data.target_id must be an ObjectId string')
+
+def write_batch(collection, plan, results, stamp):
+    """
+    Write one collection's planned batch operations, filling in ``results``.
+
+    Creates and updates go in one unordered bulk_write. Deletes are sent one by one, so
+    a delete only counts (tombstone, summary) if it removed the document itself.
+    """
+    coll = mongo.db[BATCH_COLLECTIONS[collection]]
+    projection = SUMMARY_FIELDS if collection == 'items' else {'_id': 1}
+    location_deletes = [(doc_id, fields) for _, op, doc_id, fields in plan
+                        if collection == 'locations' and op == 'delete']
+    deleting = {doc_id for doc_id, _ in location_deletes}
+    targets = [fields['target_id'] for _, fields in location_deletes if fields['items'] == 'move']
+    # One read to tell "not found" apart from success, which bulk_write can't report per
+    # operation; for items it also brings the old summary fields for the summary delta
+    existing = {doc['_id']: doc for doc in coll.find(
+        {'_id': {'$in': [doc_id for _, op, doc_id, _ in plan if op != 'create'] + targets}, 'user_id': g.user_id},
+        projection)}
+    # Locations deleted without saying what happens to their items must be empty
+    occupied = set(mongo.db.storage_items.distinct('location_id', {
+        'user_id': g.user_id,
+        'location_id': {'$in': [str(doc_id) for doc_id, fields in location_deletes if not fields['items']]},
+    })) if location_deletes else set()
+
+    requests, sent, deletes = [], [], []
+    for index, op, doc_id, fields in plan:
+        if op == 'create':
+            requests.append(InsertOne({'_id': doc_id, **fields, 'user_id': g.user_id, **stamp}))
+        elif doc_id not in existing:
+            results[index] = {'index': index, 'status': 'not_found', 'id': str(doc_id)}
+            continue
+        elif fields and op == 'delete' and not fields['items'] and str(doc_id) in occupied:
+            results[index] = {'index': index, 'status': 'invalid', 'id': str(doc_id),
+                              'error': 'location has items; set data.items to "move" or "delete"'}
+            continue
+        elif fields and op == 'delete' and fields['items'] == 'move' and (
+                fields['target_id'] not in existing or fields['target_id'] in deleting):
+            results[index] = {'index': index, 'status': 'invalid', 'id': str(doc_id),
+                              'error': 'data.target_id must be another location that is not being deleted'}
+            continue
+        elif op == 'update':
+            requests.append(UpdateOne({'_id': doc_id, 'user_id': g.user_id}, {'$set': {**fields, **stamp}}))
+        else:
+            deletes.append((index, doc_id, fields))
+            continue
+        sent.append((index, op, doc_id, fields))
+
+    failed = {}
+    if requests:
+        try:
+            coll.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            failed = {err['index']: err.get('errmsg', 'write failed') for err in e.details.get('writeErrors', [])}
+
+    deleted, removed, added = [], [], []
+    cleared = {}  # location id -> what happens to its items
+    for position, (index, op, doc_id, fields) in enumerate(sent):
+        if position in failed:
+            results[index] = {'index': index, 'status': 'error', 'id': str(doc_id), 'error': failed[position]}
+            continue
+        results[index] = {'index': index, 'status': op + 'd', 'id': str(doc_id)}
+        if op == 'update':
+            removed.append(existing[doc_id])
+        added.append({**existing.get(doc_id, {}), **fields})
+    for index, doc_id, fields in deletes:
+        old = coll.find_one_and_delete({'_id': doc_id, 'user_id': g.user_id}, projection)
+        if old is None:  # deleted by someone else since the read
+            results[index] = {'index': index, 'status': 'not_found', 'id': str(doc_id)}
+            continue
+        results[index] = {'index': index, 'status': 'deleted', 'id': str(doc_id)}
+        removed.append(old)
+        deleted.append(doc_id)
+        if collection == 'locations':
+            cleared[doc_id] = fields
+    record_deletes(mongo.db, g.user_id, collection, deleted, stamp)
+    if collection == 'locations':
+        location_cache.invalidate(g.user_id)
+        changed = 0
+        for doc_id, fields in cleared.items():
+            if fields['items'] == 'move':
+                changed += move_location_items(str(doc_id), str(fields['target_id']), stamp)
+            elif fields['items'] == 'delete':
+                changed += delete_location_items(str(doc_id), stamp)
+        if changed:
+            rebuild_summary(mongo.db, g.user_id)
+    else:
+        apply_item_delta(mongo.db, g.user_id, removed=removed, added=added)
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def api_batch():
+    """
+    Apply a list of create/update/delete operations on items and locations.
+
+    Request: {"operations": [{"op": "create"|"update"|"delete", "collection": "items"|"locations",
+                              "id": "...", "data": {...}}, ...]}
+    Each collection's creates and updates are written with one unordered bulk_write.
+    An id may appear only once per batch. The response has one result per operation,
+    in order, with the ids of created documents. A location
+    delete must say what happens to the location's items, as the form does, unless
+    it has none: "data": {"items": "delete"} or {"items": "move", "target_id": "..."}.
+    """
+    payload = request.get_json(silent=True)
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({'error': 'Expected a JSON object with an "operations" list.'}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_OPERATIONS} operations per batch.'}), 400
+
+    results = [None] * len(operations)
+    planned = {name: [] for name in BATCH_COLLECTIONS}  # collection -> [(index, op, ObjectId, fields)]
+    seen = set()
+    for index, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict):
+                raise BatchValidationError('operation must be an object')
+            op = operation.get('op')
+            collection = operation.get('collection')
+            if collection not in BATCH_COLLECTIONS:
+                raise BatchValidationError('collection must be "items" or "locations"')
+            if op == 'create':
+                doc_id = ObjectId()
+                fields = batch_fields(collection, operation.get('data'), partial=False)
+            elif op in ('update', 'delete'):
+                try:
+                    doc_id = ObjectId(operation.get('id'))
+                except (InvalidId, TypeError):
+                    raise BatchValidationError('id must be an ObjectId string')
+                if op == 'update':
+                    fields = batch_fields(collection, operation.get('data'), partial=True)
+                elif collection == 'locations':
+                    fields = batch_location_delete(operation.get('data'))
+                else:
+                    fields = None
+            else:
+                raise BatchValidationError('op must be "create", "update" or "delete"')
+        except BatchValidationError as e:
+            results[index] = {'index': index, 'status': 'invalid', 'error': str(e)}
+            continue
+        # Each document gets one before/after pair, for the summary delta and the tombstones
+        if doc_id in seen:
+            return jsonify({'error': f'Operation {index} repeats id {doc_id}; each id may appear once per batch.'}), 400
+        seen.add(doc_id)
+        planned[collection].append((index, op, doc_id, fields))
+
+    if any(planned.values()):
+        with stamped(mongo.db, g.user_id) as stamp:
+            for collection, plan in planned.items():
+                if plan:
+                    write_batch(collection, plan, results, stamp)
+
+    status_counts = {}
+    for result in results:
+        status_counts[result['status']] = status_counts.get(result['status'], 0) + 1
+    return jsonify({'results': results, 'counts': status_counts})
+
 @app.route('/import_csv', methods=['GET', 'POST'])
 @login_required
 def import_csv():
@@ -259,118 +1007,68 @@ def import_csv():
             return redirect(url_for('import_csv'))
         
         try:
-            # Read CSV file
-            df = pd.read_csv(file)
-            
-            # Expected columns (based on the sample CSV)
-            required_columns = ['ItemName', 'ItemLocation']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                flash(f'Missing required columns: {", ".join(missing_columns)}', 'danger')
-                return redirect(url_for('import_csv'))
-            
-            # Track import statistics
-            locations_created = 0
-            items_imported = 0
-            errors = []
-            
-            # Get or create locations
-            location_map = {}  # Map location names to ObjectIds
-            
-            for index, row in df.iterrows():
-                try:
-                    # Get or create location
-                    location_name = str(row['ItemLocation']).strip()
-                    
-                    if location_name not in location_map:
-                        # Check if location exists for this user
-                        existing_loc = mongo.db.locations.find_one({
-                            'name': location_name,
-                            'user_id': g.user_id
-                        })
-                        
-                        if existing_loc:
-                            location_map[location_name] = existing_loc['_id']
-                        else:
-                            # Create new location
-                            new_loc = mongo.db.locations.insert_one({
-                                'name': location_name,
-                                'description': f'Auto-created from CSV import',
-                                'user_id': g.user_id
-                            })
-                            location_map[location_name] = new_loc.inserted_id
-                            locations_created += 1
-                    
-                    # Parse dates
-                    expiration_date = None
-                    if pd.notna(row.get('ExpirationDate')):
-                        try:
-                            expiration_date = pd.to_datetime(row['ExpirationDate']).strftime('%Y-%m-%d')
-                        except:
-                            pass
-                    
-                    manufactured_date = None
-                    if pd.notna(row.get('Manufactured Date')):
-                        try:
-                            manufactured_date = pd.to_datetime(row['Manufactured Date']).strftime('%Y-%m-%d')
-                        except:
-                            pass
-                    
-                    # Parse box number as integer
-                    box_value = None
-                    if pd.notna(row.get('Box')):
-                        try:
-                            box_str = str(row.get('Box', '')).strip()
-                            box_value = int(float(box_str)) if box_str else None
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    # Create item document
-                    item_data = {
-                        'name': str(row['ItemName']).strip(),
-                        'location_id': str(location_map[location_name]),
-                        'user_id': g.user_id,
-                        'brand': str(row.get('Manufacturer', '')).strip() if pd.notna(row.get('Manufacturer')) else '',
-                        'quantity': str(row.get('Quantity', '')).strip() if pd.notna(row.get('Quantity')) else '',
-                        'servings_per': str(row.get('Servings Per', '')).strip() if pd.notna(row.get('Servings Per')) else '',
-                        'size': str(row.get('Servings Size', '')).strip() if pd.notna(row.get('Servings Size')) else '',
-                        'units': str(row.get('Units', '')).strip() if pd.notna(row.get('Units')) else '',
-                        'expiration_date': expiration_date or '',
-                        'box': box_value,
-                        'manufactured_date': manufactured_date or '',
-                        'upc': str(row.get('UPC', '')).strip() if pd.notna(row.get('UPC')) else '',
-                        'nutritional_info': str(row.get('Servings', '')).strip() if pd.notna(row.get('Servings')) else '',
-                        'other_info': str(row.get('Damaged', '')).strip() if pd.notna(row.get('Damaged')) else '',
-                        'date_purchased': '',  # Not in the CSV
-                        'ingredients': ''  # Not in the CSV
-                    }
-                    
-                    # Insert item
-                    mongo.db.storage_items.insert_one(item_data)
-                    items_imported += 1
-                    
-                except Exception as e:
-                    errors.append(f'Row {index + 2}: {str(e)}')
-            
-            # Display results
-            success_msg = f'Import completed! {items_imported} items imported'
-            if locations_created > 0:
-                success_msg += f', {locations_created} locations created'
-            
-            flash(success_msg, 'success')
-            
-            if errors:
-                flash(f'Errors encountered: {len(errors)} rows failed. First few errors: {"; ".join(errors[:5])}', 'warning')
-            
-            return redirect(url_for('list_items'))
-            
+            job_id = import_runner.submit(g.user_id, file, secure_filename(file.filename),
+                                          upsert=request.form.get('update_existing') == 'on')
         except Exception as e:
             flash(f'Error processing CSV file: {str(e)}', 'danger')
             return redirect(url_for('import_csv'))
+
+        flash('Import started. You can follow its progress below.')
+        return redirect(url_for('import_csv', job=str(job_id)))
     
-    # GET request - show the upload form
-    return render_template('import_csv.html')
+    # GET request - show the upload form, and the progress of a started job
+    return render_template('import_csv.html', job_id=request.args.get('job'))
+
+@app.route('/import_csv/jobs/<job_id>')
+@login_required
+def import_job_status(job_id):
+    job = import_runner.get(g.user_id, job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found.'}), 404
+    return jsonify({
+        'id': str(job['_id']),
+        'filename': job.get('filename'),
+        'status': job['status'],
+        'rows_total': job.get('rows_total', 0),
+        'rows_done': job.get('rows_done', 0),
+        'rows_failed': job.get('rows_failed', 0),
+        'items_imported': job.get('items_imported', 0),
+        'items_updated': job.get('items_updated', 0),
+        'items_unchanged': job.get('items_unchanged', 0),
+        'locations_created': job.get('locations_created', 0),
+        'errors': job.get('errors', []),
+        'error': job.get('error'),
+        'created_at': job['created_at'].isoformat() if job.get('created_at') else None,
+        'finished_at': job['finished_at'].isoformat() if job.get('finished_at') else None,
+    })
+
+EXPORT_FORMATS = {
+    'csv': (csv_blocks, 'text/csv'),
+    'jsonl': (jsonl_blocks, 'application/x-ndjson'),
+}
+
+@app.route('/export/items.<fmt>')
+@login_required
+def export_items(fmt):
+    """Stream all of the user's items as CSV or JSON Lines in the import format, gzipped if the client accepts it."""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    serialize, mimetype = EXPORT_FORMATS[fmt]
+    # One preloaded map for the location-name join, read from MongoDB rather than the
+    # process cache: a missing location would export as '' and fail the re-import
+    names = {str(loc['_id']): loc['name'] for loc in mongo.db.locations.find({'user_id': g.user_id}, {'name': 1})}
+    rows = export_rows(mongo.db, g.user_id, names)
+    body = serialize(rows)
+    headers = {'Content-Disposition': f'attachment; filename=items.{fmt}', 'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip'] > 0:  # gzip;q=0 means "not gzip"
+        body = gzip_blocks(body)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+@app.route('/cache_stats')
+@login_required
+def cache_stats():
+    return jsonify({'location_cache': location_cache.stats(), 'response_cache': response_cache.stats()})
 
 @app.context_processor
 def inject_config():
@@ -378,8 +1076,11 @@ def inject_config():
 
 @app.before_request
 def set_demo_user_if_no_auth():
-    if not app.config.get('USE_AUTH', True):
-        session['user'] = {'name': 'Demo User', 'email': 'demo@example.com'}
+    # Only assign when it differs, so the session isn't rewritten on every request
+    if not app.config.get('USE_AUTH', True) and session.get('user') != DEMO_USER:
+        session['user'] = dict(DEMO_USER)
 
 if __name__ == '__main__':
+    bootstrap_indexes()
+    bootstrap_import_jobs()
     app.run(debug=True)
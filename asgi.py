@@ -0,0 +1,296 @@
+"""
+Async serving mode.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 4
+
+The read-only JSON endpoints (the items table's /items/data, and the API's item and
+location lists, single documents, search and expiring items) are served by async
+handlers on pymongo's AsyncMongoClient, so a request waiting on MongoDB holds no
+thread and one worker can keep hundreds of requests in flight. Every other route
+goes to the Flask app through asgiref's WSGI adapter, which runs it on a thread
+pool: that includes the HTML pages (lists, item and location views), the CSV
+export, all writes and imports. Those render Jinja templates with Flask's request
+context (session, flashes, url_for) or stream through Flask, so they stay sync.
+
+Queries and response shapes come from api_queries, the same code the Flask routes
+use, and sessions are read from the Flask cookie or server-side store (sessions.py),
+so both modes answer the same URLs with the same bodies and ETags. Sync mode (flask run, or any WSGI server on
+app:app) is unaffected.
+"""
+
+import json
+import os
+import re
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from pymongo import AsyncMongoClient
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+
+from api_queries import (ApiArgumentError, json_doc, list_etag, expiring_args, expiring_find, expiring_item_json,
+                         search_args, search_find, search_result_json, items_page, locations_page, document_filter,
+                         items_table_args, items_table_find, items_table_row)
+import metrics
+from app import app, mongo_metrics
+from sessions import MongoSessionStore, ServerSideSessionInterface
+
+MAX_POOL_SIZE = int(os.environ.get('ASYNC_MONGO_POOL_SIZE', '100'))
+# Rows buffered before each write of a streamed list
+ROWS_PER_SEND = 100
+
+flask_app = WsgiToAsgi(app)
+_client = None
+
+
+def get_db():
+    # Created on first use inside the worker's event loop, after any fork
+    global _client
+    if _client is None:
+        options = {**app.config['MONGO_CLIENT_OPTIONS'], 'maxPoolSize': MAX_POOL_SIZE}
+        _client = AsyncMongoClient(app.config['MONGO_URI'], event_listeners=[mongo_metrics], **options)
+    return _client.get_default_database()
+
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.path = scope['path']
+        query_string = scope.get('query_string', b'').decode('latin-1')
+        self.full_path = f'{self.path}?{query_string}'
+        self.args = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+        self.headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        self.user_id = self.user_name = None
+
+    async def load_user(self):
+        """Set (user id, display name) from the Flask session, as login_required sees it."""
+        if not app.config.get('USE_AUTH', True):
+            self.user_id, self.user_name = 'demo-user', 'Demo User'
+            return
+        cookie = SimpleCookie(self.headers.get('cookie', '')).get(app.config['SESSION_COOKIE_NAME'])
+        session = await load_session(cookie.value) if cookie is not None else None
+        user = (session or {}).get('user')
+        if user:
+            self.user_id, self.user_name = user.get('sub') or user.get('email'), user.get('name')
+
+
+async def load_session(cookie_value):
+    """The session dict for a session cookie, or None; reads the same cookie or store as the Flask app."""
+    interface = app.session_interface
+    if not isinstance(interface, ServerSideSessionInterface):
+        serializer = interface.get_signing_serializer(app)
+        if serializer is None:
+            return None
+        try:
+            return serializer.loads(cookie_value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return None
+    key = interface.parse_cookie(cookie_value)
+    if key is None:
+        return None
+    sid, version = key
+    record = interface.cached(sid, version)
+    if record is None:
+        store = interface.store
+        if isinstance(store, MongoSessionStore):
+            record = store.record(await get_db()[store.collection].find_one(store.filter(sid)))
+        else:
+            record = store.load(sid)
+        if record is None:
+            return None
+        interface.remember(sid, record)
+    return interface.decode(record[0])
+
+
+async def start_response(send, status, content_type='application/json', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode())] + [(k.encode(), v.encode()) for k, v in headers],
+    })
+
+
+async def send_json(send, data, status=200, headers=()):
+    await start_response(send, status, headers=headers)
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+
+async def location_names(db, user_id):
+    return {str(loc['_id']): loc['name'] async for loc in db.locations.find({'user_id': user_id}, {'name': 1})}
+
+
+async def list_etag_headers(db, request):
+    """The ETag headers conditional_list sends, and whether If-None-Match already has the ETag."""
+    counter = await db.change_counters.find_one({'_id': request.user_id}, {'version': 1})
+    etag = list_etag(request.user_id, counter.get('version', 0) if counter else 0, request.user_name,
+                     request.full_path)
+    headers = [('etag', f'"{etag}"'), ('cache-control', 'private, no-cache'), ('vary', 'Cookie')]
+    return headers, parse_etags(request.headers.get('if-none-match')).contains(etag)
+
+
+async def stream_page(send, collection, page, headers):
+    """Stream one keyset page from the cursor, in the same format as app.stream_page."""
+    await start_response(send, 200, headers=headers)
+    chunks = [page.head]
+    last = None
+    has_more = False
+    count = 0
+    async for doc in collection.find(**page.find):
+        if count == page.limit:
+            has_more = True
+            break
+        last = doc
+        chunks.append(page.row(count, doc))
+        count += 1
+        if len(chunks) >= ROWS_PER_SEND:
+            await send({'type': 'http.response.body', 'body': ''.join(chunks).encode(), 'more_body': True})
+            chunks = []
+    chunks.append(page.tail(last, has_more))
+    await send({'type': 'http.response.body', 'body': ''.join(chunks).encode()})
+
+
+async def list_response(request, send, collection, make_page):
+    try:
+        page = make_page(request.user_id, request.args)
+    except ApiArgumentError as e:
+        await send_json(send, {'error': str(e)}, 400)
+        return
+    db = get_db()
+    headers, not_modified = await list_etag_headers(db, request)
+    if not_modified:
+        await start_response(send, 304, headers=headers)
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    await stream_page(send, db[collection], page, headers)
+
+
+async def api_items(request, send):
+    await list_response(request, send, 'storage_items', items_page)
+
+
+async def api_locations(request, send):
+    await list_response(request, send, 'locations', locations_page)
+
+
+async def api_expiring_items(request, send):
+    days, limit, include_expired = expiring_args(request.args)
+    db = get_db()
+    locations = await location_names(db, request.user_id)
+    items = [expiring_item_json(item, locations)
+             async for item in db.storage_items.find(**expiring_find(request.user_id, days, limit, include_expired))]
+    await send_json(send, {'days': days, 'include_expired': include_expired, 'items': items})
+
+
+async def api_search_items(request, send):
+    try:
+        q, page, per_page = search_args(request.args)
+    except ApiArgumentError as e:
+        await send_json(send, {'error': str(e)}, 400)
+        return
+    db = get_db()
+    mode, spec = search_find(request.user_id, q, page, per_page)
+    items = await db.storage_items.find(**spec).to_list()
+    total = await db.storage_items.count_documents(spec['filter'])
+    locations = await location_names(db, request.user_id)
+    await send_json(send, search_result_json(q, mode, page, per_page, total, items, locations))
+
+
+async def list_items_data(request, send):
+    """The items table's DataTables endpoint, as app.list_items_data."""
+    draw, start, length, search = items_table_args(request.args)
+    db = get_db()
+    locations = await location_names(db, request.user_id)
+    spec = items_table_find(request.user_id, request.args, start, length, search, locations)
+    urls = app.url_map.bind('', script_name=request.scope.get('root_path') or '/')
+
+    def url_for(endpoint, **values):
+        return urls.build(endpoint, values)
+
+    rows = [items_table_row(item, locations, url_for) async for item in db.storage_items.find(**spec)]
+    records_total = await db.storage_items.count_documents({'user_id': request.user_id})
+    records_filtered = await db.storage_items.count_documents(spec['filter']) if search else records_total
+    await send_json(send, {'draw': draw, 'recordsTotal': records_total, 'recordsFiltered': records_filtered,
+                           'data': rows})
+
+
+async def api_item(request, send, doc_id):
+    query = document_filter(request.user_id, doc_id)
+    item = await get_db().storage_items.find_one(query) if query else None
+    if not item:
+        await send_json(send, {'error': 'Item not found.'}, 404)
+        return
+    await send_json(send, json_doc(item))
+
+
+async def api_location(request, send, doc_id):
+    query = document_filter(request.user_id, doc_id)
+    loc = await get_db().locations.find_one(query) if query else None
+    if not loc:
+        await send_json(send, {'error': 'Location not found.'}, 404)
+        return
+    await send_json(send, json_doc(loc))
+
+
+# GET routes served natively; first match wins
+ROUTES = [
+    (re.compile(r'/items/data'), list_items_data),
+    (re.compile(r'/api/items'), api_items),
+    (re.compile(r'/api/locations'), api_locations),
+    (re.compile(r'/api/items/expiring'), api_expiring_items),
+    (re.compile(r'/api/items/search'), api_search_items),
+    (re.compile(r'/api/items/(?P<doc_id>[^/]+)'), api_item),
+    (re.compile(r'/api/locations/(?P<doc_id>[^/]+)'), api_location),
+]
+
+
+async def lifespan(receive, send):
+    global _client
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            get_db()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _client is not None:
+                await _client.close()
+                _client = None
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def dispatch(scope, send, handler, params):
+    started = time.perf_counter()
+    status = None
+
+    async def send_and_record(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        await send(message)
+
+    request = Request(scope)
+    try:
+        await request.load_user()
+        if request.user_id is None:
+            await send_json(send_and_record, {'error': 'Authentication required.'}, 401)
+        else:
+            await handler(request, send_and_record, **params)
+    finally:
+        # Same series as the Flask routes; here the time includes streaming the body
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=handler.__name__, method='GET')
+        metrics.HTTP_REQUESTS.inc(endpoint=handler.__name__, method='GET', status=status or 500)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        for pattern, handler in ROUTES:
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                await dispatch(scope, send, handler, match.groupdict())
+                return
+    await flask_app(scope, receive, send)
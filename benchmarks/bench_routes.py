@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Route benchmark and regression check.
+
+For each inventory size, seeds a scratch database and drives the main routes through
+Flask's test client, recording throughput, p50/p95/p99 latency and peak Python
+memory per route:
+
+  list_items     GET /items and GET /items/data pages at random offsets and sorts
+  view_item      GET /items/<id>
+  edit_item      GET and POST /items/<id>/edit
+  import_csv     POST /import_csv with --import-rows rows, until the job finishes
+  locations      GET /locations, GET /locations/<id>, POST /locations/add
+
+    python benchmarks/bench_routes.py --sizes 1000,10000,100000,1000000 --output results.json
+    python benchmarks/bench_routes.py --baseline benchmarks/baseline.json   # exit 1 on regression
+
+By default it runs against a mongod (--uri). --backend mongomock runs in memory
+without a server; use it for quick smoke runs at small sizes, not for real numbers.
+Results from a previous run can serve as the baseline (--baseline); a route regresses
+when its p95 latency or peak memory grows, or its throughput drops, by more than
+--tolerance.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USER_ID = 'demo-user'  # the user the app serves when USE_AUTH is false
+
+# Requests per route traced for peak memory (tracemalloc slows everything down, so
+# timings come from a separate, untraced pass)
+MEMORY_SAMPLES = 5
+IMPORT_TIMEOUT = 600
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure(request, count):
+    """Run ``request(i)`` count times; returns latency/throughput stats and peak memory."""
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        request(i)
+        samples.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for i in range(min(count, MEMORY_SAMPLES)):
+        request(count + i)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    samples.sort()
+    return {
+        'requests': count,
+        'requests_per_s': round(count / elapsed, 2),
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(percentile(samples, 0.95), 2),
+        'p99_ms': round(percentile(samples, 0.99), 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def check(response, *expected):
+    if response.status_code not in (expected or (200,)):
+        raise RuntimeError(f'{response.request.method} {response.request.path} returned {response.status_code}')
+    return response
+
+
+def import_csv_body(rows, rng):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['ItemName', 'ItemLocation', 'Manufacturer', 'Quantity', 'ExpirationDate', 'Box', 'UPC'])
+    for n in range(rows):
+        writer.writerow([f'Imported item {n}', f'Import location {n % 10}', 'Bench', rng.randint(1, 12),
+                         f'2027-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}', rng.randint(1, 200),
+                         f'{rng.randrange(10 ** 11, 10 ** 12):012d}'])
+    return out.getvalue().encode()
+
+
+def bench_routes(client, db, requests, import_rows, import_runs):
+    rng = random.Random(7)
+    item_ids = [str(doc['_id']) for doc in db.storage_items.find({'user_id': USER_ID}, {'_id': 1}).limit(1000)]
+    location_ids = [str(doc['_id']) for doc in db.locations.find({'user_id': USER_ID}, {'_id': 1})]
+    total = db.storage_items.count_documents({'user_id': USER_ID})
+
+    def list_items(i):
+        if i % 5 == 0:
+            check(client.get('/items'))
+            return
+        # Distinct query strings, so the response cache doesn't answer
+        check(client.get('/items/data', query_string={
+            'draw': i, 'start': rng.randrange(0, max(total - 25, 1)), 'length': 25,
+            'order[0][column]': rng.randrange(1, 7), 'order[0][dir]': rng.choice(['asc', 'desc'])}))
+
+    def view_item(i):
+        check(client.get(f'/items/{rng.choice(item_ids)}'))
+
+    def edit_item(i):
+        item_id = rng.choice(item_ids)
+        if i % 2 == 0:
+            check(client.get(f'/items/{item_id}/edit'))
+            return
+        check(client.post(f'/items/{item_id}/edit', data={
+            'name': f'Edited item {i}', 'location_id': rng.choice(location_ids), 'brand': 'Bench',
+            'quantity': str(rng.randint(1, 24)), 'box': str(rng.randint(1, 200)),
+            'expiration_date': '2027-06-01'}), 302)
+
+    def locations(i):
+        kind = i % 3
+        if kind == 0:
+            check(client.get('/locations'))
+        elif kind == 1:
+            check(client.get(f'/locations/{rng.choice(location_ids)}'))
+        else:
+            check(client.post('/locations/add', data={'name': f'Bench location {i}', 'description': ''}), 302)
+
+    def import_csv(i):
+        body = import_csv_body(import_rows, rng)
+        response = check(client.post('/import_csv', data={'csv_file': (io.BytesIO(body), 'bench.csv')},
+                                     content_type='multipart/form-data'), 302)
+        job_id = response.headers['Location'].rsplit('job=', 1)[1]
+        deadline = time.monotonic() + IMPORT_TIMEOUT
+        while time.monotonic() < deadline:
+            job = check(client.get(f'/import_csv/jobs/{job_id}')).get_json()
+            if job['status'] in ('completed', 'failed'):
+                if job['status'] == 'failed':
+                    raise RuntimeError(f'import job failed: {job["error"]}')
+                return
+            time.sleep(0.01)
+        raise RuntimeError('import job timed out')
+
+    results = {
+        'list_items': measure(list_items, requests),
+        'view_item': measure(view_item, requests),
+        'edit_item': measure(edit_item, requests),
+        'locations': measure(locations, requests),
+        'import_csv': measure(import_csv, import_runs),
+    }
+    import_stats = results['import_csv']
+    import_stats['rows_per_import'] = import_rows
+    import_stats['rows_per_s'] = round(import_rows * 1000 / import_stats['p50_ms'], 1)
+    return results
+
+
+def connect(backend, uri, db_name):
+    """Point the app at the scratch database and return (app, db)."""
+    os.environ['MONGO_URI'] = f'{uri.rstrip("/")}/{db_name}'
+    os.environ['USE_AUTH'] = 'false'
+    if backend == 'mongomock':
+        os.environ['ENSURE_INDEXES'] = 'false'
+    from app import app, mongo
+
+    if backend == 'mongomock':
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit('--backend mongomock needs the mongomock package (pip install mongomock)')
+        client = mongomock.MongoClient()
+        mongo.cx = client
+        mongo.db = client[db_name]
+    return app, mongo.db
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages (empty when everything is within tolerance)."""
+    regressions = []
+    for size, routes in results['results'].items():
+        for route, stats in routes.items():
+            base = baseline.get('results', {}).get(size, {}).get(route)
+            if not base:
+                continue
+            if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{size} {route}: p95 {stats["p95_ms"]} ms vs {base["p95_ms"]} ms')
+            if stats['requests_per_s'] < base['requests_per_s'] * (1 - tolerance):
+                regressions.append(f'{size} {route}: {stats["requests_per_s"]} req/s vs {base["requests_per_s"]} req/s')
+            if stats['peak_memory_kb'] > base['peak_memory_kb'] * (1 + tolerance):
+                regressions.append(f'{size} {route}: peak memory {stats["peak_memory_kb"]} KB '
+                                   f'vs {base["peak_memory_kb"]} KB')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help='comma-separated item counts')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route and size')
+    parser.add_argument('--import-rows', type=int, default=1000)
+    parser.add_argument('--import-runs', type=int, default=3)
+    parser.add_argument('--backend', choices=['mongo', 'mongomock'], default='mongo')
+    parser.add_argument('--uri', default='mongodb://localhost:27017', help='mongod to benchmark against')
+    parser.add_argument('--db', default='storage_bench_routes')
+    parser.add_argument('--output', help='write the results JSON here (default: stdout)')
+    parser.add_argument('--baseline', help='results JSON to compare against; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative change (default 0.25)')
+    args = parser.parse_args()
+
+    app, db = connect(args.backend, args.uri, args.db)
+    from bench_search import seed
+    from indexes import ensure_indexes
+
+    client = app.test_client()
+    results = {
+        'meta': {'backend': args.backend, 'requests': args.requests, 'python': platform.python_version(),
+                 'machine': platform.machine(), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())},
+        'results': {},
+    }
+    try:
+        for size in (int(s) for s in args.sizes.split(',')):
+            for name in db.list_collection_names():
+                db.drop_collection(name)
+            print(f'Seeding {size} items...', file=sys.stderr)
+            seed(db, size)
+            if args.backend == 'mongo':
+                ensure_indexes(db)
+            print(f'Benchmarking routes at {size} items...', file=sys.stderr)
+            results['results'][str(size)] = bench_routes(client, db, args.requests, args.import_rows,
+                                                         args.import_runs)
+    finally:
+        if args.backend == 'mongo':
+            db.client.drop_database(args.db)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f'REGRESSION {message}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline.', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
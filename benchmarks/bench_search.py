@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: text-index item search vs. loading every item.
+
+Seeds a scratch database with --items items for one user, then times, per query:
+  - load_all: load all of the user's items and locations and filter them in Python,
+    which is what rendering items.html in full for a client-side search cost the server
+  - search:   GET /api/items/search through the Flask test client (text index / UPC index)
+
+    python benchmarks/bench_search.py --items 100000
+
+Needs a running mongod (--uri, default mongodb://localhost:27017). The scratch
+database is dropped afterwards unless --keep is given.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USER_ID = 'demo-user'  # the user the app serves when USE_AUTH is false
+WORDS = ['tomato', 'soup', 'beans', 'rice', 'pasta', 'sauce', 'chicken', 'noodle', 'corn', 'peach',
+         'pear', 'apple', 'honey', 'oats', 'wheat', 'flour', 'sugar', 'salt', 'coffee', 'tea',
+         'cocoa', 'milk', 'powder', 'tuna', 'salmon', 'peanut', 'butter', 'jam', 'cracker', 'cereal']
+BRANDS = ['Del Monte', "Campbell's", 'Bush', 'Barilla', 'Kirkland', 'Great Value', 'Nature Valley', 'Hormel']
+QUERIES = ['soup', 'peanut butter', 'tomato sauce', 'honey oats', 'salmon', 'Barilla']
+
+
+def seed(db, count, batch_size=10000):
+    rng = random.Random(42)
+    location_ids = [str(i) for i in db.locations.insert_many(
+        [{'name': f'Location {n}', 'description': '', 'user_id': USER_ID} for n in range(20)]).inserted_ids]
+    batch = []
+    for n in range(count):
+        batch.append({
+            'name': ' '.join(rng.sample(WORDS, 3)).title(),
+            'brand': rng.choice(BRANDS),
+            'manufacturer': '',
+            'quantity': str(rng.randint(1, 24)),
+            'ingredients': ', '.join(rng.sample(WORDS, 5)),
+            'nutritional_info': '',
+            'upc': f'{rng.randrange(10 ** 11, 10 ** 12):012d}',
+            'box': rng.randint(1, 200),
+            'location_id': rng.choice(location_ids),
+            'user_id': USER_ID,
+        })
+        if len(batch) == batch_size:
+            db.storage_items.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db.storage_items.insert_many(batch, ordered=False)
+
+
+def load_all(db, query):
+    """The old approach: fetch everything, join location names, filter in Python."""
+    items = list(db.storage_items.find({'user_id': USER_ID}))
+    locations = {str(loc['_id']): loc['name'] for loc in db.locations.find({'user_id': USER_ID})}
+    needle = query.lower()
+    return [item for item in items
+            if needle in item.get('name', '').lower() or needle in item.get('brand', '').lower()
+            or needle in item.get('ingredients', '').lower()
+            or needle in locations.get(item.get('location_id'), '').lower()]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {'p50_ms': round(statistics.median(samples), 2),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--uri', default='mongodb://localhost:27017', help='mongod to benchmark against')
+    parser.add_argument('--db', default='storage_bench_search')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch database')
+    args = parser.parse_args()
+
+    os.environ['MONGO_URI'] = f'{args.uri.rstrip("/")}/{args.db}'
+    os.environ['USE_AUTH'] = 'false'
+
+    from app import app, mongo
+    from indexes import ensure_indexes
+
+    db = mongo.db
+    db.client.drop_database(args.db)
+    print(f'Seeding {args.items} items into {args.db}...', file=sys.stderr)
+    seed(db, args.items)
+    ensure_indexes(db)
+
+    client = app.test_client()
+    upc = db.storage_items.find_one({'user_id': USER_ID}, {'upc': 1})['upc']
+    results = {'items': args.items, 'queries': {}}
+    try:
+        for query in QUERIES + [upc]:
+            results['queries'][query] = {
+                'load_all': timed(lambda: load_all(db, query), args.repeat),
+                'search': timed(lambda: client.get('/api/items/search', query_string={'q': query}), args.repeat),
+            }
+    finally:
+        if not args.keep:
+            db.client.drop_database(args.db)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
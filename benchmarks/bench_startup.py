@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Worker startup benchmark.
+
+Each scenario runs in a fresh interpreter, so it sees a cold import the way a newly
+forked or spawned worker does, and reports the time taken and the process RSS after:
+
+  app_eager_pandas  import pandas, then app (what every worker paid when app.py
+                    pulled in pandas through csv_import)
+  app               import app (pandas is now only loaded when an import runs)
+  parse_csv         import app, then read a CSV with the csv-module engine
+  parse_pandas      import app, then read the same CSV with the pandas engine
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --csv "ImportSamples/ShepherdStorage - Items.csv" --output startup.json
+
+No database is needed: the app's client connects lazily and the parse scenarios only
+read the file.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child; SETUP and PARSE are filled in per scenario
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{setup}
+import app
+ready = time.perf_counter()
+{parse}
+finished = time.perf_counter()
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+print(json.dumps({{'import_ms': (ready - started) * 1000, 'parse_ms': (finished - ready) * 1000,
+                   'rss_kb': rss_kb(), 'pandas_loaded': 'pandas' in sys.modules, 'modules': len(sys.modules)}}))
+'''
+
+PARSE = '''
+from csv_import import read_chunks
+with open({path!r}, 'rb') as f:
+    for _ in read_chunks(f, 5000, {engine!r}):
+        pass
+'''
+
+SCENARIOS = {
+    'app_eager_pandas': ('import pandas', ''),
+    'app': ('', ''),
+    'parse_csv': ('', 'csv'),
+    'parse_pandas': ('', 'pandas'),
+}
+
+
+def run_scenario(setup, engine, csv_path):
+    code = CHILD.format(root=ROOT, setup=setup, parse=PARSE.format(path=csv_path, engine=engine) if engine else '')
+    env = dict(os.environ, USE_AUTH='false', ENSURE_INDEXES='false')
+    out = subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per scenario (medians are reported)')
+    parser.add_argument('--csv', default=os.path.join(ROOT, 'ImportSamples', 'ShepherdStorage - Items.csv'),
+                        help='file the parse scenarios read')
+    parser.add_argument('--output', help='also write the results as JSON here')
+    args = parser.parse_args()
+
+    results = {}
+    for name, (setup, engine) in SCENARIOS.items():
+        runs = [run_scenario(setup, engine, os.path.abspath(args.csv)) for _ in range(args.runs)]
+        results[name] = {
+            'import_ms': round(statistics.median(r['import_ms'] for r in runs), 1),
+            'parse_ms': round(statistics.median(r['parse_ms'] for r in runs), 1),
+            'rss_mb': round(statistics.median(r['rss_kb'] for r in runs) / 1024, 1),
+            'pandas_loaded': runs[0]['pandas_loaded'],
+            'modules': runs[0]['modules'],
+        }
+
+    print(f'{"scenario":<18} {"import ms":>10} {"parse ms":>10} {"RSS MB":>8} {"modules":>8}  pandas')
+    for name, r in results.items():
+        print(f'{name:<18} {r["import_ms"]:>10} {r["parse_ms"]:>10} {r["rss_mb"]:>8} {r["modules"]:>8}  '
+              f'{"yes" if r["pandas_loaded"] else "no"}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'runs': args.runs, 'csv': args.csv, 'results': results}, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Load test: many simultaneous clients against the items table data and the read API, sync vs. async mode.
+
+Each of --clients clients keeps one keep-alive connection and issues requests back to
+back for --duration seconds, cycling through PATHS. Reports throughput, latency
+percentiles and the peak number of requests in flight, per target.
+
+Seed a local mongod and start both servers (demo mode, so no login is needed):
+
+    python benchmarks/load_test.py --seed 50000 --uri mongodb://localhost:27017
+    export MONGO_URI=mongodb://localhost:27017/storage_load_test USE_AUTH=false
+    flask run --port 5001 --with-threads &
+    uvicorn asgi:application --port 5002 --workers 1 &
+
+then run:
+
+    python benchmarks/load_test.py --clients 300 \\
+        --target sync=http://127.0.0.1:5001 --target async=http://127.0.0.1:5002
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PATHS = [
+    '/items/data?draw=1&start=0&length=25&order%5B0%5D%5Bcolumn%5D=1&order%5B0%5D%5Bdir%5D=asc',
+    '/items/data?draw=1&start=0&length=25&search%5Bvalue%5D=soup',
+    '/api/items?limit=50',
+    '/api/items?limit=50&sort=name',
+    '/api/items/search?q=soup',
+    '/api/items/expiring?days=365',
+    '/api/locations',
+]
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, keep_alive)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)  # chunk and its CRLF
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+
+async def client(base, deadline, offset, stats):
+    url = urlsplit(base)
+    host, port = url.hostname, url.port or 80
+    reader = writer = None
+    n = offset
+    while time.perf_counter() < deadline:
+        path = PATHS[n % len(PATHS)]
+        n += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nConnection: keep-alive\r\n\r\n'.encode())
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            stats.latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                stats.errors += 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, ValueError, IndexError, asyncio.IncompleteReadError):
+            stats.errors += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+        finally:
+            stats.in_flight -= 1
+    if writer is not None:
+        writer.close()
+
+
+def percentile(samples, fraction):
+    return round(samples[min(len(samples) - 1, int(len(samples) * fraction))], 2)
+
+
+async def run_target(base, clients, duration):
+    stats = Stats()
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(base, deadline, i, stats) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    samples = sorted(stats.latencies)
+    if not samples:
+        return {'requests': 0, 'errors': stats.errors}
+    return {
+        'requests': len(samples),
+        'errors': stats.errors,
+        'requests_per_s': round(len(samples) / elapsed, 1),
+        'peak_in_flight': stats.peak_in_flight,
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': percentile(samples, 0.95),
+        'p99_ms': percentile(samples, 0.99),
+        'max_ms': round(samples[-1], 2),
+    }
+
+
+def seed_database(uri, db_name, count):
+    from pymongo import MongoClient
+    from bench_search import seed
+    from indexes import ensure_indexes
+
+    db = MongoClient(uri)[db_name]
+    db.client.drop_database(db_name)
+    print(f'Seeding {count} items into {db_name}...', file=sys.stderr)
+    seed(db, count)
+    ensure_indexes(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', default=[], metavar='NAME=URL',
+                        help='server to load (repeatable)')
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--duration', type=float, default=30, help='seconds per target')
+    parser.add_argument('--seed', type=int, metavar='ITEMS', help='seed the database instead of running')
+    parser.add_argument('--uri', default='mongodb://localhost:27017', help='mongod to seed (with --seed)')
+    parser.add_argument('--db', default='storage_load_test')
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_database(args.uri, args.db, args.seed)
+        return
+    if not args.target:
+        parser.error('give at least one --target NAME=URL (or --seed)')
+
+    results = {'clients': args.clients, 'duration_s': args.duration, 'targets': {}}
+    for target in args.target:
+        name, _, base = target.partition('=')
+        print(f'Loading {name} ({base}) with {args.clients} clients...', file=sys.stderr)
+        results['targets'][name] = asyncio.run(run_target(base, args.clients, args.duration))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Change tracking for delta sync.
+
+Every write to locations or storage_items stamps the written documents with
+``updated_at`` and ``change_seq``, a per-user number from the ``change_counters``
+collection that only goes up. Deletes leave a tombstone in ``tombstones``.
+changes_since() then returns only what changed after a sync token, so a client's
+sync costs O(changes) rather than O(inventory).
+
+Several documents can share a change_seq (one per batch of an import), so sync
+tokens carry the position inside a sequence number as well: ``seq.kind.id``.
+
+change_seq is allocated before the write it stamps, so sequence numbers can
+commit out of order: writer A takes N, writer B takes N+1 and finishes first. The
+counter therefore lists allocated but unfinished numbers in ``pending`` until
+commit_stamp() removes them, and changes_since() never returns anything past the
+committed high-water mark (committed_seq), so a token can't skip over N while A is
+still writing. A writer that dies without committing holds sync back for at most
+PENDING_TIMEOUT.
+
+commit_stamp() also bumps the counter's ``version``, which is what list ETags and
+the response cache are keyed on: a response rendered while a write was running is
+cached under the old version and so never outlives the write. stamped() wraps both.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+# (kind, collection) in the order documents sharing a change_seq are returned
+KINDS = [('locations', 'locations'), ('items', 'storage_items'), ('deleted', 'tombstones')]
+
+# How long an uncommitted change_seq holds sync back before it is treated as abandoned
+PENDING_TIMEOUT = timedelta(minutes=5)
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def _aware(value):
+    # Clients that aren't tz_aware return naive UTC datetimes
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def next_seq(db, user_id):
+    """Allocate the user's next change sequence number and list it as pending until commit_stamp()."""
+    while True:
+        now = datetime.now(timezone.utc)
+        counter = db.change_counters.find_one({'_id': user_id}, {'change_seq': 1})
+        if counter is None:
+            try:
+                db.change_counters.insert_one(
+                    {'_id': user_id, 'change_seq': 1, 'version': 0, 'pending': [{'seq': 1, 'at': now}]})
+                return 1
+            except DuplicateKeyError:
+                continue
+        # Compare-and-set, so the number and its pending entry are written together
+        seq = counter['change_seq'] + 1
+        result = db.change_counters.update_one(
+            {'_id': user_id, 'change_seq': counter['change_seq']},
+            {'$set': {'change_seq': seq}, '$push': {'pending': {'seq': seq, 'at': now}}})
+        if result.modified_count:
+            return seq
+
+
+def committed_seq(db, user_id):
+    """The highest change_seq at or below which every allocated change has been committed (or abandoned)."""
+    counter = db.change_counters.find_one({'_id': user_id}, {'change_seq': 1, 'pending': 1})
+    if counter is None:
+        return 0
+    cutoff = datetime.now(timezone.utc) - PENDING_TIMEOUT
+    pending = counter.get('pending', [])
+    live = [entry['seq'] for entry in pending if _aware(entry['at']) > cutoff]
+    if len(live) < len(pending):
+        db.change_counters.update_one({'_id': user_id}, {'$pull': {'pending': {'at': {'$lte': cutoff}}}})
+    return min(live) - 1 if live else counter['change_seq']
+
+
+def current_version(db, user_id):
+    """The user's committed version; it moves after every finished write to their data."""
+    counter = db.change_counters.find_one({'_id': user_id}, {'version': 1})
+    return counter.get('version', 0) if counter else 0
+
+
+def change_stamp(db, user_id):
+    """
+    Fields to $set (or include) on every document written in one change.
+
+    Pass the stamp to commit_stamp() once the write is done (or use stamped()).
+    """
+    return {'change_seq': next_seq(db, user_id), 'updated_at': datetime.now(timezone.utc)}
+
+
+def commit_stamp(db, user_id, stamp):
+    """Record that the writes made with ``stamp`` are finished."""
+    db.change_counters.update_one({'_id': user_id}, {'$pull': {'pending': {'seq': stamp['change_seq']}},
+                                                      '$inc': {'version': 1}})
+
+
+@contextmanager
+def stamped(db, user_id):
+    """Allocate a change stamp for the writes in the with block and commit it when the block exits."""
+    stamp = change_stamp(db, user_id)
+    try:
+        yield stamp
+    finally:
+        commit_stamp(db, user_id, stamp)
+
+
+def record_deletes(db, user_id, kind, ids, stamp=None):
+    """
+    Leave tombstones for deleted documents of ``kind`` ('locations' or 'items').
+
+    Without ``stamp`` the tombstones get (and commit) a stamp of their own.
+    """
+    if not ids:
+        return
+    if stamp is None:
+        with stamped(db, user_id) as stamp:
+            record_deletes(db, user_id, kind, ids, stamp)
+        return
+    db.tombstones.insert_many([
+        {'user_id': user_id, 'kind': kind, 'doc_id': str(doc_id),
+         'change_seq': stamp['change_seq'], 'deleted_at': stamp['updated_at']}
+        for doc_id in ids
+    ])
+
+
+def parse_token(token):
+    """Parse a sync token into (seq, kind rank, _id). An empty token means 'from the beginning'."""
+    if not token:
+        return -1, None, None
+    parts = token.split('.')
+    try:
+        if len(parts) == 1:
+            return int(parts[0]), None, None
+        if len(parts) == 3:
+            return int(parts[0]), int(parts[1]), ObjectId(parts[2])
+    except (ValueError, InvalidId):
+        pass
+    raise InvalidSyncToken(f'Invalid sync token: {token}')
+
+
+def make_token(seq, rank=None, doc_id=None):
+    return str(seq) if doc_id is None else f'{seq}.{rank}.{doc_id}'
+
+
+def _after(seq, token_rank, token_id, rank):
+    """Filter for documents of kind ``rank`` that sort after the token."""
+    if token_id is None or rank < token_rank:
+        return {'change_seq': {'$gt': seq}}
+    if rank > token_rank:
+        return {'change_seq': {'$gte': seq}}
+    return {'$or': [{'change_seq': {'$gt': seq}}, {'change_seq': seq, '_id': {'$gt': token_id}}]}
+
+
+def changes_since(db, user_id, token, limit=500):
+    """
+    Return up to ``limit`` changes after ``token``, ordered by (change_seq, kind, _id).
+
+    The result has one list per kind (``locations``, ``items``, ``deleted``), the
+    ``next`` token to pass back, and ``has_more`` if another page is waiting.
+    Changes past committed_seq() are left for a later sync.
+    """
+    seq, token_rank, token_id = parse_token(token)
+    high = committed_seq(db, user_id)
+    fetched = []
+    for rank, (kind, collection) in enumerate(KINDS):
+        query = {'user_id': user_id, '$and': [_after(seq, token_rank, token_id, rank),
+                                              {'change_seq': {'$lte': high}}]}
+        cursor = db[collection].find(query).sort([('change_seq', ASCENDING), ('_id', ASCENDING)]).limit(limit + 1)
+        fetched.extend((doc['change_seq'], rank, doc['_id'], kind, doc) for doc in cursor)
+    fetched.sort(key=lambda entry: entry[:3])
+
+    page = fetched[:limit]
+    result = {kind: [] for kind, _ in KINDS}
+    for _, _, _, kind, doc in page:
+        result[kind].append(doc)
+    if page:
+        last_seq, last_rank, last_id = page[-1][:3]
+        result['next'] = make_token(last_seq, last_rank, last_id)
+    else:
+        result['next'] = token or make_token(seq)
+    result['has_more'] = len(fetched) > limit
+    return result
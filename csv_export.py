@@ -0,0 +1,93 @@
+"""
+Streaming export of storage items.
+
+Rows use the import format (csv_import's column maps), so an exported file can be
+imported again. Items are read from a batched cursor and written out in small
+blocks, so memory stays flat however large the inventory is.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+from pymongo import ASCENDING
+
+from csv_import import REQUIRED_COLUMNS, STRING_COLUMNS, DATE_COLUMNS
+
+EXPORT_COLUMNS = REQUIRED_COLUMNS + ['Box'] + list(STRING_COLUMNS) + list(DATE_COLUMNS)
+
+EXPORT_PROJECTION = dict.fromkeys(['name', 'location_id', 'box'] + list(STRING_COLUMNS.values())
+                                  + list(DATE_COLUMNS.values()), 1)
+
+CURSOR_BATCH_SIZE = 1000
+# Rows serialized per yielded block
+ROWS_PER_BLOCK = 500
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def export_rows(db, user_id, location_names):
+    """
+    Yield one {column: string} dict per item, in import-format columns.
+
+    ``location_names`` maps str(location _id) to name, e.g. LocationCache.names().
+    """
+    cursor = db.storage_items.find({'user_id': user_id}, EXPORT_PROJECTION) \
+        .sort([('name', ASCENDING), ('_id', ASCENDING)]).batch_size(CURSOR_BATCH_SIZE)
+    try:
+        for item in cursor:
+            row = {
+                'ItemName': _cell(item.get('name')),
+                'ItemLocation': location_names.get(str(item.get('location_id')), ''),
+                'Box': _cell(item.get('box')),
+            }
+            for column, field in STRING_COLUMNS.items():
+                row[column] = _cell(item.get(field))
+            for column, field in DATE_COLUMNS.items():
+                row[column] = _cell(item.get(field))
+            yield row
+    finally:
+        cursor.close()
+
+
+def csv_blocks(rows):
+    """Serialize rows as CSV with a header line, yielding blocks of text."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % ROWS_PER_BLOCK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_blocks(rows):
+    """Serialize rows as JSON Lines, yielding blocks of text."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row))
+        if len(lines) == ROWS_PER_BLOCK:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_blocks(blocks):
+    """Gzip a stream of text blocks incrementally."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for block in blocks:
+        data = compressor.compress(block.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
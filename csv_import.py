@@ -0,0 +1,397 @@
+"""
+Batched CSV import engine for storage items.
+
+The CSV is read in chunks; each chunk is parsed column-wise, its location names are
+resolved with one $in query (plus one insert_many for new locations), and its items
+are written with a single unordered insert_many.
+
+The default reader is the standard library's csv module, so web workers never load
+pandas; dates in the DATE_FORMATS formats are parsed directly and other dates with a
+four-digit year (2025-06, Jan 2025, 20250605, ...) with dateutil, imported on first
+use. IMPORT_ENGINE=pandas reads with pandas instead (csv_import_pandas, imported on
+first use); both give the same documents for the same dates.
+
+With ``upsert=True`` every row gets an ``import_key`` (a hash of its location, box
+and UPC, or name and manufacturer when there is no UPC, plus how many identical rows
+came before it in the file) and is written with UpdateOne(upsert=True) on
+(user_id, import_key), so importing the same spreadsheet again updates the items it
+created instead of duplicating them. Rows identical to the stored item are skipped
+and don't touch change_seq.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import math
+import re
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from changes import change_stamp, commit_stamp
+from inventory_summary import apply_item_delta
+
+REQUIRED_COLUMNS = ['ItemName', 'ItemLocation']
+
+# CSV column -> storage_items field for the plain string columns
+STRING_COLUMNS = {
+    'Manufacturer': 'brand',
+    'Quantity': 'quantity',
+    'Servings Per': 'servings_per',
+    'Servings Size': 'size',
+    'Units': 'units',
+    'UPC': 'upc',
+    'Servings': 'nutritional_info',
+    'Damaged': 'other_info',
+}
+
+# CSV column -> storage_items field for the date columns
+DATE_COLUMNS = {
+    'ExpirationDate': 'expiration_date',
+    'Manufactured Date': 'manufactured_date',
+}
+
+# Date formats the csv engine parses directly, month first like pandas.to_datetime.
+# Other cells with a four-digit year go to dateutil; the rest are left empty.
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%m/%d/%Y %H:%M',
+                '%Y/%m/%d', '%m-%d-%Y', '%m-%d-%y', '%d-%b-%Y', '%d-%b-%y', '%b %d %Y', '%b %d, %Y', '%B %d %Y',
+                '%B %d, %Y', '%d %b %Y', '%d %B %Y']
+
+YEAR_PATTERN = re.compile(r'\d{4}')
+# What dateutil fills in for missing parts: the 1st, as in pandas, and a fixed year so
+# the result never depends on the day the parse runs
+FREE_FORM_DEFAULT = datetime(2000, 1, 1)
+
+# Cells pandas.read_csv reads as missing (its default na_values)
+NA_VALUES = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                       '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+
+# Item fields the CSV doesn't have, set when an item is created
+DEFAULT_FIELDS = {'date_purchased': None, 'ingredients': ''}
+
+DEFAULT_CHUNKSIZE = 5000
+
+# Box values outside MongoDB's 64-bit integers can't be stored; such rows are reported
+BOX_MIN, BOX_MAX = -2 ** 63, 2 ** 63 - 1
+BOX_OUT_OF_RANGE = object()
+
+
+class MissingColumnsError(ValueError):
+    """Raised when the CSV header lacks one of REQUIRED_COLUMNS."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        super().__init__(f'Missing required columns: {", ".join(columns)}')
+
+
+def box_value(number):
+    """A parsed Box number as an integer: None if not finite, BOX_OUT_OF_RANGE if too large for BSON."""
+    if not math.isfinite(number):
+        return None
+    box = int(number)
+    return box if BOX_MIN <= box <= BOX_MAX else BOX_OUT_OF_RANGE
+
+
+def _box(value):
+    """A Box cell as an integer (None when empty or not numeric), as pandas.to_numeric reads it."""
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return box_value(number)
+
+
+def _free_form_date(value):
+    """Parse a date in no DATE_FORMATS format with dateutil, or None."""
+    # Without a year dateutil fills in today's, where pandas rejects the value
+    if not YEAR_PATTERN.search(value):
+        return None
+    from dateutil import parser
+
+    try:
+        return parser.parse(value, default=FREE_FORM_DEFAULT)
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_date_value(value):
+    """
+    Parse a stripped date string into a datetime at midnight, or None if it isn't a date.
+
+    DATE_FORMATS first, then dateutil for other strings with a four-digit year. Also
+    used by migration 0002, so stored and imported dates are read the same way.
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        break
+    else:
+        parsed = _free_form_date(value)
+    return datetime(parsed.year, parsed.month, parsed.day) if parsed else None
+
+
+def _date_parser():
+    """A parse(value) function for date cells, caching each distinct value."""
+    cache = {'': None}
+
+    def parse(value):
+        if value not in cache:
+            cache[value] = parse_date_value(value)
+        return cache[value]
+
+    return parse
+
+
+def _csv_chunks(file, chunksize):
+    """csv-module reader: streams rows with no pandas; same output as csv_import_pandas.read_chunks."""
+    if not isinstance(file, io.TextIOBase):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv.reader(file)
+    header = next(reader, [])
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in header]
+    if missing_columns:
+        raise MissingColumnsError(missing_columns)
+    positions = {}
+    for position, column in enumerate(header):
+        positions.setdefault(column, position)
+    parse_date = _date_parser()
+
+    def column(rows, name):
+        """A column's cells, stripped, with missing values as ''."""
+        position = positions.get(name)
+        if position is None:
+            return [''] * len(rows)
+        return ['' if position >= len(row) or row[position] in NA_VALUES else row[position].strip() for row in rows]
+
+    def chunk(rows, row_numbers, rows_read):
+        columns = {
+            'name': column(rows, 'ItemName'),
+            'location': column(rows, 'ItemLocation'),
+            'box': [_box(value) for value in column(rows, 'Box')],
+        }
+        for csv_column, field in STRING_COLUMNS.items():
+            columns[field] = column(rows, csv_column)
+        for csv_column, field in DATE_COLUMNS.items():
+            columns[field] = [parse_date(value) for value in column(rows, csv_column)]
+        return rows_read, row_numbers, columns
+
+    rows, row_numbers, rows_read = [], [], 0
+    for row in reader:
+        if not row:
+            continue  # Blank line
+        rows_read += 1
+        # Rows of bare commas are blank lines as far as the user is concerned
+        if not all(cell in NA_VALUES for cell in row):
+            rows.append(row)
+            row_numbers.append(reader.line_num)
+        if rows_read == chunksize:
+            yield chunk(rows, row_numbers, rows_read)
+            rows, row_numbers, rows_read = [], [], 0
+    if rows_read:
+        yield chunk(rows, row_numbers, rows_read)
+
+
+def read_chunks(file, chunksize, engine='csv'):
+    """
+    Read a CSV in chunks of ``chunksize`` rows with the given engine ('csv' or 'pandas').
+
+    Yields (rows read, row numbers, columns) per chunk, where ``columns`` maps 'name',
+    'location', 'box' and the STRING_COLUMNS and DATE_COLUMNS fields to lists of
+    parsed values for the chunk's non-blank rows. Raises MissingColumnsError if the
+    header lacks a required column.
+    """
+    if engine == 'csv':
+        return _csv_chunks(file, chunksize)
+    if engine == 'pandas':
+        from csv_import_pandas import read_chunks as pandas_chunks
+        return pandas_chunks(file, chunksize)
+    raise ValueError(f'Unknown CSV import engine: {engine}')
+
+
+def _import_keys(location_names, boxes, upcs, names, brands, seen):
+    """
+    Stable import keys for a chunk's rows.
+
+    ``seen`` counts the rows of each identity so far in the file; it carries over
+    between chunks so that repeated identical rows get distinct keys.
+    """
+    keys = []
+    for location, box, upc, name, brand in zip(location_names, boxes, upcs, names, brands):
+        identity = (location.casefold(), box, upc) if upc else (location.casefold(), box, name.casefold(),
+                                                               brand.casefold())
+        occurrence = seen.get(identity, 0)
+        seen[identity] = occurrence + 1
+        keys.append(hashlib.blake2b(json.dumps([*identity, occurrence]).encode(), digest_size=16).hexdigest())
+    return keys
+
+
+def _resolve_locations(db, user_id, names, location_map, get_stamp):
+    """Add ids for ``names`` to ``location_map``, creating missing locations. Returns the number created."""
+    missing = [name for name in names if name not in location_map]
+    if not missing:
+        return 0
+    for loc in db.locations.find({'user_id': user_id, 'name': {'$in': missing}}, {'name': 1}):
+        location_map.setdefault(loc['name'], loc['_id'])
+    new_names = [name for name in missing if name not in location_map]
+    if not new_names:
+        return 0
+    result = db.locations.insert_many([
+        {'name': name, 'description': 'Auto-created from CSV import', 'user_id': user_id, **get_stamp()}
+        for name in new_names
+    ])
+    location_map.update(zip(new_names, result.inserted_ids))
+    return len(new_names)
+
+
+def _insert_items(db, docs, row_numbers, errors):
+    """Insert a batch of items unordered and return the inserted ones; failures are reported by CSV row number."""
+    if not docs:
+        return []
+    try:
+        db.storage_items.insert_many(docs, ordered=False)
+        return docs
+    except BulkWriteError as e:
+        failed = set()
+        for err in e.details.get('writeErrors', []):
+            failed.add(err['index'])
+            errors.append(f'Row {row_numbers[err["index"]]}: {err.get("errmsg", "write failed")}')
+        return [doc for index, doc in enumerate(docs) if index not in failed]
+
+
+def _upsert_items(db, user_id, docs, fields, row_numbers, errors, get_stamp):
+    """
+    Write a batch of keyed items with UpdateOne(upsert=True), skipping rows that match the stored item.
+
+    Returns (inserted, updated, previous, unchanged): the created items, the new and
+    old versions of the updated ones, and the number of rows left alone.
+    """
+    if not docs:
+        return [], [], [], 0
+    existing = {item['import_key']: item for item in db.storage_items.find(
+        {'user_id': user_id, 'import_key': {'$exists': True, '$in': [doc['import_key'] for doc in docs]}},
+        dict.fromkeys(['import_key', *fields], 1))}
+    changed = []
+    for index, doc in enumerate(docs):
+        old = existing.get(doc['import_key'])
+        if old is None or any(old.get(field) != doc[field] for field in fields):
+            changed.append((index, doc, old))
+    if not changed:
+        return [], [], [], len(docs)
+
+    stamp = get_stamp()
+    operations = [
+        UpdateOne({'user_id': user_id, 'import_key': doc['import_key']},
+                  {'$set': {**{field: doc[field] for field in fields}, **stamp}, '$setOnInsert': DEFAULT_FIELDS},
+                  upsert=True)
+        for _, doc, _ in changed
+    ]
+    failed = set()
+    try:
+        upserted = db.storage_items.bulk_write(operations, ordered=False).upserted_ids
+    except BulkWriteError as e:
+        upserted = {entry['index']: entry['_id'] for entry in e.details.get('upserted', [])}
+        for err in e.details.get('writeErrors', []):
+            failed.add(err['index'])
+            errors.append(f'Row {row_numbers[changed[err["index"]][0]]}: {err.get("errmsg", "write failed")}')
+
+    inserted, updated, previous = [], [], []
+    for op_index, (_, doc, old) in enumerate(changed):
+        if op_index in failed:
+            continue
+        doc.update(stamp)
+        if op_index in upserted:
+            inserted.append({**doc, **DEFAULT_FIELDS, '_id': upserted[op_index]})
+        elif old is not None:
+            updated.append({**doc, '_id': old['_id']})
+            previous.append(old)
+    return inserted, updated, previous, len(docs) - len(changed)
+
+
+def _report(progress, stats):
+    if progress is not None:
+        progress(stats)
+
+
+def import_items_csv(db, user_id, file, chunksize=DEFAULT_CHUNKSIZE, progress=None, upsert=False, engine='csv'):
+    """
+    Import storage items (and any missing locations) from a CSV file object.
+
+    Returns a dict with ``rows_processed``, ``items_imported`` (items created),
+    ``items_updated``, ``items_unchanged`` (both only counted with ``upsert``),
+    ``locations_created`` and ``errors`` (a list of 'Row N: message' strings, N being
+    the line number in the file). If given, ``progress(stats)`` is called after every
+    chunk with the running totals. ``engine`` picks the reader (see read_chunks).
+    Raises MissingColumnsError if the header lacks a required column.
+    """
+    stats = {'rows_processed': 0, 'items_imported': 0, 'items_updated': 0, 'items_unchanged': 0,
+             'locations_created': 0, 'errors': []}
+    location_map = {}  # Map location names to ObjectIds
+    seen_rows = {}  # Row identity -> occurrences so far, for import keys
+
+    for rows_read, row_numbers, columns in read_chunks(file, chunksize, engine):
+        stats['rows_processed'] += rows_read
+        valid = []
+        for index, (row_number, name, location, box) in enumerate(
+                zip(row_numbers, columns['name'], columns['location'], columns['box'])):
+            if not (name and location):
+                stats['errors'].append(f'Row {row_number}: missing {"ItemLocation" if name else "ItemName"}')
+            elif box is BOX_OUT_OF_RANGE:
+                stats['errors'].append(f'Row {row_number}: Box must be between {BOX_MIN} and {BOX_MAX}')
+            else:
+                valid.append(index)
+        if not valid:
+            _report(progress, stats)
+            continue
+        if len(valid) < len(row_numbers):
+            row_numbers = [row_numbers[index] for index in valid]
+            columns = {field: [values[index] for index in valid] for field, values in columns.items()}
+        names = columns['name']
+        location_names = columns.pop('location')
+
+        # One change_seq for everything this chunk writes, allocated only if it writes something
+        stamp = {}
+
+        def get_stamp():
+            if not stamp:
+                stamp.update(change_stamp(db, user_id))
+            return stamp
+
+        try:
+            stats['locations_created'] += _resolve_locations(
+                db, user_id, list(dict.fromkeys(location_names)), location_map, get_stamp)
+
+            columns = {'name': names, 'location_id': [str(location_map[n]) for n in location_names], **columns}
+            fields = list(columns)
+            docs = []
+            for values in zip(*(columns[field] for field in fields)):
+                doc = dict(zip(fields, values))
+                doc['user_id'] = user_id
+                docs.append(doc)
+
+            if upsert:
+                keys = _import_keys(location_names, columns['box'], columns['upc'], names, columns['brand'], seen_rows)
+                for doc, key in zip(docs, keys):
+                    doc['import_key'] = key
+                inserted, updated, previous, unchanged = _upsert_items(
+                    db, user_id, docs, fields, row_numbers, stats['errors'], get_stamp)
+                stats['items_updated'] += len(updated)
+                stats['items_unchanged'] += unchanged
+                apply_item_delta(db, user_id, removed=previous, added=inserted + updated)
+            else:
+                for doc in docs:
+                    doc.update(get_stamp())
+                    doc.update(DEFAULT_FIELDS)
+                inserted = _insert_items(db, docs, row_numbers, stats['errors'])
+                apply_item_delta(db, user_id, added=inserted)
+        finally:
+            # Sync and cached lists move past this chunk only once its writes are done
+            if stamp:
+                commit_stamp(db, user_id, stamp)
+        stats['items_imported'] += len(inserted)
+        _report(progress, stats)
+
+    return stats
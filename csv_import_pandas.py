@@ -0,0 +1,71 @@
+"""
+pandas reader for the CSV import (IMPORT_ENGINE=pandas).
+
+Importing pandas costs a few hundred milliseconds and tens of MB per process, so
+csv_import only imports this module when an import runs with the pandas engine.
+"""
+
+import warnings
+from datetime import datetime
+
+import pandas as pd
+
+from csv_import import REQUIRED_COLUMNS, STRING_COLUMNS, DATE_COLUMNS, MissingColumnsError, box_value
+
+
+def _string_column(df, column):
+    """Return a column as stripped strings with missing values as ''."""
+    if column not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[column].fillna('').astype(str).str.strip()
+
+
+def _date_column(df, column):
+    """Parse a whole column of dates into datetimes at midnight (None when missing or invalid)."""
+    if column not in df.columns:
+        return [None] * len(df)
+    raw = df[column]
+    with warnings.catch_warnings():
+        # "Could not infer format" is expected for free-form spreadsheet dates
+        warnings.simplefilter('ignore', UserWarning)
+        parsed = pd.to_datetime(raw, errors='coerce')
+    # The fast path infers a single format from the first value; re-parse the
+    # leftovers one by one so mixed formats still come through.
+    retry = parsed.isna() & raw.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(raw[retry], errors='coerce', format='mixed')
+    return [None if pd.isna(v) else datetime(v.year, v.month, v.day) for v in parsed]
+
+
+def _box_column(df):
+    """Parse the Box column as integers (None when missing or not numeric; see csv_import.box_value)."""
+    if 'Box' not in df.columns:
+        return [None] * len(df)
+    numbers = pd.to_numeric(df['Box'].str.strip(), errors='coerce')
+    return [box_value(v) for v in numbers]
+
+
+def read_chunks(file, chunksize):
+    """Yield (rows read, row numbers, columns) per chunk; see csv_import.read_chunks."""
+    # dtype=str keeps UPCs' leading zeros and leaves all conversions to us
+    reader = pd.read_csv(file, dtype=str, chunksize=chunksize)
+    for chunk_index, df in enumerate(reader):
+        if chunk_index == 0:
+            missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+            if missing_columns:
+                raise MissingColumnsError(missing_columns)
+
+        rows_read = len(df)
+        # Rows of bare commas are blank lines as far as the user is concerned
+        df = df.dropna(how='all')
+        columns = {
+            'name': _string_column(df, 'ItemName').tolist(),
+            'location': _string_column(df, 'ItemLocation').tolist(),
+            'box': _box_column(df),
+        }
+        for csv_column, field in STRING_COLUMNS.items():
+            columns[field] = _string_column(df, csv_column).tolist()
+        for csv_column, field in DATE_COLUMNS.items():
+            columns[field] = _date_column(df, csv_column)
+        # Header is line 1, so the first data row is line 2
+        yield rows_read, (df.index + 2).tolist(), columns
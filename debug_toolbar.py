@@ -0,0 +1,226 @@
+"""
+Per-request debug toolbar.
+
+When enabled for a request, every MongoDB command the request issues is recorded
+with its duration and result size, template renders are timed, and (with
+``_profile=1``) the view runs under cProfile. HTML pages get a summary panel at the
+``<!-- debug-toolbar -->`` marker in base.html; other responses get X-Debug-* headers.
+
+Repeated commands of the same shape (same command, collection and filter keys) are
+flagged as likely N+1 patterns: a query issued once per row instead of once per page.
+
+The toolbar is on for every request when DEBUG_TOOLBAR is set. Otherwise a request
+enables it with ``?_debug=<token>``, where the token comes from ``flask debug-token``;
+a valid token is kept in a cookie so the following pages stay instrumented until it
+expires. Streamed responses only show the commands issued before streaming began.
+"""
+
+import contextvars
+import cProfile
+import io
+import pstats
+import time
+
+import bson
+import click
+from bson import json_util
+from flask import before_render_template, g, render_template, request, template_rendered
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from pymongo import monitoring
+
+PANEL_MARKER = b'<!-- debug-toolbar -->'
+COOKIE_NAME = 'debug_toolbar'
+TOKEN_SALT = 'debug-toolbar'
+# A command shape repeated this many times in one request is flagged
+REPEAT_THRESHOLD = 5
+PROFILE_ROWS = 25
+
+_current = contextvars.ContextVar('debug_toolbar_recording', default=None)
+
+
+def _shape(value):
+    """A filter with its values blanked out, so queries differing only in values compare equal."""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, list):
+        return [_shape(item) for item in value[:1]]
+    return '?'
+
+
+def _result_size(command_name, reply):
+    """Documents returned (or affected) by a command reply."""
+    cursor = reply.get('cursor')
+    if cursor:
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    return reply.get('n')
+
+
+class Recording:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.commands = []
+        self.templates = []
+        self.profiler = None
+        self.template_started = None
+        self._pending = {}
+
+    def command_started(self, event):
+        command = event.command
+        collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = command.get('collection', '')
+        filter_ = command.get('filter', command.get('query', command.get('q', {})))
+        self._pending[(event.connection_id, event.request_id)] = {
+            'command': event.command_name,
+            'collection': collection,
+            'filter': json_util.dumps(filter_) if filter_ else '',
+            'shape': repr((event.command_name, collection, _shape(filter_))),
+        }
+
+    def command_finished(self, event, error=None):
+        entry = self._pending.pop((event.connection_id, event.request_id), None)
+        if entry is None:
+            return
+        entry['ms'] = event.duration_micros / 1000
+        entry['docs'] = None if error else _result_size(event.command_name, event.reply)
+        entry['bytes'] = None if error else len(bson.encode(event.reply))
+        entry['error'] = error
+        self.commands.append(entry)
+
+    def summary(self):
+        shapes = {}
+        for entry in self.commands:
+            shapes.setdefault(entry['shape'], []).append(entry)
+        repeated = [{'command': entries[0]['command'], 'collection': entries[0]['collection'],
+                     'filter': entries[0]['filter'], 'count': len(entries),
+                     'ms': round(sum(e['ms'] for e in entries), 2)}
+                    for entries in shapes.values() if len(entries) >= REPEAT_THRESHOLD]
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'mongo_ms': round(sum(e['ms'] for e in self.commands), 2),
+            'template_ms': round(sum(t['ms'] for t in self.templates), 2),
+            'commands': self.commands,
+            'templates': self.templates,
+            'repeated': sorted(repeated, key=lambda r: -r['count']),
+        }
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """Feeds command events to the current request's Recording, if there is one."""
+
+    def started(self, event):
+        recording = _current.get()
+        if recording is not None:
+            recording.command_started(event)
+
+    def succeeded(self, event):
+        recording = _current.get()
+        if recording is not None:
+            recording.command_finished(event)
+
+    def failed(self, event):
+        recording = _current.get()
+        if recording is not None:
+            recording.command_finished(event, error=event.failure.get('errmsg', 'failed'))
+
+
+class DebugToolbar:
+    def __init__(self, app=None):
+        # Pass to the MongoClient: PyMongo(app, event_listeners=[toolbar.listener])
+        self.listener = CommandRecorder()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('DEBUG_TOOLBAR', False)
+        app.config.setdefault('DEBUG_TOOLBAR_TOKEN_MAX_AGE', 3600)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+
+        @app.cli.command('debug-token')
+        def debug_token_command():
+            """Print a token that enables the debug toolbar via ?_debug=<token>."""
+            click.echo(self.make_token())
+
+    def _serializer(self):
+        return URLSafeTimedSerializer(self.app.secret_key, salt=TOKEN_SALT)
+
+    def make_token(self):
+        return self._serializer().dumps('debug')
+
+    def _valid_token(self, token):
+        if not token:
+            return False
+        try:
+            self._serializer().loads(token, max_age=self.app.config['DEBUG_TOOLBAR_TOKEN_MAX_AGE'])
+        except BadSignature:
+            return False
+        return True
+
+    def _before_request(self):
+        token = request.args.get('_debug')
+        if self._valid_token(token):
+            g.debug_toolbar_cookie = token
+        elif not (self.app.config['DEBUG_TOOLBAR'] or self._valid_token(request.cookies.get(COOKIE_NAME))):
+            return
+        recording = Recording()
+        g.debug_toolbar = recording
+        g.debug_toolbar_reset = _current.set(recording)
+        if request.args.get('_profile'):
+            recording.profiler = cProfile.Profile()
+            recording.profiler.enable()
+
+    def _template_started(self, sender, template, context, **extra):
+        recording = _current.get()
+        if recording is not None:
+            recording.template_started = time.perf_counter()
+
+    def _template_finished(self, sender, template, context, **extra):
+        recording = _current.get()
+        if recording is not None and recording.template_started is not None:
+            recording.templates.append({'name': template.name,
+                                        'ms': round((time.perf_counter() - recording.template_started) * 1000, 2)})
+
+    def _after_request(self, response):
+        recording = g.pop('debug_toolbar', None)
+        if recording is None:
+            return response
+        _current.reset(g.pop('debug_toolbar_reset'))
+        profile = None
+        if recording.profiler is not None:
+            recording.profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(recording.profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_ROWS)
+            profile = out.getvalue()
+        summary = recording.summary()
+
+        response.headers['X-Debug-Mongo-Commands'] = str(len(summary['commands']))
+        response.headers['X-Debug-Mongo-Ms'] = str(summary['mongo_ms'])
+        response.headers['X-Debug-Total-Ms'] = str(summary['total_ms'])
+        if summary['repeated']:
+            response.headers['X-Debug-Repeated-Queries'] = '; '.join(
+                f'{r["command"]} {r["collection"]} x{r["count"]}' for r in summary['repeated'])
+        if getattr(g, 'debug_toolbar_cookie', None):
+            response.set_cookie(COOKIE_NAME, g.debug_toolbar_cookie, httponly=True, samesite='Lax',
+                                max_age=self.app.config['DEBUG_TOOLBAR_TOKEN_MAX_AGE'])
+
+        if response.mimetype == 'text/html' and not response.is_streamed:
+            body = response.get_data()
+            if PANEL_MARKER in body:
+                panel = render_template('debug_toolbar.html', summary=summary, profile=profile,
+                                        endpoint=request.endpoint, threshold=REPEAT_THRESHOLD)
+                response.set_data(body.replace(PANEL_MARKER, panel.encode(), 1))
+        return response
+
+    def _teardown_request(self, exc):
+        # The request failed before after_request ran
+        reset = g.pop('debug_toolbar_reset', None)
+        if reset is not None:
+            _current.reset(reset)
+            recording = g.pop('debug_toolbar', None)
+            if recording is not None and recording.profiler is not None:
+                recording.profiler.disable()
@@ -10,5 +10,12 @@ done
 # Insert sample data (ignore errors if already inserted)
 python insert_sample_data.py || echo "Sample data may already exist."
 
-# Start Flask
+# Start the app: gunicorn with one worker per core in production, Flask's server otherwise
+if [ "${APP_SERVER:-flask}" = "gunicorn" ]; then
+  exec gunicorn -c gunicorn.conf.py app:app
+fi
+# gunicorn creates the indexes in when_ready; the dev server doesn't
+if [ "${ENSURE_INDEXES:-true}" = "true" ]; then
+  flask ensure-indexes || echo "Could not create indexes."
+fi
 flask run --host=0.0.0.0
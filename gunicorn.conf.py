@@ -0,0 +1,88 @@
+"""
+Production server configuration.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app) and forked into WEB_CONCURRENCY
+workers, one per core by default, each running GUNICORN_THREADS threads. Forked
+workers share the master's loaded code pages; post_fork gives each one its own
+MongoClient, since pymongo clients are not fork-safe. MongoDB pool size and timeouts
+come from the MONGO_* variables read in app.py.
+
+when_ready creates the registered indexes once, before any worker starts serving.
+
+Workers share the port, so /metrics would return a random worker's values. Each
+worker writes its metrics to PROMETHEUS_MULTIPROC_DIR (default: <tmp>/storage_metrics,
+emptied at startup) and a scrape sums all of them; see metrics.py.
+
+Load balancers and orchestrators should probe /healthz (liveness) and /readyz
+(readiness, 503 while MongoDB is unreachable).
+"""
+
+import multiprocessing
+import os
+import tempfile
+
+# Read by metrics.py when the app is imported, so it has to be set first
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'storage_metrics'))
+
+bind = os.environ.get('BIND', f'0.0.0.0:{os.environ.get("PORT", "5000")}')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = True
+
+# Seconds
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle workers after this many requests (0 disables), jittered so they don't all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Values left by a previous run would be summed into this one's
+    import metrics
+
+    metrics.clear_multiproc_dir()
+
+
+def when_ready(server):
+    # Once per deploy, in the master before workers fork, so no request waits on index builds
+    from app import bootstrap_indexes, bootstrap_import_jobs
+
+    bootstrap_indexes()
+    server.log.info('Indexes checked')
+    bootstrap_import_jobs()
+
+
+def post_fork(server, worker):
+    # Already imported by the master (preload_app), so this only looks the module up
+    from app import init_mongo
+
+    init_mongo()
+    server.log.info('Worker %s: MongoDB client created', worker.pid)
+
+    import metrics
+
+    metrics.init_worker()
+
+
+def worker_exit(server, worker):
+    # The last values since the previous flush
+    import metrics
+
+    metrics.flush()
+
+
+def child_exit(server, worker):
+    # In the master: keep the exited worker's totals in dead.json
+    import metrics
+
+    metrics.mark_process_dead(worker.pid)
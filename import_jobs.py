@@ -0,0 +1,237 @@
+"""
+Background CSV import jobs.
+
+Uploads are spooled to disk and imported by a bounded thread pool, so the upload
+request returns immediately. Job state lives in the ``import_jobs`` collection,
+which the status endpoint polls. Each process refreshes the ``heartbeat_at`` of the
+jobs it holds; a queued or running job whose heartbeat stops (its worker was killed
+or restarted) is marked failed and its spool file removed.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
+
+from csv_import import import_items_csv
+
+# Only the first errors are kept on the job document; rows_failed has the full count
+MAX_JOB_ERRORS = 100
+SPOOL_BLOCK_SIZE = 1 << 20
+# How often a process refreshes its jobs' heartbeat, and how old one gets before the job is failed
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = timedelta(minutes=5)
+STALE_ERROR = 'The import stopped because the server restarted. Please upload the file again.'
+ACTIVE_STATUSES = ['queued', 'running']
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _aware(value):
+    # mongod returns naive UTC datetimes unless the client is tz_aware
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class ImportJobRunner:
+    """Runs CSV imports on a bounded pool of worker threads."""
+
+    def __init__(self, get_db, spool_dir, max_workers=2, on_progress=None, on_finish=None, engine='csv'):
+        # get_db is called at use time so jobs always use the current client
+        self.get_db = get_db
+        self.spool_dir = spool_dir
+        self.max_workers = max_workers
+        # CSV reader, 'csv' or 'pandas' (see csv_import.read_chunks)
+        self.engine = engine
+        # on_progress(user_id, stats) runs after every imported chunk
+        self.on_progress = on_progress
+        # on_finish(user_id, status, rows, seconds) runs once the job completes or fails
+        self.on_finish = on_finish
+        self._executor = None
+        self._lock = threading.Lock()
+        # Ids of the queued and running jobs of this process, kept alive by the heartbeat
+        self._active = set()
+
+    def _get_executor(self):
+        # Created on first use, so no threads exist before a server forks its workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='csv-import')
+                threading.Thread(target=self._heartbeat, name='csv-import-heartbeat', daemon=True).start()
+            return self._executor
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            try:
+                self.get_db().import_jobs.update_many({'_id': {'$in': active}}, {'$set': {'heartbeat_at': _now()}})
+            except PyMongoError:
+                pass  # the next beat tries again; a job only goes stale after STALE_AFTER
+
+    def _spool_path(self, job_id):
+        return os.path.join(self.spool_dir, f'{job_id}.csv')
+
+    def _is_stale(self, job):
+        return (job['status'] in ACTIVE_STATUSES and
+                _aware(job.get('heartbeat_at') or job['created_at']) < _now() - STALE_AFTER)
+
+    def fail_stale(self):
+        """
+        Mark queued and running jobs whose heartbeat stopped as failed, and remove spool
+        files no live job needs. Called at startup; returns the number of jobs failed.
+        """
+        db = self.get_db()
+        cutoff = _now() - STALE_AFTER
+        failed = db.import_jobs.update_many(
+            {'status': {'$in': ACTIVE_STATUSES}, '$or': [
+                {'heartbeat_at': {'$lt': cutoff}},
+                {'heartbeat_at': None, 'created_at': {'$lt': cutoff}},  # jobs from before heartbeats
+            ]},
+            {'$set': {'status': 'failed', 'error': STALE_ERROR, 'finished_at': _now()}}).modified_count
+        if not os.path.isdir(self.spool_dir):
+            return failed
+        live = {str(job['_id']) for job in db.import_jobs.find({'status': {'$in': ACTIVE_STATUSES}}, {'_id': 1})}
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            try:
+                # A file newer than the cutoff may belong to a job being submitted right now
+                if os.path.splitext(name)[0] not in live and os.path.getmtime(path) < cutoff.timestamp():
+                    os.remove(path)
+            except OSError:
+                pass
+        return failed
+
+    def _spool(self, file, path):
+        """Copy an upload to disk and return an estimate of its data rows."""
+        newlines = 0
+        last = b''
+        with open(path, 'wb') as out:
+            while True:
+                block = file.read(SPOOL_BLOCK_SIZE)
+                if not block:
+                    break
+                out.write(block)
+                newlines += block.count(b'\n')
+                last = block
+        # One header line; the last line may not end with a newline
+        lines = newlines + (1 if last and not last.endswith(b'\n') else 0)
+        return max(lines - 1, 0)
+
+    def submit(self, user_id, file, filename, upsert=False):
+        """
+        Spool ``file`` to disk, record a queued job and schedule it. Returns the job id.
+
+        With ``upsert`` rows update the items an earlier import of them created (see csv_import).
+        """
+        os.makedirs(self.spool_dir, exist_ok=True)
+        job_id = ObjectId()
+        path = self._spool_path(job_id)
+        rows_total = self._spool(file, path)
+        self.get_db().import_jobs.insert_one({
+            '_id': job_id,
+            'user_id': user_id,
+            'filename': filename,
+            'upsert': upsert,
+            'status': 'queued',
+            'rows_total': rows_total,
+            'rows_done': 0,
+            'rows_failed': 0,
+            'items_imported': 0,
+            'items_updated': 0,
+            'items_unchanged': 0,
+            'locations_created': 0,
+            'errors': [],
+            'error': None,
+            'created_at': _now(),
+            'heartbeat_at': _now(),
+            'started_at': None,
+            'finished_at': None,
+        })
+        with self._lock:
+            self._active.add(job_id)
+        self._get_executor().submit(self._run, job_id, user_id, path, upsert)
+        return job_id
+
+    def get(self, user_id, job_id):
+        """
+        Return the job document, or None if it doesn't exist or belongs to someone else.
+
+        A job whose heartbeat stopped is marked failed here, so its progress page stops waiting.
+        """
+        try:
+            job_id = ObjectId(job_id)
+        except (InvalidId, TypeError):
+            return None
+        db = self.get_db()
+        job = db.import_jobs.find_one({'_id': job_id, 'user_id': user_id})
+        if job and self._is_stale(job):
+            failed = {'status': 'failed', 'error': STALE_ERROR, 'finished_at': _now()}
+            # Conditional, so a heartbeat that arrived in between wins
+            result = db.import_jobs.update_one(
+                {'_id': job_id, 'status': job['status'], 'heartbeat_at': job.get('heartbeat_at')}, {'$set': failed})
+            if result.modified_count:
+                job.update(failed)
+                try:
+                    os.remove(self._spool_path(job_id))
+                except OSError:
+                    pass
+        return job
+
+    def _run(self, job_id, user_id, path, upsert):
+        db = self.get_db()
+        db.import_jobs.update_one({'_id': job_id}, {'$set': {
+            'status': 'running', 'started_at': _now(), 'heartbeat_at': _now()}})
+        started = time.monotonic()
+        reported_errors = 0
+        rows_done = 0
+        status = 'failed'
+
+        def progress(stats):
+            nonlocal reported_errors, rows_done
+            rows_done = stats['rows_processed']
+            update = {'$set': {
+                'rows_done': stats['rows_processed'],
+                'rows_failed': len(stats['errors']),
+                'items_imported': stats['items_imported'],
+                'items_updated': stats['items_updated'],
+                'items_unchanged': stats['items_unchanged'],
+                'locations_created': stats['locations_created'],
+                'heartbeat_at': _now(),
+            }}
+            new_errors = stats['errors'][reported_errors:MAX_JOB_ERRORS]
+            if new_errors:
+                update['$push'] = {'errors': {'$each': new_errors}}
+                reported_errors += len(new_errors)
+            db.import_jobs.update_one({'_id': job_id}, update)
+            if self.on_progress is not None:
+                self.on_progress(user_id, stats)
+
+        try:
+            with open(path, 'rb') as f:
+                import_items_csv(db, user_id, f, progress=progress, upsert=upsert,
+                                 engine=self.engine)
+            db.import_jobs.update_one({'_id': job_id}, {'$set': {'status': 'completed', 'finished_at': _now()}})
+            status = 'completed'
+        except Exception as e:
+            db.import_jobs.update_one({'_id': job_id}, {'$set': {
+                'status': 'failed', 'error': str(e), 'finished_at': _now()}})
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+            if self.on_finish is not None:
+                self.on_finish(user_id, status, rows_done, time.monotonic() - started)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,187 @@
+"""
+Index registry for the storage app.
+
+INDEXES lists every index the app's queries rely on; ensure_indexes() creates them
+idempotently. QUERY_SHAPES mirrors the queries issued by app.py so that
+check_query_plans() can explain() each one and flag collection scans.
+
+Both are exposed as Flask CLI commands:
+
+    flask ensure-indexes
+    flask check-query-plans
+"""
+
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+INDEXES = {
+    'locations': [
+        # Per-user listing, and the CSV import's {user_id, name: {$in}} lookup
+        IndexModel([('user_id', ASCENDING), ('name', ASCENDING)], name='user_id_name'),
+        # Delta sync (/api/changes)
+        IndexModel([('user_id', ASCENDING), ('change_seq', ASCENDING), ('_id', ASCENDING)], name='user_id_change_seq_id'),
+    ],
+    'storage_items': [
+        # One per sortable column of the items DataTable. _id is the tie-breaker
+        # list_items_data appends, so the sort is served by the index.
+        IndexModel([('user_id', ASCENDING), ('name', ASCENDING), ('_id', ASCENDING)], name='user_id_name_id'),
+        IndexModel([('user_id', ASCENDING), ('brand', ASCENDING), ('_id', ASCENDING)], name='user_id_brand_id'),
+        IndexModel([('user_id', ASCENDING), ('quantity', ASCENDING), ('_id', ASCENDING)], name='user_id_quantity_id'),
+        IndexModel([('user_id', ASCENDING), ('location_id', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_location_id_id'),
+        IndexModel([('user_id', ASCENDING), ('expiration_date', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_expiration_date_id'),
+        IndexModel([('user_id', ASCENDING), ('box', ASCENDING), ('_id', ASCENDING)], name='user_id_box_id'),
+        # Full-text search; the user_id prefix means every $text query must match user_id exactly
+        IndexModel([('user_id', ASCENDING), ('name', TEXT), ('brand', TEXT), ('manufacturer', TEXT),
+                    ('ingredients', TEXT), ('nutritional_info', TEXT)],
+                   weights={'name': 10, 'brand': 5, 'manufacturer': 5, 'ingredients': 2, 'nutritional_info': 1},
+                   name='user_id_text'),
+        IndexModel([('user_id', ASCENDING), ('upc', ASCENDING)], name='user_id_upc'),
+        # Re-imports upsert on (user_id, import_key); only imported items have a key
+        IndexModel([('user_id', ASCENDING), ('import_key', ASCENDING)], name='user_id_import_key', unique=True,
+                   partialFilterExpression={'import_key': {'$exists': True}}),
+        IndexModel([('user_id', ASCENDING), ('change_seq', ASCENDING), ('_id', ASCENDING)], name='user_id_change_seq_id'),
+    ],
+    'tombstones': [
+        IndexModel([('user_id', ASCENDING), ('change_seq', ASCENDING), ('_id', ASCENDING)], name='user_id_change_seq_id'),
+    ],
+    'sessions': [
+        # Server-side sessions (sessions.py) are removed once expired
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+    ],
+    'import_jobs': [
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)], name='user_id_created_at'),
+        # ImportJobRunner.fail_stale at startup
+        IndexModel([('status', ASCENDING), ('heartbeat_at', ASCENDING)], name='status_heartbeat_at'),
+    ],
+}
+
+# Placeholder values for explain(); plans don't depend on them
+SAMPLE_USER = 'query-plan-check'
+SAMPLE_ID = ObjectId('000000000000000000000000')
+SAMPLE_DATE = datetime(2000, 1, 1)
+
+# (name, command) pairs, one per query shape issued by the app
+QUERY_SHAPES = [
+    ('list_locations', {'find': 'locations', 'filter': {'user_id': SAMPLE_USER}}),
+    ('import_csv location lookup', {
+        'find': 'locations', 'filter': {'user_id': SAMPLE_USER, 'name': {'$in': ['Pantry', 'Garage']}}}),
+    ('import_csv import_key lookup', {
+        'find': 'storage_items',
+        'filter': {'user_id': SAMPLE_USER, 'import_key': {'$exists': True, '$in': ['0' * 32, 'f' * 32]}}}),
+    ('view_location', {'find': 'locations', 'filter': {'_id': SAMPLE_ID, 'user_id': SAMPLE_USER}}),
+    ('view_item', {'find': 'storage_items', 'filter': {'_id': SAMPLE_ID, 'user_id': SAMPLE_USER}}),
+    ('bulk_items', {'find': 'storage_items', 'filter': {'_id': {'$in': [SAMPLE_ID]}, 'user_id': SAMPLE_USER}}),
+    ('delete_location items', {'find': 'storage_items', 'filter': {'user_id': SAMPLE_USER, 'location_id': 'x'}}),
+    ('list_items_data count', {'count': 'storage_items', 'query': {'user_id': SAMPLE_USER}}),
+    ('list_items_data search', {
+        'find': 'storage_items',
+        'filter': {'user_id': SAMPLE_USER, '$or': [
+            {'name': {'$regex': 'soup', '$options': 'i'}},
+            {'brand': {'$regex': 'soup', '$options': 'i'}},
+        ]},
+        'sort': {'name': 1, '_id': 1},
+    }),
+    ('find_expiring_items', {
+        'find': 'storage_items',
+        'filter': {'user_id': SAMPLE_USER, 'expiration_date': {'$gte': SAMPLE_DATE, '$lt': SAMPLE_DATE}},
+        'sort': {'expiration_date': 1, '_id': 1},
+        'limit': 100,
+    }),
+    ('search_items text', {
+        'find': 'storage_items',
+        'filter': {'user_id': SAMPLE_USER, '$text': {'$search': 'soup'}},
+        'projection': {'score': {'$meta': 'textScore'}},
+        'sort': {'score': {'$meta': 'textScore'}, '_id': 1},
+        'limit': 25,
+    }),
+    ('search_items upc', {
+        'find': 'storage_items', 'filter': {'user_id': SAMPLE_USER, 'upc': '051000012345'}, 'limit': 25}),
+] + [
+    (f'changes_since {collection}', {
+        'find': collection,
+        'filter': {'user_id': SAMPLE_USER, '$and': [
+            {'$or': [{'change_seq': {'$gt': 1}}, {'change_seq': 1, '_id': {'$gt': SAMPLE_ID}}]},
+            {'change_seq': {'$lte': 9}}]},
+        'sort': {'change_seq': 1, '_id': 1},
+        'limit': 501,
+    })
+    for collection in ('locations', 'storage_items', 'tombstones')
+] + [
+    ('import_job_status', {'find': 'import_jobs', 'filter': {'_id': SAMPLE_ID, 'user_id': SAMPLE_USER}}),
+    ('import_jobs fail_stale', {
+        'find': 'import_jobs', 'filter': {'status': {'$in': ['queued', 'running']}, 'heartbeat_at': {'$lt': SAMPLE_DATE}}}),
+    ('export_items', {'find': 'storage_items', 'filter': {'user_id': SAMPLE_USER}, 'sort': {'name': 1, '_id': 1}}),
+] + [
+    (f'api_items after cursor by {field}', {
+        'find': 'storage_items',
+        'filter': {'$and': [{'user_id': SAMPLE_USER}, {'$or': [
+            {field: {'$gt': 'a'}}, {field: 'a', '_id': {'$gt': SAMPLE_ID}}]}]},
+        'sort': {field: 1, '_id': 1},
+        'limit': 101,
+    })
+    for field in ('name', 'expiration_date', 'box')
+] + [
+    ('api_items by location', {
+        'find': 'storage_items',
+        'filter': {'$and': [{'user_id': SAMPLE_USER, 'location_id': 'x'}, {'_id': {'$gt': SAMPLE_ID}}]},
+        'sort': {'_id': 1},
+        'limit': 101,
+    }),
+    ('api_locations after cursor', {
+        'find': 'locations',
+        'filter': {'$and': [{'user_id': SAMPLE_USER}, {'_id': {'$gt': SAMPLE_ID}}]},
+        'sort': {'_id': 1},
+        'limit': 101,
+    }),
+] + [
+    (f'list_items_data sort by {field}', {
+        'find': 'storage_items',
+        'filter': {'user_id': SAMPLE_USER},
+        'sort': {field: direction, '_id': 1},
+        'limit': 25,
+    })
+    for field in ('name', 'brand', 'quantity', 'location_id', 'expiration_date', 'box')
+    for direction in (1, -1)
+]
+
+
+def ensure_indexes(db):
+    """Create every registered index. Existing indexes with the same spec are left alone."""
+    created = {}
+    for collection, models in INDEXES.items():
+        created[collection] = db[collection].create_indexes(models)
+    return created
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if 'queryPlan' in plan:  # slot-based execution engine
+        plan = plan['queryPlan']
+    if 'stage' in plan:
+        yield plan['stage']
+    for key in ('inputStage', 'outerStage', 'innerStage'):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
+
+def check_query_plans(db):
+    """
+    Explain every entry of QUERY_SHAPES.
+
+    Returns a list of (name, stages, ok) tuples; ok is False when the winning
+    plan contains a COLLSCAN.
+    """
+    results = []
+    for name, command in QUERY_SHAPES:
+        explain = db.command('explain', command, verbosity='queryPlanner')
+        stages = list(_plan_stages(explain['queryPlanner']['winningPlan']))
+        results.append((name, stages, 'COLLSCAN' not in stages))
+    return results
@@ -1,153 +1,394 @@
 """
-Sample script to insert demo data into users, locations, and storage_items collections for the Flask storage app.
-Run this after reset_mongo_collections.py.
+Sample data for the Flask storage app. Run this after reset_mongo_collections.py.
+
+With no arguments it inserts a few demo users, locations and storage_items. With
+--users it becomes a bulk seeder for load and index testing:
+
+    python insert_sample_data.py --users 100 --locations-per-user 20 --items-per-location 5000 --workers 8
+
+Users and locations are inserted first; items are generated in a process pool, each
+task writing its share with unordered insert_many batches on its own connection, so
+10M items load in minutes on a local mongod. Purchase dates fall within the last
+--purchase-window days, expiration dates --shelf-life days after purchase (min:max),
+and --no-expiry of the items have no expiration date. --seed makes a run repeatable.
+
+--csv-files writes spreadsheets in the format /import_csv accepts (mixed date
+formats, blank cells, UPCs with leading zeros) to --csv-dir, with or without --users.
 """
 
-from pymongo import MongoClient
+import argparse
+import csv
 import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
 from dotenv import load_dotenv
+from pymongo import MongoClient
 
 load_dotenv()
 
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/home_storage')
 DB_NAME = MONGO_URI.rsplit('/', 1)[-1]
 
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
-
-# Sample users
-demo_users = [
-    {'_id': 'demo-user', 'email': 'demo@example.com', 'name': 'Demo User'},
-    {'_id': 'user1', 'email': 'user1@example.com', 'name': 'User One'},
-    {'_id': 'user2', 'email': 'user2@example.com', 'name': 'User Two'},
-]
-try:
-    db.users.insert_many(demo_users)
-    print(f"Inserted {len(demo_users)} users.")
-except Exception as e:
-    print(f"Error inserting users: {e}")
-
-# Sample locations (each tied to a user)
-demo_locations = [
-    {'name': 'Pantry', 'description': 'Main kitchen pantry', 'user_id': 'demo-user'},
-    {'name': 'Garage Shelf', 'description': 'Shelf in garage', 'user_id': 'demo-user'},
-    {'name': 'Basement Freezer', 'description': 'Freezer in basement', 'user_id': 'user1'},
-    {'name': 'Office Cabinet', 'description': 'Cabinet in office', 'user_id': 'user2'},
-]
-loc_ids = db.locations.insert_many(demo_locations).inserted_ids
-print(f"Inserted {len(loc_ids)} locations.")
-
-# Sample storage items (each tied to a user and a location)
-demo_items = [
-    {
-        'name': 'Canned Beans',
-        'brand': 'BestBeans',
-        'size': '15oz',
-        'nutritional_info': 'Protein-rich',
-        'date_purchased': '2025-06-01',
-        'expiration_date': '2026-06-01',
-        'ingredients': 'Beans, water, salt',
-        'other_info': '',
-        'location_id': str(loc_ids[0]),
-        'user_id': 'demo-user',
-    },
-    {
-        'name': 'Pasta',
-        'brand': 'PastaCo',
-        'size': '1lb',
-        'nutritional_info': 'Carbs',
-        'date_purchased': '2025-05-15',
-        'expiration_date': '2026-05-15',
-        'ingredients': 'Wheat',
-        'other_info': '',
-        'location_id': str(loc_ids[1]),
-        'user_id': 'demo-user',
-    },
-    {
-        'name': 'Frozen Pizza',
-        'brand': 'PizzaBrand',
-        'size': '12in',
-        'nutritional_info': 'Cheese, carbs',
-        'date_purchased': '2025-06-10',
-        'expiration_date': '2025-12-10',
-        'ingredients': 'Flour, cheese, tomato',
-        'other_info': '',
-        'location_id': str(loc_ids[2]),
-        'user_id': 'user1',
-    },
-    {
-        'name': 'Coffee',
-        'brand': 'BrewMaster',
-        'size': '2lb',
-        'nutritional_info': 'Caffeine',
-        'date_purchased': '2025-04-20',
-        'expiration_date': '2026-04-20',
-        'ingredients': 'Coffee beans',
-        'other_info': '',
-        'location_id': str(loc_ids[3]),
-        'user_id': 'user2',
-    },
-]
-try:
-    db.storage_items.insert_many(demo_items)
-    print(f"Inserted {len(demo_items)} storage items.")
-except Exception as e:
-    print(f"Error inserting storage items: {e}")
-
-# Add Scott Shepherd user
-scott_user = {'_id': '117740515392558077582', 'email': 'scott.shepherd@example.com', 'name': 'Scott Shepherd'}
-db.users.insert_one(scott_user)
-
-# Add locations for Scott Shepherd
-scott_locations = [
-    {'name': 'Scott Pantry', 'description': 'Scott\'s kitchen pantry', 'user_id': '117740515392558077582'},
-    {'name': 'Scott Garage', 'description': 'Scott\'s garage shelf', 'user_id': '117740515392558077582'},
-]
-scott_loc_ids = db.locations.insert_many(scott_locations).inserted_ids
-
-# Add storage items for Scott Shepherd
-scott_items = [
-    {
-        'name': 'Granola Bars',
-        'brand': 'Nature Valley',
-        'size': '12 pack',
-        'nutritional_info': 'Whole grain oats',
-        'date_purchased': '2025-06-10',
-        'expiration_date': '2026-01-10',
-        'ingredients': 'Oats, honey, sugar',
-        'other_info': 'Peanut free',
-        'location_id': str(scott_loc_ids[0]),
-        'user_id': '117740515392558077582',
-    },
-    {
-        'name': 'Bottled Water',
-        'brand': 'Aquafina',
-        'size': '24 pack',
-        'nutritional_info': 'Water',
-        'date_purchased': '2025-05-20',
-        'expiration_date': '2027-05-20',
-        'ingredients': 'Water',
-        'other_info': '',
-        'location_id': str(scott_loc_ids[1]),
-        'user_id': '117740515392558077582',
-    },
-    {
-        'name': 'Soup Cans',
-        'brand': 'Campbell\'s',
-        'size': '10.5oz',
-        'nutritional_info': 'Low sodium',
-        'date_purchased': '2025-06-01',
-        'expiration_date': '2026-06-01',
-        'ingredients': 'Chicken, noodles, broth',
-        'other_info': '',
-        'location_id': str(scott_loc_ids[0]),
-        'user_id': '117740515392558077582',
-    },
-]
-db.storage_items.insert_many(scott_items)
-
-print(f"Users count: {db.users.count_documents({})}")
-print(f"Locations count: {db.locations.count_documents({})}")
-print(f"Storage items count: {db.storage_items.count_documents({})}")
-
-print('Inserted sample users, locations, and storage_items.')
+# Items each pool task generates and writes
+TASK_SIZE = 100000
+
+WORDS = ['beans', 'rice', 'pasta', 'tomato', 'soup', 'coffee', 'tea', 'flour', 'sugar', 'salt', 'oats',
+         'honey', 'peanut', 'butter', 'corn', 'peas', 'tuna', 'chicken', 'broth', 'crackers', 'cereal',
+         'granola', 'raisins', 'almonds', 'olive', 'oil', 'vinegar', 'mustard', 'ketchup', 'salsa',
+         'batteries', 'candles', 'matches', 'bandages', 'wipes', 'water', 'pears', 'peaches', 'lentils']
+BRANDS = ['BestBeans', 'PastaCo', 'BrewMaster', 'Nature Valley', 'Aquafina', "Campbell's", 'Kirkland',
+          'Great Value', 'Del Monte', 'Quaker', 'Heinz', 'Barilla', 'Goya', 'Wet Ones', '']
+PLACES = ['Pantry', 'Garage Shelf', 'Basement', 'Freezer', 'Closet', 'Attic', 'Office Cabinet', 'Shed']
+UNITS = ['grams', 'oz', 'cups', 'pieces', 'Towelette', 'ml', '']
+CSV_HEADER = ['ItemName', 'ItemLocation', 'Manufacturer', 'Quantity', 'Servings Per', 'Servings Size', 'Units',
+              'Servings', 'ExpirationDate', 'Box', 'Manufactured Date', 'UPC', 'Damaged']
+# Spreadsheet date formats seen in real exports
+CSV_DATE_FORMATS = ['%m/%d/%y', '%m/%d/%Y', '%Y-%m-%d', '%b %d %Y']
+
+
+def get_db(uri=MONGO_URI, db_name=DB_NAME):
+    return MongoClient(uri)[db_name]
+
+
+class Dates:
+    """Purchase and expiration dates drawn from the command line's distribution."""
+
+    def __init__(self, purchase_window, shelf_life, no_expiry, today=None):
+        self.purchase_window = purchase_window
+        self.shelf_life = shelf_life
+        self.no_expiry = no_expiry
+        today = today or datetime.now()
+        self.today = datetime(today.year, today.month, today.day)
+
+    def draw(self, rng):
+        purchased = self.today - timedelta(days=rng.randint(0, self.purchase_window))
+        if rng.random() < self.no_expiry:
+            return purchased, None
+        return purchased, purchased + timedelta(days=rng.randint(*self.shelf_life))
+
+
+def item_name(rng):
+    return ' '.join(rng.sample(WORDS, rng.randint(1, 3))).title()
+
+
+def upc(rng):
+    return f'{rng.randrange(10 ** 11):012d}'
+
+
+def generate_items(rng, user_id, location_ids, count, dates, stamp):
+    for _ in range(count):
+        purchased, expires = dates.draw(rng)
+        yield {
+            'name': item_name(rng),
+            'brand': rng.choice(BRANDS),
+            'size': f'{rng.randint(1, 32)}{rng.choice(["oz", "lb", "g", " pack"])}',
+            'quantity': str(rng.randint(1, 24)),
+            'nutritional_info': '',
+            'ingredients': ', '.join(rng.sample(WORDS, rng.randint(1, 5))),
+            'other_info': '',
+            'upc': upc(rng) if rng.random() < 0.7 else '',
+            'box': rng.randint(1, 200) if rng.random() < 0.8 else None,
+            'date_purchased': purchased,
+            'expiration_date': expires,
+            'location_id': rng.choice(location_ids),
+            'user_id': user_id,
+            **stamp,
+        }
+
+
+def seed_items_task(uri, db_name, seed, user_id, location_ids, count, dates, batch_size):
+    """Pool task: generate ``count`` items for one user and insert them. Returns the count."""
+    from changes import stamped
+
+    # Each process opens its own client; MongoClient must not cross a fork
+    client = MongoClient(uri)
+    try:
+        db = client[db_name]
+        rng = random.Random(seed)
+        # A stamp per task, committed as soon as its items are in: one held for the whole
+        # seed would outlive changes.PENDING_TIMEOUT and let sync skip items still being written
+        with stamped(db, user_id) as stamp:
+            batch = []
+            for doc in generate_items(rng, user_id, location_ids, count, dates, stamp):
+                batch.append(doc)
+                if len(batch) == batch_size:
+                    db.storage_items.insert_many(batch, ordered=False)
+                    batch = []
+            if batch:
+                db.storage_items.insert_many(batch, ordered=False)
+    finally:
+        client.close()
+    return count
+
+
+def write_csv_task(path, seed, rows, locations, dates):
+    """Pool task: write one import spreadsheet of ``rows`` rows. Returns the path."""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for _ in range(rows):
+            _, expires = dates.draw(rng)
+            date_format = rng.choice(CSV_DATE_FORMATS)
+            servings_per = rng.randint(1, 20)
+            writer.writerow([
+                item_name(rng),
+                rng.choice(locations),
+                rng.choice(BRANDS),
+                rng.randint(1, 12),
+                servings_per,
+                rng.randint(1, 250),
+                rng.choice(UNITS),
+                servings_per * rng.randint(1, 4),
+                expires.strftime(date_format) if expires else '',
+                rng.randint(1, 200) if rng.random() < 0.8 else '',
+                '',
+                upc(rng) if rng.random() < 0.5 else '',
+                'Yes' if rng.random() < 0.02 else '',
+            ])
+    return path
+
+
+def seed_bulk(db, args, dates, pool):
+    """Insert --users users with their locations, then their items through the pool."""
+    from changes import stamped
+
+    user_ids = [f'{args.user_prefix}{n}' for n in range(args.users)]
+    db.users.insert_many([{'_id': uid, 'email': f'{uid}@example.com', 'name': f'Load User {n}'}
+                          for n, uid in enumerate(user_ids)], ordered=False)
+    tasks = []
+    for uid in user_ids:
+        if not args.locations_per_user:
+            continue
+        with stamped(db, uid) as stamp:
+            locations = [{'_id': ObjectId(), 'name': f'{PLACES[n % len(PLACES)]} {n // len(PLACES) + 1}',
+                          'description': 'Generated by insert_sample_data.py', 'user_id': uid, **stamp}
+                         for n in range(args.locations_per_user)]
+            db.locations.insert_many(locations, ordered=False)
+        location_ids = [str(loc['_id']) for loc in locations]
+        remaining = args.locations_per_user * args.items_per_location
+        while remaining:
+            count = min(remaining, TASK_SIZE)
+            tasks.append((uid, location_ids, count))
+            remaining -= count
+    # Summaries of these users are rebuilt on first use
+    db.inventory_summary.delete_many({'_id': {'$in': user_ids}})
+    print(f'Inserted {len(user_ids)} users and {len(user_ids) * args.locations_per_user} locations.')
+
+    total = sum(task[2] for task in tasks)
+    started = time.perf_counter()
+    futures = [pool.submit(seed_items_task, MONGO_URI, DB_NAME, args.seed * 1000003 + n, uid, location_ids,
+                           count, dates, args.batch_size)
+               for n, (uid, location_ids, count) in enumerate(tasks)]
+    done = 0
+    for future in as_completed(futures):
+        done += future.result()
+        elapsed = time.perf_counter() - started
+        print(f'\r{done}/{total} items ({done / elapsed:,.0f}/s)', end='', file=sys.stderr, flush=True)
+    if total:
+        print(file=sys.stderr)
+    print(f'Inserted {total} storage items in {time.perf_counter() - started:.1f}s.')
+
+
+def write_csv_files(args, dates, pool):
+    os.makedirs(args.csv_dir, exist_ok=True)
+    locations = PLACES[:max(1, min(len(PLACES), args.locations_per_user))]
+    futures = [pool.submit(write_csv_task, os.path.join(args.csv_dir, f'generated-{n + 1}.csv'),
+                           args.seed * 1000003 - n - 1, args.csv_rows, locations, dates)
+               for n in range(args.csv_files)]
+    for future in as_completed(futures):
+        print(f'Wrote {future.result()} ({args.csv_rows} rows).')
+
+
+def insert_demo_data(db):
+    """The original handful of demo users, locations and items."""
+    # Sample users
+    demo_users = [
+        {'_id': 'demo-user', 'email': 'demo@example.com', 'name': 'Demo User'},
+        {'_id': 'user1', 'email': 'user1@example.com', 'name': 'User One'},
+        {'_id': 'user2', 'email': 'user2@example.com', 'name': 'User Two'},
+    ]
+    try:
+        db.users.insert_many(demo_users)
+        print(f"Inserted {len(demo_users)} users.")
+    except Exception as e:
+        print(f"Error inserting users: {e}")
+
+    # Sample locations (each tied to a user)
+    demo_locations = [
+        {'name': 'Pantry', 'description': 'Main kitchen pantry', 'user_id': 'demo-user'},
+        {'name': 'Garage Shelf', 'description': 'Shelf in garage', 'user_id': 'demo-user'},
+        {'name': 'Basement Freezer', 'description': 'Freezer in basement', 'user_id': 'user1'},
+        {'name': 'Office Cabinet', 'description': 'Cabinet in office', 'user_id': 'user2'},
+    ]
+    loc_ids = db.locations.insert_many(demo_locations).inserted_ids
+    print(f"Inserted {len(loc_ids)} locations.")
+
+    # Sample storage items (each tied to a user and a location)
+    demo_items = [
+        {
+            'name': 'Canned Beans',
+            'brand': 'BestBeans',
+            'size': '15oz',
+            'nutritional_info': 'Protein-rich',
+            'date_purchased': datetime(2025, 6, 1),
+            'expiration_date': datetime(2026, 6, 1),
+            'ingredients': 'Beans, water, salt',
+            'other_info': '',
+            'location_id': str(loc_ids[0]),
+            'user_id': 'demo-user',
+        },
+        {
+            'name': 'Pasta',
+            'brand': 'PastaCo',
+            'size': '1lb',
+            'nutritional_info': 'Carbs',
+            'date_purchased': datetime(2025, 5, 15),
+            'expiration_date': datetime(2026, 5, 15),
+            'ingredients': 'Wheat',
+            'other_info': '',
+            'location_id': str(loc_ids[1]),
+            'user_id': 'demo-user',
+        },
+        {
+            'name': 'Frozen Pizza',
+            'brand': 'PizzaBrand',
+            'size': '12in',
+            'nutritional_info': 'Cheese, carbs',
+            'date_purchased': datetime(2025, 6, 10),
+            'expiration_date': datetime(2025, 12, 10),
+            'ingredients': 'Flour, cheese, tomato',
+            'other_info': '',
+            'location_id': str(loc_ids[2]),
+            'user_id': 'user1',
+        },
+        {
+            'name': 'Coffee',
+            'brand': 'BrewMaster',
+            'size': '2lb',
+            'nutritional_info': 'Caffeine',
+            'date_purchased': datetime(2025, 4, 20),
+            'expiration_date': datetime(2026, 4, 20),
+            'ingredients': 'Coffee beans',
+            'other_info': '',
+            'location_id': str(loc_ids[3]),
+            'user_id': 'user2',
+        },
+    ]
+    try:
+        db.storage_items.insert_many(demo_items)
+        print(f"Inserted {len(demo_items)} storage items.")
+    except Exception as e:
+        print(f"Error inserting storage items: {e}")
+
+    # Add Scott Shepherd user
+    scott_user = {'_id': '117740515392558077582', 'email': 'scott.shepherd@example.com', 'name': 'Scott Shepherd'}
+    db.users.insert_one(scott_user)
+
+    # Add locations for Scott Shepherd
+    scott_locations = [
+        {'name': 'Scott Pantry', 'description': 'Scott\'s kitchen pantry', 'user_id': '117740515392558077582'},
+        {'name': 'Scott Garage', 'description': 'Scott\'s garage shelf', 'user_id': '117740515392558077582'},
+    ]
+    scott_loc_ids = db.locations.insert_many(scott_locations).inserted_ids
+
+    # Add storage items for Scott Shepherd
+    scott_items = [
+        {
+            'name': 'Granola Bars',
+            'brand': 'Nature Valley',
+            'size': '12 pack',
+            'nutritional_info': 'Whole grain oats',
+            'date_purchased': datetime(2025, 6, 10),
+            'expiration_date': datetime(2026, 1, 10),
+            'ingredients': 'Oats, honey, sugar',
+            'other_info': 'Peanut free',
+            'location_id': str(scott_loc_ids[0]),
+            'user_id': '117740515392558077582',
+        },
+        {
+            'name': 'Bottled Water',
+            'brand': 'Aquafina',
+            'size': '24 pack',
+            'nutritional_info': 'Water',
+            'date_purchased': datetime(2025, 5, 20),
+            'expiration_date': datetime(2027, 5, 20),
+            'ingredients': 'Water',
+            'other_info': '',
+            'location_id': str(scott_loc_ids[1]),
+            'user_id': '117740515392558077582',
+        },
+        {
+            'name': 'Soup Cans',
+            'brand': 'Campbell\'s',
+            'size': '10.5oz',
+            'nutritional_info': 'Low sodium',
+            'date_purchased': datetime(2025, 6, 1),
+            'expiration_date': datetime(2026, 6, 1),
+            'ingredients': 'Chicken, noodles, broth',
+            'other_info': '',
+            'location_id': str(scott_loc_ids[0]),
+            'user_id': '117740515392558077582',
+        },
+    ]
+    db.storage_items.insert_many(scott_items)
+
+    print('Inserted sample users, locations, and storage_items.')
+
+
+def shelf_life(value):
+    low, _, high = value.partition(':')
+    low, high = int(low), int(high or low)
+    if low < 0 or high < low:
+        raise argparse.ArgumentTypeError('expected MIN:MAX days with 0 <= MIN <= MAX')
+    return low, high
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=0, help='generated users (default: demo data only)')
+    parser.add_argument('--locations-per-user', type=int, default=10)
+    parser.add_argument('--items-per-location', type=int, default=100)
+    parser.add_argument('--user-prefix', default='load-user-', help='generated user ids are <prefix><n>')
+    parser.add_argument('--purchase-window', type=int, default=730, help='purchases within the last N days')
+    parser.add_argument('--shelf-life', type=shelf_life, default=(30, 1095),
+                        help='days from purchase to expiration, MIN:MAX (default 30:1095)')
+    parser.add_argument('--no-expiry', type=float, default=0.1, help='fraction of items without expiration date')
+    parser.add_argument('--csv-files', type=int, default=0, help='also write this many import spreadsheets')
+    parser.add_argument('--csv-rows', type=int, default=1000)
+    parser.add_argument('--csv-dir', default='ImportSamples/generated')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=10000, help='documents per insert_many')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ensure-indexes', action='store_true', help='create the registered indexes afterwards')
+    args = parser.parse_args()
+
+    dates = Dates(args.purchase_window, args.shelf_life, args.no_expiry)
+    if not args.users and not args.csv_files:
+        db = get_db()
+        insert_demo_data(db)
+    else:
+        db = get_db() if args.users else None
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            if args.users:
+                seed_bulk(db, args, dates, pool)
+            if args.csv_files:
+                write_csv_files(args, dates, pool)
+    if db is None:
+        return
+    if args.ensure_indexes:
+        from indexes import ensure_indexes
+        ensure_indexes(db)
+
+    print(f"Users count: {db.users.estimated_document_count()}")
+    print(f"Locations count: {db.locations.estimated_document_count()}")
+    print(f"Storage items count: {db.storage_items.estimated_document_count()}")
+
+
+if __name__ == '__main__':
+    main()
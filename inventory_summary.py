@@ -0,0 +1,144 @@
+"""
+Materialized per-user inventory rollups.
+
+One ``inventory_summary`` document per user holds item counts per location, per box
+and per expiration month, plus quantity totals for items whose quantity is numeric.
+rebuild_summary() computes it from scratch with a single $facet aggregation; the write
+paths keep it current with apply_item_delta(), an $inc of the written items'
+contributions, so the dashboard reads one small document instead of the inventory.
+"""
+
+import math
+from datetime import datetime, timezone
+
+# Map key for items without a location, box or expiration date
+NONE_KEY = 'none'
+
+SUMMARY_FIELDS = {'location_id': 1, 'box': 1, 'expiration_date': 1, 'quantity': 1}
+
+
+def _location_key(value):
+    return str(value) if value else NONE_KEY
+
+
+def _box_key(value):
+    return NONE_KEY if value is None or value == '' else str(value)
+
+
+def _month_key(value):
+    return value.strftime('%Y-%m') if isinstance(value, datetime) else NONE_KEY
+
+
+def numeric_quantity(value):
+    """An item's quantity as a number, or 0 when it isn't numeric."""
+    try:
+        number = float(str(value).strip())
+    except (TypeError, ValueError):
+        return 0
+    return number if math.isfinite(number) else 0
+
+
+def _contributions(item):
+    """The summary fields one item adds to, with its quantity."""
+    quantity = numeric_quantity(item.get('quantity'))
+    location = _location_key(item.get('location_id'))
+    return {
+        'total_items': 1,
+        'total_quantity': quantity,
+        f'by_location.{location}.count': 1,
+        f'by_location.{location}.quantity': quantity,
+        f'by_box.{_box_key(item.get("box"))}': 1,
+        f'by_expiration_month.{_month_key(item.get("expiration_date"))}': 1,
+    }
+
+
+def apply_item_delta(db, user_id, removed=(), added=()):
+    """
+    Update the user's summary for items that were removed and/or added.
+
+    An edit is its old document removed and its new one added. Does nothing if the
+    user has no summary yet; get_summary() builds it from scratch on first read.
+    """
+    inc = {}
+    for items, sign in ((removed, -1), (added, 1)):
+        for item in items:
+            for key, value in _contributions(item).items():
+                inc[key] = inc.get(key, 0) + sign * value
+    inc = {key: value for key, value in inc.items() if value}
+    if not inc:
+        return
+    db.inventory_summary.update_one(
+        {'_id': user_id}, {'$inc': inc, '$set': {'updated_at': datetime.now(timezone.utc)}})
+
+
+SUMMARY_PIPELINE = [
+    {'$project': {
+        'location_id': 1,
+        'box': 1,
+        'month': {'$cond': [{'$eq': [{'$type': '$expiration_date'}, 'date']},
+                            {'$dateToString': {'format': '%Y-%m', 'date': '$expiration_date'}}, None]},
+        'quantity': {'$convert': {'input': {'$trim': {'input': {'$toString': '$quantity'}}},
+                                  'to': 'double', 'onError': 0, 'onNull': 0}},
+    }},
+    {'$facet': {
+        'by_location': [{'$group': {'_id': '$location_id', 'count': {'$sum': 1}, 'quantity': {'$sum': '$quantity'}}}],
+        'by_box': [{'$group': {'_id': '$box', 'count': {'$sum': 1}}}],
+        'by_expiration_month': [{'$group': {'_id': '$month', 'count': {'$sum': 1}}}],
+    }},
+]
+
+
+def rebuild_summary(db, user_id):
+    """Recompute the user's summary with one aggregation and store it. Returns the new document."""
+    pipeline = [{'$match': {'user_id': user_id}}] + SUMMARY_PIPELINE
+    facets = next(db.storage_items.aggregate(pipeline))
+    summary = {
+        'total_items': 0,
+        'total_quantity': 0,
+        'by_location': {},
+        'by_box': {},
+        'by_expiration_month': {},
+        'updated_at': datetime.now(timezone.utc),
+    }
+    for group in facets['by_location']:
+        quantity = group['quantity'] if math.isfinite(group['quantity']) else 0
+        summary['by_location'][_location_key(group['_id'])] = {'count': group['count'], 'quantity': quantity}
+        summary['total_items'] += group['count']
+        summary['total_quantity'] += quantity
+    for group in facets['by_box']:
+        key = _box_key(group['_id'])
+        summary['by_box'][key] = summary['by_box'].get(key, 0) + group['count']
+    for group in facets['by_expiration_month']:
+        summary['by_expiration_month'][group['_id'] or NONE_KEY] = group['count']
+    db.inventory_summary.replace_one({'_id': user_id}, summary, upsert=True)
+    summary['_id'] = user_id
+    return summary
+
+
+def get_summary(db, user_id):
+    """The user's summary document, built on first use."""
+    return db.inventory_summary.find_one({'_id': user_id}) or rebuild_summary(db, user_id)
+
+
+def _box_order(entry):
+    box = entry[0]
+    return (box == NONE_KEY, not box.lstrip('-').isdigit(), int(box) if box.lstrip('-').isdigit() else 0, box)
+
+
+def summary_rows(summary, location_names):
+    """
+    Sorted (label, totals) rows for display; zero counts left by deltas are dropped.
+
+    ``location_names`` maps str(location _id) to name, e.g. LocationCache.names().
+    """
+    by_location = [
+        (location_names.get(loc_id, 'No location' if loc_id == NONE_KEY else 'Deleted location'), totals)
+        for loc_id, totals in summary['by_location'].items() if totals['count'] > 0
+    ]
+    months = summary['by_expiration_month']
+    return {
+        'by_location': sorted(by_location, key=lambda entry: entry[0].lower()),
+        'by_box': sorted(((box, count) for box, count in summary['by_box'].items() if count > 0), key=_box_order),
+        'by_month': sorted((month, count) for month, count in months.items() if count > 0 and month != NONE_KEY),
+        'no_expiration': months.get(NONE_KEY, 0),
+    }
@@ -0,0 +1,91 @@
+"""
+In-process LRU/TTL cache of each user's locations.
+
+Locations are read on nearly every page but change rarely. Every write bumps the
+user's version counter, which invalidates the cached entry. A write made in another
+process is caught by observe(), which the app calls with the user's committed data
+version at the start of every request; the TTL is only a backstop.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocationCache:
+    def __init__(self, max_users=1024, ttl=300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (version, expires_at, locations, names)
+        self._versions = {}  # user_id -> write counter
+        self._observed = {}  # user_id -> last version passed to observe()
+        self._lock = threading.Lock()
+
+    def _entry(self, db, user_id):
+        now = time.monotonic()
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Query outside the lock; the version read above marks the entry stale if a
+        # write lands while we're loading
+        locations = list(db.locations.find({'user_id': user_id}))
+        names = {str(loc['_id']): loc['name'] for loc in locations}
+        entry = (version, now + self.ttl, locations, names)
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return entry
+
+    def locations(self, db, user_id):
+        """Return the user's location documents. Callers must not modify them."""
+        return self._entry(db, user_id)[2]
+
+    def names(self, db, user_id):
+        """Return a {str(location _id): name} map of the user's locations."""
+        return self._entry(db, user_id)[3]
+
+    def find(self, db, user_id, location_id):
+        """Return one of the user's locations by its id (string or ObjectId), or None."""
+        for loc in self.locations(db, user_id):
+            if str(loc['_id']) == str(location_id):
+                return loc
+        return None
+
+    def invalidate(self, user_id):
+        """Record a write to the user's locations."""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def observe(self, user_id, version):
+        """Invalidate the user's entry if their committed version moved since it was last seen.
+
+        This catches writes made by other processes without waiting for the TTL.
+        """
+        with self._lock:
+            seen = self._observed.get(user_id)
+            self._observed[user_id] = version
+        if seen is not None and seen != version:
+            self.invalidate(user_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_users': self.max_users,
+                'ttl': self.ttl,
+            }
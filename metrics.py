@@ -0,0 +1,297 @@
+"""
+Prometheus metrics.
+
+A small in-process registry of counters, gauges and histograms rendered in the
+Prometheus text exposition format by GET /metrics.
+
+gunicorn's workers share one port, so a scrape reaches a random worker. With
+PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py sets it), every worker writes its
+values to <dir>/process_<pid>.json every FLUSH_INTERVAL seconds, and a scrape adds
+up the files of all workers: counters and histograms are summed, a gauge takes the
+most recently set value. When a worker exits, child_exit folds its file into
+dead.json, so totals never go backwards. Without the variable values are per process.
+
+MongoCommandMetrics is a pymongo CommandListener that times every command by name
+and collection; app.py passes it to PyMongo(app) and asgi.py to AsyncMongoClient.
+"""
+
+import json
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+# Seconds between a worker's writes of its values; a scrape sees a worker this far behind at most
+FLUSH_INTERVAL = 5
+DEAD_FILE = 'dead.json'
+
+# Seconds; the Prometheus client libraries' defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, values=None):
+        """The metric's lines, for ``values`` (merged from several processes) or its own."""
+        if values is None:
+            values = self.snapshot()
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(values.items()):
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def merge(self, value, other):
+        """Combine one label set's values from two processes."""
+        return value + other
+
+    def _samples(self, key, value):
+        return [f'{self.name}{_labels(self.labelnames, key)} {_number(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        # With the time it was set, so merging processes can keep the latest
+        with self._lock:
+            self._values[self._key(labels)] = (value, time.time())
+
+    def merge(self, value, other):
+        return max(value, other, key=lambda pair: pair[1])
+
+    def _samples(self, key, value):
+        return super()._samples(key, value[0])
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def merge(self, value, other):
+        return [a + b for a, b in zip(value[0], other[0])], value[1] + other[1]
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = [f'{self.name}_bucket{_labels(self.labelnames, key, [("le", _number(bound))])} {count}'
+                 for bound, count in zip(self.buckets, counts)]
+        lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}')
+        lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}')
+        return lines
+
+
+REGISTRY = []
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by endpoint, method and status.',
+                        ['endpoint', 'method', 'status'])
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'Time to produce a response, by endpoint.',
+                         ['endpoint', 'method'])
+MONGO_LATENCY = Histogram('mongodb_command_duration_seconds', 'MongoDB command round trips, by command and collection.',
+                          ['command', 'collection'])
+MONGO_FAILURES = Counter('mongodb_command_failures_total', 'Failed MongoDB commands, by command and collection.',
+                         ['command', 'collection'])
+IMPORT_JOBS = Counter('import_jobs_total', 'Finished CSV import jobs, by final status.', ['status'])
+IMPORT_ROWS = Counter('import_rows_total', 'CSV rows processed by import jobs.')
+IMPORT_THROUGHPUT = Histogram('import_rows_per_second', 'Rows per second of each finished CSV import job.',
+                              buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000))
+IMPORT_LAST_THROUGHPUT = Gauge('import_last_rows_per_second', 'Rows per second of the most recent CSV import job.')
+
+
+def _snapshot():
+    return {metric.name: [[list(key), value] for key, value in metric.snapshot().items()] for metric in REGISTRY}
+
+
+def _write(path, data):
+    # Written aside and renamed, so a scrape never reads half a file
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _merge_into(merged, data):
+    """Add one process's values ({name: [[key, value], ...]}) to ``merged`` ({name: {key: value}})."""
+    for metric in REGISTRY:
+        values = merged.setdefault(metric.name, {})
+        for key, value in data.get(metric.name, []):
+            key = tuple(key)
+            values[key] = metric.merge(values[key], value) if key in values else value
+    return merged
+
+
+def _process_path(pid):
+    return os.path.join(MULTIPROC_DIR, f'process_{pid}.json')
+
+
+def flush():
+    """Write this process's values to PROMETHEUS_MULTIPROC_DIR (a no-op without it)."""
+    if MULTIPROC_DIR:
+        _write(_process_path(os.getpid()), _snapshot())
+
+
+def init_worker():
+    """
+    Start a forked worker's metrics (gunicorn's post_fork) with PROMETHEUS_MULTIPROC_DIR.
+
+    Drops the values inherited from the master, which would otherwise be counted once
+    per worker, and flushes every FLUSH_INTERVAL seconds from a daemon thread.
+    """
+    if not MULTIPROC_DIR:
+        return
+    for metric in REGISTRY:
+        with metric._lock:
+            metric._values.clear()
+
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                flush()
+            except OSError:
+                pass  # the next flush tries again
+
+    threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+
+def clear_multiproc_dir():
+    """Remove every process's values; the master calls this once at startup."""
+    if not MULTIPROC_DIR:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    for name in os.listdir(MULTIPROC_DIR):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            os.remove(os.path.join(MULTIPROC_DIR, name))
+
+
+def mark_process_dead(pid):
+    """Fold an exited worker's values into dead.json and remove its file (gunicorn's child_exit)."""
+    if not MULTIPROC_DIR:
+        return
+    path = _process_path(pid)
+    if not os.path.exists(path):
+        return
+    dead_path = os.path.join(MULTIPROC_DIR, DEAD_FILE)
+    merged = _merge_into(_merge_into({}, _read(dead_path)), _read(path))
+    _write(dead_path, {name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()})
+    os.remove(path)
+
+
+def render():
+    """All metrics in the Prometheus text format, summed over all workers with PROMETHEUS_MULTIPROC_DIR."""
+    merged = None
+    if MULTIPROC_DIR:
+        flush()
+        merged = {}
+        for name in os.listdir(MULTIPROC_DIR):
+            if name.endswith('.json'):
+                _merge_into(merged, _read(os.path.join(MULTIPROC_DIR, name)))
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(merged[metric.name] if merged is not None else None))
+    return '\n'.join(lines) + '\n'
+
+
+def observe_import(status, rows, seconds):
+    IMPORT_JOBS.inc(status=status)
+    IMPORT_ROWS.inc(rows)
+    if rows and seconds > 0:
+        IMPORT_THROUGHPUT.observe(rows / seconds)
+        IMPORT_LAST_THROUGHPUT.set(rows / seconds)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times each command; the collection is read from the started event's command document."""
+
+    def __init__(self):
+        self._collections = {}  # (connection, request_id) -> collection
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _id(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            # getMore names its collection separately; db-level commands (ping, ...) have none
+            collection = event.command.get('collection', '')
+        with self._lock:
+            self._collections[self._id(event)] = collection
+
+    def _finish(self, event):
+        with self._lock:
+            return self._collections.pop(self._id(event), '')
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+        MONGO_FAILURES.inc(command=event.command_name, collection=collection)
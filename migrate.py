@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Run the data migrations in the migrations package.
+
+    python migrate.py              # apply every pending migration
+    python migrate.py --dry-run    # report what would change, write nothing
+    python migrate.py --list       # show each migration and its status
+    python migrate.py --only 1     # run a single migration by number
+
+An interrupted run resumes from its last checkpoint when started again.
+"""
+
+import argparse
+import os
+
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from migrations import MIGRATIONS, migration_status, run_pending
+
+load_dotenv()
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/home_storage')
+
+
+def get_db(client):
+    # Get database name from URI or use default
+    if '/' in MONGO_URI.split('://')[-1]:
+        db_name = MONGO_URI.split('/')[-1].split('?')[0]
+    else:
+        db_name = 'home_storage'
+    return client[db_name or 'home_storage']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='report counts without writing')
+    parser.add_argument('--list', action='store_true', help='list migrations and their status')
+    parser.add_argument('--only', type=int, help='run only the migration with this number')
+    parser.add_argument('--batch-size', type=int, default=1000, help='documents per batch (default: 1000)')
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = get_db(client)
+
+    if args.list:
+        status = migration_status(db)
+        for migration in MIGRATIONS:
+            record = status.get(migration.id, {})
+            print(f'{migration.id:04d}  {migration.name:<30} {record.get("status", "pending")}')
+        return
+
+    results = run_pending(db, batch_size=args.batch_size, dry_run=args.dry_run, only=args.only)
+    if not results:
+        print('No pending migrations.')
+    for migration_id, counts in results.items():
+        summary = ', '.join(f'{key}: {value}' for key, value in sorted(counts.items())) or 'nothing to do'
+        print(f'{migration_id:04d}: {summary}')
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Resumable, batched data migrations.
+
+Each migration is a numbered module in this package with a Migration subclass,
+registered in MIGRATIONS. Applied migrations are recorded in the ``migrations``
+collection. While a migration runs, the last processed _id is checkpointed after
+every batch, so an interrupted run resumes where it stopped.
+
+A migration either rewrites documents in Python (``transform``), sent back as one
+unordered bulk_write per batch, or sets ``pipeline`` to a server-side update
+pipeline that is applied with one update_many per batch. Either way the write
+repeats the migration's filter (and transform() updates also the values they were
+computed from), so documents the app changed since the batch was read are skipped.
+
+Like the app's own writes, each batch is written per user under a change stamp
+(changes.stamped), so delta-sync clients receive the migrated documents and the
+user's list ETags and cached responses move on.
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from changes import stamped
+
+
+class Migration:
+    id = None  # Unique, increasing number; migrations run in id order
+    name = ''
+    collection = ''
+    filter = {}  # Selects the documents that still need migrating
+    projection = None  # Fields transform() needs (None for all)
+    pipeline = None  # Server-side update pipeline, used instead of transform()
+    stamp = True  # Stamp migrated documents with change_seq/updated_at, as app writes are
+
+    def transform(self, doc, counts):
+        """Return the update for ``doc``, or None to leave it alone. ``counts`` is a Counter for the report."""
+        raise NotImplementedError
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def migration_status(db):
+    """Return {migration id: record from the migrations collection}."""
+    return {record['_id']: record for record in db.migrations.find()}
+
+
+def pending_migrations(db, migrations=None):
+    applied = {id_ for id_, record in migration_status(db).items() if record.get('status') == 'applied'}
+    return [m for m in (migrations or MIGRATIONS) if m.id not in applied]
+
+
+def _batches(collection, query, projection, batch_size, after):
+    """Yield batches of matching documents in _id order, starting after ``after``."""
+    while True:
+        batch_query = dict(query)
+        if after is not None:
+            batch_query['_id'] = {'$gt': after}
+        batch = list(collection.find(batch_query, projection).sort('_id', 1).limit(batch_size))
+        if not batch:
+            return
+        yield batch
+        after = batch[-1]['_id']
+
+
+def _still_matching(migration, id_condition, doc=None):
+    """
+    Write filter for documents read in a batch.
+
+    Repeats the migration's filter, so a document the app wrote between the read
+    and the write (e.g. a box just saved, or a fresh change_seq) is left alone. With
+    ``doc``, the projected fields must also still hold the values transform() saw.
+    """
+    condition = {'_id': id_condition}
+    if doc is not None and migration.projection:
+        condition.update({field: doc.get(field) for field in migration.projection if field != '_id'})
+    return {'$and': [migration.filter, condition]}
+
+
+def _by_user(batch):
+    """Split a batch into {user_id: docs}, keeping _id order within each user."""
+    users = {}
+    for doc in batch:
+        users.setdefault(doc.get('user_id'), []).append(doc)
+    return users
+
+
+def _write(collection, migration, docs, stamp, counts, dry_run):
+    """Apply the migration to one user's documents of a batch, $set-ting ``stamp`` with the change."""
+    if migration.pipeline is not None:
+        if not dry_run:
+            ids = [doc['_id'] for doc in docs]
+            pipeline = migration.pipeline + [{'$set': stamp}] if stamp else migration.pipeline
+            result = collection.update_many(_still_matching(migration, {'$in': ids}), pipeline)
+            counts['modified'] += result.modified_count
+        return
+    requests = []
+    for doc in docs:
+        update = migration.transform(doc, counts)
+        if update is not None:
+            if stamp:
+                update = {**update, '$set': {**update.get('$set', {}), **stamp}}
+            requests.append(UpdateOne(_still_matching(migration, doc['_id'], doc), update))
+    counts['updates'] += len(requests)
+    if requests and not dry_run:
+        result = collection.bulk_write(requests, ordered=False)
+        counts['modified'] += result.modified_count
+        # Written by the app since they were read; a later run picks them up if still needed
+        if result.matched_count < len(requests):
+            counts['changed_meanwhile'] += len(requests) - result.matched_count
+
+
+def run_migration(db, migration, batch_size=1000, dry_run=False, log=print):
+    """
+    Apply one migration, resuming from its checkpoint if a previous run was interrupted.
+
+    With ``dry_run`` nothing is written; the returned Counter reports what would change.
+    """
+    collection = db[migration.collection]
+    record = db.migrations.find_one({'_id': migration.id}) or {}
+    checkpoint = None if dry_run else record.get('checkpoint')
+    counts = Counter()
+
+    if checkpoint is not None:
+        log(f'  Resuming after _id {checkpoint}')
+    if not dry_run:
+        db.migrations.update_one(
+            {'_id': migration.id},
+            {'$set': {'name': migration.name, 'status': 'running', 'started_at': record.get('started_at') or _now()}},
+            upsert=True)
+
+    projection = {'_id': 1} if migration.pipeline is not None else migration.projection
+    if projection is not None:
+        projection = {**projection, 'user_id': 1}
+    for batch in _batches(collection, migration.filter, projection, batch_size, checkpoint):
+        counts['matched'] += len(batch)
+        for user_id, docs in _by_user(batch).items():
+            if dry_run or not migration.stamp or user_id is None:
+                _write(collection, migration, docs, None, counts, dry_run)
+                continue
+            with stamped(db, user_id) as stamp:
+                _write(collection, migration, docs, stamp, counts, dry_run)
+
+        if not dry_run:
+            db.migrations.update_one({'_id': migration.id},
+                                     {'$set': {'checkpoint': batch[-1]['_id'], 'counts': dict(counts)}})
+        log(f'  {counts["matched"]} documents processed')
+
+    if not dry_run:
+        db.migrations.update_one(
+            {'_id': migration.id},
+            {'$set': {'status': 'applied', 'applied_at': _now(), 'counts': dict(counts)},
+             '$unset': {'checkpoint': ''}})
+    return counts
+
+
+def run_pending(db, batch_size=1000, dry_run=False, only=None, log=print):
+    """Run every pending migration (or just the one with id ``only``) in order."""
+    results = {}
+    for migration in pending_migrations(db):
+        if only is not None and migration.id != only:
+            continue
+        log(f'{"[dry run] " if dry_run else ""}{migration.id:04d} {migration.name}')
+        results[migration.id] = run_migration(db, migration, batch_size, dry_run, log)
+    return results
+
+
+from migrations.m0001_box_to_int import BoxToInt  # noqa: E402
+from migrations.m0002_dates_to_bson import DatesToBson  # noqa: E402
+from migrations.m0003_change_seq import LocationsChangeSeq, ItemsChangeSeq  # noqa: E402
+
+MIGRATIONS = sorted([
+    BoxToInt(),
+    DatesToBson(),
+    LocationsChangeSeq(),
+    ItemsChangeSeq(),
+], key=lambda m: m.id)
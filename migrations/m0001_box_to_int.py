@@ -0,0 +1,32 @@
+"""Convert storage_items.box from string (or other non-integer types) to an integer."""
+
+from migrations import Migration
+
+
+class BoxToInt(Migration):
+    id = 1
+    name = 'box_to_int'
+    collection = 'storage_items'
+    # Ints and nulls are already in the target shape; missing fields are left alone
+    filter = {'$or': [{'box': {'$type': bson_type}} for bson_type in ('string', 'double', 'decimal', 'bool')]}
+    projection = {'box': 1}
+
+    def transform(self, doc, counts):
+        box_value = doc.get('box')
+        new_box_value = None
+        if isinstance(box_value, str):
+            box_str = box_value.strip()
+            if box_str:
+                try:
+                    # Handle potential float strings (e.g., "1.0" or "1,234")
+                    new_box_value = int(float(box_str.replace(',', '')))
+                except (ValueError, TypeError):
+                    counts['errors'] += 1
+        else:
+            try:
+                new_box_value = int(box_value)
+            except (ValueError, TypeError, OverflowError):
+                counts['errors'] += 1
+
+        counts['converted' if new_box_value is not None else 'nullified'] += 1
+        return {'$set': {'box': new_box_value}}
@@ -0,0 +1,43 @@
+"""Convert the storage_items date fields from free-form strings to BSON dates."""
+
+from csv_import import parse_date_value
+from migrations import Migration
+
+DATE_FIELDS = ('date_purchased', 'manufactured_date', 'expiration_date')
+
+
+def parse_date_string(value):
+    """
+    Parse a stored date string into a datetime at midnight, or None if it isn't a date.
+
+    The CSV import's parser, so a string converts here exactly as it would on import;
+    strings without a four-digit year ("5", "March") stay unparseable.
+    """
+    return parse_date_value(value.strip())
+
+
+class DatesToBson(Migration):
+    id = 2
+    name = 'dates_to_bson'
+    collection = 'storage_items'
+    filter = {'$or': [{field: {'$type': 'string'}} for field in DATE_FIELDS]}
+    projection = {field: 1 for field in DATE_FIELDS}
+
+    def transform(self, doc, counts):
+        changes = {}
+        for field in DATE_FIELDS:
+            value = doc.get(field)
+            if not isinstance(value, str):
+                continue
+            if not value.strip():
+                changes[field] = None
+                counts['emptied'] += 1
+                continue
+            parsed = parse_date_string(value)
+            if parsed is None:
+                # Leave it for a person to fix rather than throw the text away
+                counts['unparseable'] += 1
+                continue
+            changes[field] = parsed
+            counts['converted'] += 1
+        return {'$set': changes} if changes else None
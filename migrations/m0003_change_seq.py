@@ -0,0 +1,24 @@
+"""Give documents written before change tracking a change_seq, so the first delta sync includes them."""
+
+from migrations import Migration
+
+
+class BackfillChangeSeq(Migration):
+    collection = None
+    filter = {'change_seq': {'$exists': False}}
+    # change_seq 0 sorts before every tracked change; $$NOW is the server's clock
+    pipeline = [{'$set': {'change_seq': 0, 'updated_at': '$$NOW'}}]
+    # A fresh stamp would replace the 0; the documents' content doesn't change anyway
+    stamp = False
+
+
+class LocationsChangeSeq(BackfillChangeSeq):
+    id = 3
+    name = 'locations_change_seq'
+    collection = 'locations'
+
+
+class ItemsChangeSeq(BackfillChangeSeq):
+    id = 4
+    name = 'storage_items_change_seq'
+    collection = 'storage_items'
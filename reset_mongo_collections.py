@@ -1,12 +1,13 @@
 """
 Script to reset MongoDB collections for the Flask storage app.
 - Drops: users, locations, storage_items
-- Creates indexes for user_id fields for efficient per-user queries
+- Creates the indexes from the index registry (indexes.py)
 """
 
 from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
+from indexes import ensure_indexes
 
 load_dotenv()
 
@@ -29,8 +30,6 @@ db.create_collection('users')
 db.create_collection('locations')
 db.create_collection('storage_items')
 
-db.locations.create_index('user_id')
-db.storage_items.create_index('user_id')
-db.storage_items.create_index('location_id')
+ensure_indexes(db)
 
 print('Dropped and recreated users, locations, and storage_items collections with indexes.')
@@ -0,0 +1,53 @@
+"""
+In-process LRU cache of rendered list responses.
+
+Entries are keyed on the user's committed version (see changes.py) along with the
+request path, so any finished write makes the old entries unreachable and they age out
+of the LRU. That holds across processes too, because the version lives in MongoDB.
+"""
+
+import threading
+from collections import OrderedDict
+
+# Larger bodies are rendered every time rather than held in memory
+MAX_BODY_SIZE = 1 << 20
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (body, status, mimetype)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached (body, status, mimetype) for ``key``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, status, mimetype):
+        if self.max_entries <= 0 or len(body) > MAX_BODY_SIZE:
+            return
+        with self._lock:
+            self._entries[key] = (body, status, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+            }
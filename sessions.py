@@ -0,0 +1,255 @@
+"""
+Server-side sessions (SESSION_BACKEND=mongo or memory).
+
+Flask's default session is the whole session dict, signed, in a cookie that is
+re-signed and re-sent whenever the session is touched. Here the cookie only holds an
+opaque ``<session id>.<version>`` and the data lives in a store: the ``sessions``
+collection (expired documents are removed by a TTL index on ``expires_at``), or a
+dict in process memory for tests and single-process development.
+
+A session is written back, and a new cookie sent, only when its serialized data
+actually changed, or when it is past half its lifetime and its expiry gets pushed
+back. Each process keeps recently used sessions in an LRU cache. An entry is only
+used while its version matches the one in the request's cookie, so a session changed
+by another worker is read again from the store. The TTL bounds how long a
+deleted session can still be read from another worker's cache.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class MemorySessionStore:
+    """Sessions in a dict; each process has its own, so only for tests and single-process servers."""
+
+    def __init__(self):
+        self._sessions = {}  # sid -> (data, version, expires_at)
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        """Return (data, version, expires_at), or None if there is no live session ``sid``."""
+        with self._lock:
+            record = self._sessions.get(sid)
+            if record and record[2] <= _now():
+                del self._sessions[sid]
+                record = None
+            return record
+
+    def save(self, sid, data, version, expires_at):
+        with self._lock:
+            self._sessions[sid] = (data, version, expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class MongoSessionStore:
+    """
+    Sessions in a MongoDB collection.
+
+    Documents are keyed on a hash of the session id, so the collection's contents
+    can't be replayed as cookies.
+    """
+
+    collection = 'sessions'
+
+    def __init__(self, get_db):
+        # get_db is called at use time so a worker always uses its own client
+        self.get_db = get_db
+
+    @staticmethod
+    def filter(sid):
+        return {'_id': hashlib.sha256(sid.encode()).hexdigest()}
+
+    @staticmethod
+    def record(doc):
+        """(data, version, expires_at) from a session document, or None if missing or expired."""
+        if doc is None:
+            return None
+        expires_at = doc['expires_at']
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        # The TTL monitor only runs once a minute
+        if expires_at <= _now():
+            return None
+        return doc['data'], doc['version'], expires_at
+
+    def load(self, sid):
+        return self.record(self.get_db()[self.collection].find_one(self.filter(sid)))
+
+    def save(self, sid, data, version, expires_at):
+        self.get_db()[self.collection].replace_one(
+            self.filter(sid), {'data': data, 'version': version, 'expires_at': expires_at}, upsert=True)
+
+    def delete(self, sid):
+        self.get_db()[self.collection].delete_one(self.filter(sid))
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, version=0, raw=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.version = version
+        self.raw = raw  # Serialized data as loaded, to tell whether it changed
+        self.expires_at = expires_at
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+def rotate_session_id(session):
+    """Move the session to a new id (call on login, against session fixation). No-op for cookie sessions."""
+    if isinstance(session, ServerSideSession) and session.sid is not None:
+        session.previous_sid = session.sid
+        session.sid = None
+        session.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, cache_size=1024, cache_ttl=60):
+        self.store = store
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()  # sid -> (version, data, expires_at, cached until)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_cookie(value):
+        """(sid, version) from a cookie value, or None if it isn't one of ours."""
+        sid, _, version = (value or '').rpartition('.')
+        if not sid or not version.isdigit():
+            return None
+        return sid, int(version)
+
+    def cached(self, sid, version):
+        """(data, version, expires_at) of a cached session at ``version``, or None."""
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is None or entry[0] != version or entry[3] <= time.monotonic():
+                return None
+            self._cache.move_to_end(sid)
+            return entry[1], entry[0], entry[2]
+
+    def remember(self, sid, record):
+        if self.cache_size <= 0:
+            return
+        data, version, expires_at = record
+        with self._lock:
+            self._cache[sid] = (version, data, expires_at, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def decode(self, data):
+        return self.serializer.loads(data)
+
+    def open_session(self, app, request):
+        key = self.parse_cookie(request.cookies.get(self.get_cookie_name(app)))
+        if key is None:
+            return ServerSideSession()
+        sid, version = key
+        record = self.cached(sid, version)
+        if record is None:
+            record = self.store.load(sid)
+            if record is None:
+                return ServerSideSession()
+            self.remember(sid, record)
+        data, version, expires_at = record
+        return ServerSideSession(self.decode(data), sid=sid, version=version, raw=data, expires_at=expires_at)
+
+    def _set_cookie(self, app, response, session, value):
+        response.set_cookie(
+            self.get_cookie_name(app), value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            partitioned=self.get_cookie_partitioned(app),
+        )
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        previous_sid = getattr(session, 'previous_sid', None)
+        if previous_sid is not None:
+            self.store.delete(previous_sid)
+            self._forget(previous_sid)
+
+        if not session:
+            # Emptied (logout): drop the stored session and the cookie
+            if session.sid is not None or previous_sid is not None:
+                if session.sid is not None:
+                    self.store.delete(session.sid)
+                    self._forget(session.sid)
+                response.delete_cookie(self.get_cookie_name(app), domain=self.get_cookie_domain(app),
+                                       path=self.get_cookie_path(app), secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       partitioned=self.get_cookie_partitioned(app))
+            return
+
+        lifetime = app.permanent_session_lifetime
+        data = session.raw
+        if session.modified:
+            data = self.serializer.dumps(dict(session))
+        refresh = session.expires_at is not None and session.expires_at - _now() < lifetime / 2
+        if session.sid is not None and data == session.raw and not refresh:
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        session.version += 1
+        record = (data, session.version, _now() + lifetime)
+        self.store.save(session.sid, *record)
+        self.remember(session.sid, record)
+        self._set_cookie(app, response, session, f'{session.sid}.{session.version}')
+
+
+def init_sessions(app, get_db):
+    """Install the server-side session interface selected by SESSION_BACKEND ('cookie' keeps Flask's)."""
+    backend = app.config.get('SESSION_BACKEND', 'cookie')
+    if backend == 'cookie':
+        return
+    if backend == 'mongo':
+        store = MongoSessionStore(get_db)
+    elif backend == 'memory':
+        store = MemorySessionStore()
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND: {backend}')
+    app.session_interface = ServerSideSessionInterface(
+        store, app.config.get('SESSION_CACHE_SIZE', 1024), app.config.get('SESSION_CACHE_TTL', 60))
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ENSURE_INDEXES', 'false')
+os.environ.setdefault('USE_AUTH', 'true')
+
+
+@pytest.fixture
+def app_db():
+    """The Flask app with an in-memory mongomock database; yields (app, db)."""
+    mongomock = pytest.importorskip('mongomock')
+    from app import app, mongo
+
+    client = mongomock.MongoClient()
+    saved = mongo.cx, mongo.db
+    mongo.cx, mongo.db = client, client['home_storage']
+    app.config['TESTING'] = True
+    try:
+        yield app, mongo.db
+    finally:
+        mongo.cx, mongo.db = saved
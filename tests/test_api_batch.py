@@ -0,0 +1,55 @@
+import pytest
+from bson.objectid import ObjectId
+
+
+@pytest.fixture
+def client(app_db):
+    app, db = app_db
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'sub': 'user-1', 'email': 'ann@example.com', 'name': 'Ann'}
+    return client
+
+
+@pytest.fixture
+def item(app_db):
+    """One item in box 0, with the summary that counts it."""
+    app, db = app_db
+    item_id = ObjectId()
+    db.storage_items.insert_one({'_id': item_id, 'user_id': 'user-1', 'name': 'Soup', 'location_id': 'loc', 'box': 0})
+    db.inventory_summary.insert_one({
+        '_id': 'user-1', 'total_items': 1, 'total_quantity': 0,
+        'by_location': {'loc': {'count': 1, 'quantity': 0}}, 'by_box': {'0': 1},
+        'by_expiration_month': {'none': 1},
+    })
+    return item_id
+
+
+@pytest.mark.parametrize('operations', [
+    [{'op': 'update', 'data': {'box': 1}}, {'op': 'update', 'data': {'box': 2}}],
+    [{'op': 'delete'}, {'op': 'delete'}],
+])
+def test_batch_repeating_an_id_is_rejected(app_db, client, item, operations):
+    app, db = app_db
+    operations = [{**operation, 'collection': 'items', 'id': str(item)} for operation in operations]
+
+    response = client.post('/api/batch', json={'operations': operations})
+
+    assert response.status_code == 400
+    assert db.storage_items.find_one({'_id': item})['box'] == 0
+    assert db.tombstones.count_documents({}) == 0
+    summary = db.inventory_summary.find_one({'_id': 'user-1'})
+    assert summary['total_items'] == 1 and summary['by_box'] == {'0': 1}
+
+
+def test_batch_delete_counts_once(app_db, client, item):
+    app, db = app_db
+    operations = [{'op': 'delete', 'collection': 'items', 'id': str(item)},
+                  {'op': 'delete', 'collection': 'items', 'id': str(ObjectId())}]
+
+    results = client.post('/api/batch', json={'operations': operations}).get_json()['results']
+
+    assert [result['status'] for result in results] == ['deleted', 'not_found']
+    assert db.tombstones.count_documents({}) == 1
+    summary = db.inventory_summary.find_one({'_id': 'user-1'})
+    assert summary['total_items'] == 0 and summary['by_box']['0'] == 0
@@ -0,0 +1,24 @@
+import io
+
+import pytest
+
+from csv_import import BOX_MAX, import_items_csv
+
+
+@pytest.mark.parametrize('engine', ['csv', 'pandas'])
+def test_box_out_of_int64_range_is_a_row_error(app_db, engine):
+    if engine == 'pandas':
+        pytest.importorskip('pandas')
+    app, db = app_db
+    csv_file = io.BytesIO(b'ItemName,ItemLocation,Box\n'
+                          b'Soup,Pantry,3\n'
+                          b'Beans,Pantry,99999999999999999999\n'
+                          b'Rice,Pantry,1e30\n'
+                          b'Flour,Pantry,-1e19\n'
+                          b'Salt,Pantry,12\n')
+
+    stats = import_items_csv(db, 'user-1', csv_file, engine=engine)
+
+    assert stats['items_imported'] == 2
+    assert stats['errors'] == [f'Row {row}: Box must be between {-BOX_MAX - 1} and {BOX_MAX}' for row in (3, 4, 5)]
+    assert sorted(item['box'] for item in db.storage_items.find()) == [3, 12]
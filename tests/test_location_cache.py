@@ -0,0 +1,39 @@
+import importlib.util
+import os
+
+import pytest
+
+
+@pytest.fixture
+def second_worker(app_db):
+    """A second, separately imported copy of the app (its own location_cache) on the same database."""
+    app, db = app_db
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+    spec = importlib.util.spec_from_file_location('app_second_worker', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.mongo.cx, module.mongo.db = db.client, db
+    module.app.config['TESTING'] = True
+    return module.app
+
+
+def logged_in(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'sub': 'user-1', 'email': 'ann@example.com', 'name': 'Ann'}
+    return client
+
+
+def test_location_created_on_another_worker_is_seen(app_db, second_worker):
+    app, db = app_db
+    first, second = logged_in(app), logged_in(second_worker)
+    first.post('/locations/add', data={'name': 'Pantry', 'description': ''})
+    assert b'Pantry' in first.get('/items/add').data  # cached by the first worker
+
+    second.post('/locations/add', data={'name': 'Garage', 'description': ''})
+    garage = db.locations.find_one({'name': 'Garage'})
+
+    assert b'Garage' in first.get('/items/add').data
+    response = first.post(f'/locations/{garage["_id"]}/delete', data={'items': 'delete'}, follow_redirects=True)
+    assert b'Location deleted' in response.data
+    assert db.locations.count_documents({'name': 'Garage'}) == 0
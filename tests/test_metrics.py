@@ -0,0 +1,45 @@
+import multiprocessing
+
+import pytest
+
+import metrics
+
+
+def worker(requests, throughput):
+    metrics.init_worker()
+    for _ in range(requests):
+        metrics.HTTP_REQUESTS.inc(endpoint='metrics-test', method='GET', status=200)
+    metrics.IMPORT_LAST_THROUGHPUT.set(throughput)
+    metrics.flush()
+
+
+def sample(text, prefix):
+    return [line.split()[-1] for line in text.splitlines() if line.startswith(prefix)]
+
+
+@pytest.fixture
+def multiproc_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'MULTIPROC_DIR', str(tmp_path))
+    metrics.clear_multiproc_dir()
+    return tmp_path
+
+
+def test_scrape_sums_all_workers_and_keeps_exited_ones(multiproc_dir):
+    context = multiprocessing.get_context('fork')
+    pids = []
+    for requests, throughput in ((3, 100.0), (4, 250.0)):
+        process = context.Process(target=worker, args=(requests, throughput))
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+        pids.append(process.pid)
+
+    requests = 'http_requests_total{endpoint="metrics-test",method="GET",status="200"}'
+    text = metrics.render()
+    assert sample(text, requests) == ['7']
+    # The gauge is the most recently set value, not a sum
+    assert sample(text, 'import_last_rows_per_second ') == ['250.0']
+
+    metrics.mark_process_dead(pids[0])
+    assert not (multiproc_dir / f'process_{pids[0]}.json').exists()
+    assert sample(metrics.render(), requests) == ['7']
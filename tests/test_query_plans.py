@@ -0,0 +1,34 @@
+"""Every query shape in indexes.QUERY_SHAPES must use an index. Needs a mongod (MONGO_TEST_URI)."""
+
+import os
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from indexes import ensure_indexes, check_query_plans
+
+MONGO_TEST_URI = os.environ.get('MONGO_TEST_URI', 'mongodb://localhost:27017')
+TEST_DB = 'storage_test_query_plans'
+
+
+@pytest.fixture
+def db():
+    client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        client.close()
+        pytest.skip(f'no mongod at {MONGO_TEST_URI}')
+    client.drop_database(TEST_DB)
+    try:
+        yield client[TEST_DB]
+    finally:
+        client.drop_database(TEST_DB)
+        client.close()
+
+
+def test_no_query_shape_uses_a_collection_scan(db):
+    ensure_indexes(db)
+    collscans = [f'{name}: {" > ".join(stages)}' for name, stages, ok in check_query_plans(db) if not ok]
+    assert not collscans, collscans
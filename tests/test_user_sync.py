@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.fixture
+def user_writes(monkeypatch):
+    """Count update_one calls on the users collection."""
+    import mongomock
+
+    calls = []
+    original = mongomock.collection.Collection.update_one
+
+    def update_one(self, *args, **kwargs):
+        if self.name == 'users':
+            calls.append(args)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'update_one', update_one)
+    return calls
+
+
+def test_burst_of_page_views_writes_the_user_once(app_db, user_writes):
+    app, db = app_db
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = {'sub': 'user-1', 'email': 'ann@example.com', 'name': 'Ann'}
+
+    for path in ['/', '/locations', '/items', '/items/data', '/items/expiring'] * 10:
+        assert client.get(path).status_code == 200
+    assert len(user_writes) == 1
+    assert db.users.find_one({'_id': 'user-1'})['name'] == 'Ann'
+
+    # A changed profile is written once more
+    with client.session_transaction() as session:
+        session['user'] = {'sub': 'user-1', 'email': 'ann@example.com', 'name': 'Ann B.'}
+    for _ in range(10):
+        client.get('/locations')
+    assert len(user_writes) == 2
+    assert db.users.find_one({'_id': 'user-1'})['name'] == 'Ann B.'